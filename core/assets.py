@@ -0,0 +1,357 @@
+import codecs
+import json
+import os
+import re
+import threading
+import zipfile
+from abc import abstractmethod
+from dataclasses import dataclass
+from typing import IO, Dict, List, Optional, Sequence
+
+from core.operation.baseoperation import (
+    DATA_SET_DIR,
+    DATA_SET_REFRESH_PROPS_SUFFIX,
+    DATA_SET_REFRESH_SCHEDULES_SUFFIX,
+    TEMPLATE_DIR,
+)
+from core.serialization import (
+    JSON_SUFFIXES,
+    dumps,
+    find_json_file,
+    load_json,
+    load_json_file,
+    loads,
+    open_decompressed,
+)
+from core.util import open_atomically
+
+# the bundle member listing the templates and data sets it holds
+BUNDLE_INDEX = "index.json"
+BUNDLE_FORMAT_VERSION = 1
+
+SCAN_CHUNK_SIZE = 64 * 1024
+
+
+# the characters that open or close a container, separate a key from its value, or
+# open a string: everything else (commas, whitespace, scalars) is skipped
+_STRUCTURE = re.compile(r'[{}\[\]:"]')
+# the rest of a string, from after its opening quote
+_STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+def scan_json_value(
+    stream: IO[bytes], path: Sequence[str], chunk_size: int = SCAN_CHUNK_SIZE
+):
+    """
+    Reads the value at path (the keys of the objects that hold it, from the top level
+    down) from a JSON document without parsing the rest of it. The document is read in
+    chunks until the value is complete, so only the part of it up to the end of the value
+    is read and held in memory. The value must be an object or an array: a scalar could
+    be cut short by the end of a chunk.
+    :raises KeyError: if the document has no value at path
+    :raises ValueError: if the value is not an object or an array
+    """
+    path = list(path)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    eof = False
+
+    def read() -> str:
+        nonlocal eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        return decoder.decode(chunk, final=eof)
+
+    # the key of each object enclosing the current position (None for arrays)
+    keys: List[Optional[str]] = []
+    key = ""
+    buffer = read()
+    position = 0
+    while True:
+        match = _STRUCTURE.search(buffer, position)
+        if match is None:
+            if eof:
+                raise KeyError(".".join(path))
+            buffer, position = read(), 0
+            continue
+
+        token = match.group()
+        if token == '"':
+            string = _STRING_END.match(buffer, match.end())
+            if string is None:
+                if eof:
+                    raise KeyError(".".join(path))
+                # the string is split across chunks
+                buffer, position = buffer[match.start() :] + read(), 0
+                continue
+            key = buffer[match.end() : string.end() - 1]
+            position = string.end()
+        elif token == ":":
+            keys[-1] = loads('"' + key + '"') if "\\" in key else key
+            position = match.end()
+            if keys == path:
+                break
+        elif token in "{[":
+            keys.append(None)
+            position = match.end()
+        else:
+            keys.pop()
+            if not keys:
+                raise KeyError(".".join(path))
+            position = match.end()
+
+    buffer = buffer[position:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            if buffer[0] not in "{[":
+                raise ValueError(
+                    f"The value of {'.'.join(path)} is not an object or an array"
+                )
+            try:
+                return json_decoder.raw_decode(buffer)[0]
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            raise KeyError(".".join(path))
+        # the value is incomplete: read larger chunks, so that it is parsed a bounded
+        # number of times however large it is.
+        chunk_size *= 2
+        buffer += read()
+
+
+@dataclass
+class DataSetFiles:
+    """
+    The contents of a data set file and of its refresh sidecar files (if any).
+    """
+
+    definition: dict
+    refresh_properties: Optional[dict]
+    refresh_schedules: Optional[dict]
+
+
+class AssetReader:
+    """
+    Reads exported templates and data sets, wherever they are stored and in whichever
+    format (see core.serialization) they were written.
+    """
+
+    @abstractmethod
+    def open_template(self, template_name: str) -> IO[bytes]:
+        pass
+
+    @abstractmethod
+    def read_data_set(self, placeholder: str) -> DataSetFiles:
+        pass
+
+    def read_template(self, template_name: str) -> dict:
+        with self.open_template(template_name) as file:
+            return load_json(file)
+
+    def read_data_set_configurations(self, template_name: str) -> List[dict]:
+        """
+        Reads the template's DataSetConfigurations (its placeholders and their schemas)
+        without parsing the sheets and visuals that make up the bulk of the template.
+        """
+        with self.open_template(template_name) as file:
+            return scan_json_value(
+                open_decompressed(file), ["Definition", "DataSetConfigurations"]
+            )
+
+    def close(self) -> None:
+        pass
+
+
+class DirectoryAssetReader(AssetReader):
+    """
+    Reads the assets from an export directory tree.
+    """
+
+    def __init__(self, input_dir: str):
+        self._input_dir = input_dir
+
+    def open_template(self, template_name: str) -> IO[bytes]:
+        return open(self._find_file(TEMPLATE_DIR, template_name), "rb")
+
+    def read_data_set(self, placeholder: str) -> DataSetFiles:
+        definition = load_json_file(self._find_file(DATA_SET_DIR, placeholder))
+
+        # the sidecar files are named after the logical data set name
+        name = definition["Name"]
+        return DataSetFiles(
+            definition=definition,
+            refresh_properties=self._read_optional_json(
+                name + DATA_SET_REFRESH_PROPS_SUFFIX
+            ),
+            refresh_schedules=self._read_optional_json(
+                name + DATA_SET_REFRESH_SCHEDULES_SUFFIX
+            ),
+        )
+
+    def _find_file(self, directory: str, name: str) -> str:
+        """
+        :return: The path of the named json file, whichever format it was written in
+        """
+        path = os.path.join(self._input_dir, directory, name)
+        found = find_json_file(path)
+        if found is None:
+            raise FileNotFoundError(f"No {path}.json file (or {path}.json.gz)")
+        return found
+
+    def _read_optional_json(self, name: str) -> Optional[dict]:
+        path = find_json_file(os.path.join(self._input_dir, DATA_SET_DIR, name))
+        if path is None:
+            return None
+        return load_json_file(path)
+
+
+class BundleAssetReader(AssetReader):
+    """
+    Reads the assets from a bundle written by write_bundle. The index is read once, when
+    the bundle is opened, and each member is only decompressed when it is read.
+    """
+
+    def __init__(self, bundle_file: str):
+        self._bundle_file = bundle_file
+        self._zip_file: Optional[zipfile.ZipFile] = None
+        self._index: dict = {}
+        self._lock = threading.Lock()
+
+    def open_template(self, template_name: str) -> IO[bytes]:
+        index = self._get_index()
+        if template_name not in index["templates"]:
+            raise FileNotFoundError(
+                f"No template {template_name} in bundle {self._bundle_file}"
+            )
+        assert self._zip_file is not None
+        return self._zip_file.open(index["templates"][template_name])
+
+    def read_data_set(self, placeholder: str) -> DataSetFiles:
+        index = self._get_index()
+        if placeholder not in index["data_sets"]:
+            raise FileNotFoundError(
+                f"No data set {placeholder} in bundle {self._bundle_file}"
+            )
+        members = index["data_sets"][placeholder]
+        return DataSetFiles(
+            definition=self._read_member(members["definition"]),
+            refresh_properties=self._read_optional_member(
+                members["refresh_properties"]
+            ),
+            refresh_schedules=self._read_optional_member(members["refresh_schedules"]),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._zip_file is not None:
+                self._zip_file.close()
+                self._zip_file = None
+
+    def _get_index(self) -> dict:
+        with self._lock:
+            if self._zip_file is None:
+                zip_file = zipfile.ZipFile(self._bundle_file)
+                index = loads(zip_file.read(BUNDLE_INDEX))
+                if index.get("version") != BUNDLE_FORMAT_VERSION:
+                    zip_file.close()
+                    raise ValueError(
+                        f"Unsupported bundle version {index.get('version')} in "
+                        f"{self._bundle_file}"
+                    )
+                self._zip_file, self._index = zip_file, index
+        return self._index
+
+    def _read_member(self, member: str) -> dict:
+        assert self._zip_file is not None
+        with self._zip_file.open(member) as file:
+            return load_json(file)
+
+    def _read_optional_member(self, member: Optional[str]) -> Optional[dict]:
+        return self._read_member(member) if member is not None else None
+
+
+def open_assets(path: str) -> AssetReader:
+    """
+    :param path: An export directory, or a bundle written by write_bundle
+    """
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        return BundleAssetReader(path)
+    return DirectoryAssetReader(path)
+
+
+def write_bundle(input_dir: str, bundle_file: str) -> dict:
+    """
+    Packs the templates and data sets of an export directory into a single compressed
+    archive. Members keep their paths, so that extracting the bundle restores the export
+    directory, and are listed by an index member written ahead of them.
+    :return: The index
+    """
+    templates: Dict[str, str] = {}
+    for template_name in _list_json_files(input_dir, TEMPLATE_DIR):
+        template = _find_member(input_dir, TEMPLATE_DIR, template_name)
+        assert template is not None
+        templates[template_name] = template
+
+    data_sets: Dict[str, Dict[str, Optional[str]]] = {}
+    for placeholder in _list_json_files(input_dir, DATA_SET_DIR):
+        if placeholder.endswith(
+            (DATA_SET_REFRESH_PROPS_SUFFIX, DATA_SET_REFRESH_SCHEDULES_SUFFIX)
+        ):
+            continue
+
+        definition = _find_member(input_dir, DATA_SET_DIR, placeholder)
+        assert definition is not None
+        name = load_json_file(os.path.join(input_dir, definition))["Name"]
+        members: Dict[str, Optional[str]] = {"definition": definition}
+        for key, suffix in [
+            ("refresh_properties", DATA_SET_REFRESH_PROPS_SUFFIX),
+            ("refresh_schedules", DATA_SET_REFRESH_SCHEDULES_SUFFIX),
+        ]:
+            members[key] = _find_member(input_dir, DATA_SET_DIR, name + suffix)
+        data_sets[placeholder] = members
+
+    index = {
+        "version": BUNDLE_FORMAT_VERSION,
+        "templates": templates,
+        "data_sets": data_sets,
+    }
+    members_to_write = list(templates.values()) + sorted(
+        {
+            member
+            for data_set_members in data_sets.values()
+            for member in data_set_members.values()
+            if member is not None
+        }
+    )
+
+    # the bundle is replaced in one go, so readers never see a partial one
+    with open_atomically(bundle_file) as file:
+        with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr(BUNDLE_INDEX, dumps(index))
+            for member in members_to_write:
+                bundle.write(os.path.join(input_dir, member), arcname=member)
+    return index
+
+
+def _list_json_files(input_dir: str, directory: str) -> List[str]:
+    """
+    :return: The names (without their suffix) of the json files in the directory, in
+    any format
+    """
+    names = set()
+    for filename in os.listdir(os.path.join(input_dir, directory)):
+        for suffix in JSON_SUFFIXES:
+            if filename.endswith(suffix):
+                names.add(filename[: -len(suffix)])
+    return sorted(names)
+
+
+def _find_member(input_dir: str, directory: str, name: str) -> Optional[str]:
+    """
+    :return: The path of the named json file relative to input_dir, which is also its
+    bundle member name, or None if there is no such file
+    """
+    path = find_json_file(os.path.join(input_dir, directory, name))
+    return os.path.relpath(path, input_dir) if path is not None else None
@@ -4,11 +4,21 @@ from typing import Optional
 import boto3
 import click
 
+from core.assets import write_bundle
+from core.operation.export_analyses_operation import ExportAnalysesOperation
 from core.operation.export_analysis_operation import ExportAnalysisOperation
 from core.operation.import_from_json_operation import ImportFromJsonOperation
+from core.operation.publish_dashboard_from_definition import (
+    PublishDashboardFromDefinitionOperation,
+)
 from core.operation.publish_dashboard_from_template import (
     PublishDashboardFromTemplateOperation,
 )
+from core.operation.publish_dashboards_from_templates import (
+    PublishDashboardsFromTemplatesOperation,
+)
+from core.operation.sync_account_operation import SyncAccountOperation
+from core.serialization import JSON_FORMATS, PRETTY
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -19,6 +29,8 @@ logging.basicConfig(
 
 log = logging.getLogger("core.cli")
 
+DEFAULT_MAX_WORKERS = 4
+
 boto3.setup_default_session()
 
 
@@ -45,7 +57,36 @@ def cli():
     required=True,
     help="The path to the output directory to which resources will be exported",
 )
-def export_analysis(aws_account_id: str, analysis_id: str, output_dir: str):
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent tasks (the template build and each data set export)",
+)
+@click.option(
+    "--definition-only",
+    is_flag=True,
+    default=False,
+    help="Write the template straight from the analysis definition instead of "
+    "creating a Quicksight template from the analysis",
+)
+@click.option(
+    "--json-format",
+    type=click.Choice(JSON_FORMATS),
+    default=PRETTY,
+    show_default=True,
+    help="The format of the exported files: indented, compact, or compact and gzip "
+    "compressed (written as .json.gz files). Imports read any of them.",
+)
+def export_analysis(
+    aws_account_id: str,
+    analysis_id: str,
+    output_dir: str,
+    max_workers: int,
+    definition_only: bool,
+    json_format: str,
+):
     """
     Exports a template and dependent data sets based on the specified analysis to JSON files.
     """
@@ -53,11 +94,17 @@ def export_analysis(aws_account_id: str, analysis_id: str, output_dir: str):
     log.info(f"analysis_id= {analysis_id}")
     log.info(f"aws_account_id={aws_account_id}")
     log.info(f"output_dir={output_dir}")
+    log.info(f"max_workers={max_workers}")
+    log.info(f"definition_only={definition_only}")
+    log.info(f"json_format={json_format}")
     result = ExportAnalysisOperation(
         qs_client=create_quicksight_client(),
         aws_account_id=aws_account_id,
         analysis_id=analysis_id,
         output_dir=output_dir,
+        max_workers=max_workers,
+        definition_only=definition_only,
+        json_format=json_format,
     ).execute()
     log.info(result)
 
@@ -65,51 +112,251 @@ def export_analysis(aws_account_id: str, analysis_id: str, output_dir: str):
 cli.add_command(export_analysis)
 
 
+@click.command()
+@click.option("--aws-account-id", required=True, help="The ID of the AWS account")
+@click.option(
+    "--analysis-id",
+    "analysis_ids",
+    multiple=True,
+    help="The ID of an Analysis to be exported (may be repeated)",
+)
+@click.option(
+    "--analysis-pattern",
+    required=False,
+    help="A glob (e.g. 'library*') matched against the ID and name of every Analysis in "
+    "the account: the matching analyses are exported too",
+)
+@click.option(
+    "--output-dir",
+    required=True,
+    help="The path to the output directory to which resources will be exported",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent tasks, shared between the analyses exported "
+    "at once",
+)
+@click.option(
+    "--definition-only",
+    is_flag=True,
+    default=False,
+    help="Write the templates straight from the analysis definitions instead of "
+    "creating Quicksight templates from the analyses",
+)
+@click.option(
+    "--json-format",
+    type=click.Choice(JSON_FORMATS),
+    default=PRETTY,
+    show_default=True,
+    help="The format of the exported files: indented, compact, or compact and gzip "
+    "compressed (written as .json.gz files). Imports read any of them.",
+)
+def export_analyses(
+    aws_account_id: str,
+    analysis_ids: tuple[str, ...],
+    analysis_pattern: Optional[str],
+    output_dir: str,
+    max_workers: int,
+    definition_only: bool,
+    json_format: str,
+):
+    """
+    Exports the templates and dependent data sets of several analyses to JSON files.
+    """
+    if not analysis_ids and not analysis_pattern:
+        raise click.UsageError("Specify --analysis-id and/or --analysis-pattern")
+
+    log.info(f"Export analyses")
+    log.info(f"analysis_ids= {analysis_ids}")
+    log.info(f"analysis_pattern= {analysis_pattern}")
+    log.info(f"aws_account_id={aws_account_id}")
+    log.info(f"output_dir={output_dir}")
+    log.info(f"max_workers={max_workers}")
+    log.info(f"definition_only={definition_only}")
+    log.info(f"json_format={json_format}")
+    result = ExportAnalysesOperation(
+        qs_client=create_quicksight_client(),
+        aws_account_id=aws_account_id,
+        analysis_ids=list(analysis_ids),
+        analysis_pattern=analysis_pattern,
+        output_dir=output_dir,
+        max_workers=max_workers,
+        definition_only=definition_only,
+        json_format=json_format,
+    ).execute()
+    log.info(result)
+
+
+cli.add_command(export_analyses)
+
+
+@click.command()
+@click.option(
+    "--input-dir",
+    required=True,
+    help="The path to the directory the resources were exported to",
+)
+@click.option(
+    "--bundle-file",
+    required=True,
+    help="The path to the bundle to write",
+)
+def bundle_assets(input_dir: str, bundle_file: str):
+    """
+    Packs exported templates and data sets into a single compressed bundle.
+    """
+    log.info(f"bundle_assets")
+    log.info(f"input_dir = {input_dir}")
+    log.info(f"bundle_file = {bundle_file}")
+    index = write_bundle(input_dir=input_dir, bundle_file=bundle_file)
+    log.info(
+        f"Bundled {len(index['templates'])} template(s) and "
+        f"{len(index['data_sets'])} data set(s) into {bundle_file}"
+    )
+
+
+cli.add_command(bundle_assets)
+
+
+@click.command()
+@click.option("--aws-account-id", required=True, help="The ID of the AWS account")
+@click.option(
+    "--output-dir",
+    required=True,
+    help="The path to the output directory that mirrors the account",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of analyses and data sets exported at once",
+)
+@click.option(
+    "--definition-only",
+    is_flag=True,
+    default=False,
+    help="Write the templates straight from the analysis definitions instead of "
+    "creating Quicksight templates from the analyses",
+)
+@click.option(
+    "--json-format",
+    type=click.Choice(JSON_FORMATS),
+    default=PRETTY,
+    show_default=True,
+    help="The format of the exported files: indented, compact, or compact and gzip "
+    "compressed (written as .json.gz files). Imports read any of them.",
+)
+def sync_account(
+    aws_account_id: str,
+    output_dir: str,
+    max_workers: int,
+    definition_only: bool,
+    json_format: str,
+):
+    """
+    Exports the analyses and data sets that changed since the previous sync.
+    """
+    log.info(f"Sync account")
+    log.info(f"aws_account_id={aws_account_id}")
+    log.info(f"output_dir={output_dir}")
+    log.info(f"max_workers={max_workers}")
+    log.info(f"definition_only={definition_only}")
+    log.info(f"json_format={json_format}")
+    result = SyncAccountOperation(
+        qs_client=create_quicksight_client(),
+        aws_account_id=aws_account_id,
+        output_dir=output_dir,
+        max_workers=max_workers,
+        definition_only=definition_only,
+        json_format=json_format,
+    ).execute()
+    log.info(result)
+
+
+cli.add_command(sync_account)
+
+
 @click.command
 @click.option("--aws-account-id", required=True, help="The ID of the AWS account")
 @click.option(
-    "--template-name", required=True, help="The name of the template to be restored"
+    "--template-name",
+    "template_names",
+    required=True,
+    multiple=True,
+    help="The name of a template to be restored (may be repeated). Data sets shared "
+    "by several templates are only imported once.",
 )
 @click.option(
     "--data-source-arn",
-    required=True,
+    required=False,
     help="The ARN of the data source you want to associate with the data sets",
 )
 @click.option(
     "--target-namespace",
-    required=True,
+    required=False,
     help="The namespace you wish to target (e.g. tpp-prod, tpp-dev, tpp-staging).",
 )
+@click.option(
+    "--target",
+    "targets",
+    type=(str, str),
+    multiple=True,
+    metavar="NAMESPACE DATA_SOURCE_ARN",
+    help="A further namespace to import into, with the ARN of its data source "
+    "(may be repeated). The assets are read once for all namespaces.",
+)
 @click.option(
     "--input-dir",
     required=True,
-    help="The path to the input directory from which resources will be imported",
+    help="The path to the input directory (or to a bundle created by bundle-assets) "
+    "from which resources will be imported",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent tasks (the template build and each data set import)",
 )
 def import_template(
     aws_account_id: str,
-    template_name: str,
-    data_source_arn: str,
-    target_namespace: str,
+    template_names: tuple[str, ...],
+    data_source_arn: Optional[str],
+    target_namespace: Optional[str],
+    targets: tuple[tuple[str, str], ...],
     input_dir: str,
+    max_workers: int,
 ):
     """
     Import template and datasource files from json
     """
-
     log.info(f"import_from_json")
     log.info(f"aws_account_id = {aws_account_id}")
-    log.info(f"template_name = {template_name}")
+    log.info(f"template_names = {template_names}")
     log.info(f"data_source_arn = {data_source_arn}")
+    log.info(f"targets = {targets}")
     log.info(f"input_dir= {input_dir}")
-
-    result = ImportFromJsonOperation(
-        qs_client=create_quicksight_client(),
-        aws_account_id=aws_account_id,
-        template_name=template_name,
-        target_namespace=target_namespace,
-        data_source_arn=data_source_arn,
-        input_dir=input_dir,
-    ).execute()
+    log.info(f"max_workers = {max_workers}")
+
+    try:
+        operation = ImportFromJsonOperation(
+            qs_client=create_quicksight_client(),
+            aws_account_id=aws_account_id,
+            template_name=template_names[0],
+            template_names=list(template_names[1:]),
+            target_namespace=target_namespace,
+            data_source_arn=data_source_arn,
+            targets=list(targets),
+            input_dir=input_dir,
+            max_workers=max_workers,
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    result = operation.execute()
     log.info(result)
 
 
@@ -142,6 +389,13 @@ cli.add_command(import_template)
     required=False,
     help="An S3 object key to save the results to. If used, result-bucket must be specified.",
 )
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent lookups made before publishing",
+)
 def publish_dashboard(
     aws_account_id: str,
     template_id: str,
@@ -150,6 +404,7 @@ def publish_dashboard(
     output_json: str,
     result_bucket: str,
     result_key: str,
+    max_workers: int,
 ):
     """
     Create/Update a dashboard from a template
@@ -159,6 +414,7 @@ def publish_dashboard(
     log.info(f"aws_account_id = {aws_account_id}")
     log.info(f"template_id = {template_id}")
     log.info(f"group_name = {group_name}")
+    log.info(f"max_workers = {max_workers}")
     result = PublishDashboardFromTemplateOperation(
         qs_client=create_quicksight_client(),
         s3_client=create_s3_client(),
@@ -169,6 +425,7 @@ def publish_dashboard(
         output_json=output_json,
         result_bucket=result_bucket,
         result_key=result_key,
+        max_workers=max_workers,
     ).execute()
     log.info(result)
 
@@ -176,6 +433,80 @@ def publish_dashboard(
 cli.add_command(publish_dashboard)
 
 
+@click.command
+@click.option("--aws-account-id", required=True, help="The ID of the AWS account")
+@click.option(
+    "--template-id",
+    "template_ids",
+    required=True,
+    multiple=True,
+    help="The ID of a template to be published (may be repeated)",
+)
+@click.option(
+    "--target-namespace",
+    required=True,
+    help="The namespace you wish to target (e.g. tpp-prod, tpp-dev, tpp-staging).",
+)
+@click.option("--group-name", required=True, help="Name of the Quicksight User Group")
+@click.option(
+    "--output-json",
+    required=False,
+    help="The file path to which operation output should be written as json",
+)
+@click.option(
+    "--result-bucket",
+    required=False,
+    help="An S3 bucket to save the results to. If specified, you must also specify a result-key",
+)
+@click.option(
+    "--result-key",
+    required=False,
+    help="An S3 object key to save the results to. If used, result-bucket must be specified.",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent lookups and dashboard submissions",
+)
+def publish_dashboards(
+    aws_account_id: str,
+    template_ids: tuple[str, ...],
+    target_namespace: str,
+    group_name: str,
+    output_json: str,
+    result_bucket: str,
+    result_key: str,
+    max_workers: int,
+):
+    """
+    Create/Update a dashboard from each of several templates, waiting on all of them at once
+    """
+
+    log.info(f"publish dashboards from templates")
+    log.info(f"aws_account_id = {aws_account_id}")
+    log.info(f"template_ids = {template_ids}")
+    log.info(f"group_name = {group_name}")
+    log.info(f"max_workers = {max_workers}")
+    result = PublishDashboardsFromTemplatesOperation(
+        qs_client=create_quicksight_client(),
+        s3_client=create_s3_client(),
+        aws_account_id=aws_account_id,
+        template_ids=list(template_ids),
+        target_namespace=target_namespace,
+        group_name=group_name,
+        output_json=output_json,
+        result_bucket=result_bucket,
+        result_key=result_key,
+        max_workers=max_workers,
+    ).execute()
+    log.info(result)
+
+
+cli.add_command(publish_dashboards)
+
+
 @click.command
 @click.option("--aws-account-id", required=True, help="The ID of the AWS account")
 @click.option(
@@ -194,7 +525,8 @@ cli.add_command(publish_dashboard)
 @click.option(
     "--input-dir",
     required=True,
-    help="The path to the input directory from which resources will be imported",
+    help="The path to the input directory (or to a bundle created by bundle-assets) "
+    "from which resources will be imported",
 )
 @click.option("--group-name", required=True, help="Name of the Quicksight User Group")
 @click.option(
@@ -212,6 +544,21 @@ cli.add_command(publish_dashboard)
     required=False,
     help="(Optional) The file path to which operation output should be written as json",
 )
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    help="The maximum number of concurrent tasks (the template build and each data set "
+    "import, then the lookups made before publishing)",
+)
+@click.option(
+    "--skip-template",
+    is_flag=True,
+    default=False,
+    help="Publish the dashboard straight from the template definition instead of "
+    "creating a Quicksight template first",
+)
 def import_and_publish(
     aws_account_id: str,
     template_name: str,
@@ -222,6 +569,8 @@ def import_and_publish(
     result_bucket: str,
     result_key: str,
     output_json: Optional[str] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    skip_template: bool = False,
 ):
 
     log.info(f"import_and_publish")
@@ -233,6 +582,8 @@ def import_and_publish(
     log.info(f"result_bucket = {result_bucket}")
     log.info(f"result_key = {result_key}")
     log.info(f"output_json = {output_json}")
+    log.info(f"max_workers = {max_workers}")
+    log.info(f"skip_template = {skip_template}")
 
     log.info(f"Importing {template_name}")
     result = ImportFromJsonOperation(
@@ -242,8 +593,32 @@ def import_and_publish(
         target_namespace=target_namespace,
         data_source_arn=data_source_arn,
         input_dir=input_dir,
+        max_workers=max_workers,
+        create_template=not skip_template,
     ).execute()
     log.info(f"Import result: {result}")
+
+    if skip_template:
+        log.info(
+            f"Publishing {template_name} definition as dashboard using datasource {data_source_arn}"
+        )
+        result = PublishDashboardFromDefinitionOperation(
+            qs_client=create_quicksight_client(),
+            s3_client=create_s3_client(),
+            aws_account_id=aws_account_id,
+            dashboard_alias=template_name,
+            template_name=template_name,
+            input_dir=input_dir,
+            target_namespace=target_namespace,
+            group_name=group_name,
+            result_bucket=result_bucket,
+            result_key=result_key,
+            output_json=output_json,
+            max_workers=max_workers,
+        ).execute()
+        log.info(f"publish result = {result}")
+        return
+
     template_id: str = result["template"]["id"]
     log.info(
         f"Publishing template {template_id} as dashboard using datasource {data_source_arn}"
@@ -260,6 +635,7 @@ def import_and_publish(
         result_bucket=result_bucket,
         result_key=result_key,
         output_json=output_json,
+        max_workers=max_workers,
     ).execute()
     log.info(f"publish result = {result}")
 
@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from core.serialization import PRETTY, dump_json, load_json_file, to_canonical_json
+from core.util import AtomicFile, write_file_atomically
+
+log = logging.getLogger(__name__)
+
+
+class ExportManifest:
+    """
+    Records the content hash of every exported file (along with the size and
+    modification time it was written with), and which analyses exported it, so that
+    unchanged files are not rewritten and files no analysis exports any more are removed.
+    Paths are recorded relative to the output directory.
+    """
+
+    def __init__(self, output_dir: str, manifest_file: str):
+        """
+        :param output_dir: The directory the files are exported to
+        :param manifest_file: The path of the manifest, relative to output_dir
+        """
+        self._output_dir = output_dir
+        self._manifest_path = os.path.join(output_dir, manifest_file)
+        self._lock = threading.Lock()
+        # files written by this run are never removed, even if their previous owner
+        # stopped exporting them.
+        self._written: Set[str] = set()
+
+        if os.path.exists(self._manifest_path):
+            manifest = load_json_file(self._manifest_path)
+        else:
+            manifest = {}
+        # files recorded by their hash alone (by older versions) are written again once
+        self._files: Dict[str, dict] = {
+            key: recorded
+            for key, recorded in manifest.get("files", {}).items()
+            if isinstance(recorded, dict)
+        }
+        self._owners: Dict[str, List[str]] = manifest.get("analyses", {})
+
+    def write_json(self, path: str, data, json_format: str = PRETTY) -> bool:
+        """
+        Writes the data to path as canonical json, unless the file already holds exactly
+        that json. The json is serialized once, straight to a temporary file, and hashed
+        as it is written: the temporary file only replaces the file if the hash changed,
+        or if the file is no longer the one that was written with that hash.
+        :return: True if the file was written
+        """
+        key = self._key(path)
+        with AtomicFile(path) as atomic_file:
+            content_hash = dump_json(data, atomic_file.file, json_format)
+            with self._lock:
+                self._written.add(key)
+                recorded = self._files.get(key)
+            if recorded is not None and recorded["sha256"] == content_hash:
+                # the file itself must not have been changed (or removed) since
+                if self._stat(path) == (recorded["size"], recorded["mtime_ns"]):
+                    atomic_file.discard()
+                    return False
+
+        stat = os.stat(path)
+        with self._lock:
+            self._files[key] = {
+                "sha256": content_hash,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+        return True
+
+    def set_analysis_files(self, analysis_id: str, paths: Iterable[str]) -> List[str]:
+        """
+        Records the files exported for the analysis, and removes the files it exported
+        before that neither it nor any other analysis exports any more.
+        :return: The paths of the removed files
+        """
+        keys = sorted({self._key(path) for path in paths})
+        with self._lock:
+            previous_keys = self._owners.get(analysis_id, [])
+            if keys:
+                self._owners[analysis_id] = keys
+            else:
+                self._owners.pop(analysis_id, None)
+            owned_keys = {key for owned in self._owners.values() for key in owned}
+            removed_keys = [
+                key
+                for key in previous_keys
+                if key not in owned_keys and key not in self._written
+            ]
+            for key in removed_keys:
+                self._files.pop(key, None)
+
+        removed = []
+        for key in removed_keys:
+            path = os.path.join(self._output_dir, key)
+            if os.path.exists(path):
+                os.remove(path)
+                log.info(f"Removed {path}: it is no longer exported")
+            removed.append(path)
+        return removed
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self._manifest_path), exist_ok=True)
+        with self._lock:
+            manifest = {"files": self._files, "analyses": self._owners}
+            write_file_atomically(self._manifest_path, to_canonical_json(manifest))
+
+    def _stat(self, path: str) -> Optional[Tuple[int, int]]:
+        """
+        :return: The size and modification time of the file, or None if it does not exist
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self._output_dir)
@@ -1,15 +1,30 @@
 import json
 import logging
 import os
-import time
+import threading
 from abc import abstractmethod
 from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Optional, Set
+
+from core.serialization import JSON_SUFFIX
+from core.waiter import (
+    DEFAULT_WAITER_CONFIG,
+    WaiterConfig,
+    status_successful,
+    wait_until,
+)
 
 ASSET_DIR = "assets"
 TEMPLATE_DIR = os.path.join(ASSET_DIR, "templates")
 DATA_SET_DIR = os.path.join(ASSET_DIR, "data-sets")
 DATA_SET_REFRESH_PROPS_SUFFIX = "-data-set-refresh-props"
 DATA_SET_REFRESH_SCHEDULES_SUFFIX = "-data-set-refresh-schedules"
+# the content hash of every exported file, see core.manifest
+EXPORT_MANIFEST_FILE = os.path.join(ASSET_DIR, "export-manifest.json")
+
+# create_template parameters that update_template does not accept
+TEMPLATE_CREATION_ONLY_FIELDS = ["Permissions", "Tags"]
 
 
 @dataclass
@@ -19,70 +34,111 @@ class TemplateResponse:
     template_id: str
 
 
+class DataSetNotFoundError(Exception):
+    """
+    Raised when data sets that a template or dashboard refers to do not exist.
+    """
+
+    def __init__(self, placeholders: List[str]):
+        self.placeholders = placeholders
+        super().__init__(
+            f"Data sets not found for placeholders: {', '.join(placeholders)}"
+        )
+
+
 class BaseOperation:
     """
     A base class for AWS based operations.
     """
 
-    def __init__(self, qs_client, aws_account_id: str):
+    def __init__(
+        self,
+        qs_client,
+        aws_account_id: str,
+        waiter_config: Optional[WaiterConfig] = None,
+    ):
         self._aws_account_id = aws_account_id
         self._qs_client = qs_client
+        self._waiter_config = waiter_config or DEFAULT_WAITER_CONFIG
         self._log = logging.getLogger(self.__class__.__name__)
+        self._bytes_received = 0
+        self._bytes_received_lock = threading.Lock()
 
     @abstractmethod
     def execute(self) -> dict:
         pass
 
-    def _recreate_template(self, template_data: dict) -> TemplateResponse:
+    @property
+    def bytes_received(self) -> int:
+        """
+        The size of the response bodies received by this operation so far.
+        """
+        with self._bytes_received_lock:
+            return self._bytes_received
+
+    def _create_or_update_template(self, template_data: dict) -> TemplateResponse:
         """
-        Creates new or updates existing template.
+        Updates the template in place (keeping its version history) or creates it if it
+        does not exist yet, then waits for the new version to be built.
         :param template_data:
         :return: Template ARN, Template Version ARN, and the Template ID
         """
 
         template_id = template_data["TemplateId"]
         try:
-            self._log.info(f"ready to delete template ({template_id}) if exists.")
-
-            self._qs_client.delete_template(
-                **{
-                    "TemplateId": template_id,
-                    "AwsAccountId": template_data["AwsAccountId"],
-                }
+            self._log.info(f"ready to update template ({template_id}) if exists.")
+            update_params = {
+                k: v
+                for k, v in template_data.items()
+                if k not in TEMPLATE_CREATION_ONLY_FIELDS
+            }
+            response = self._record_response(
+                self._qs_client.update_template(**update_params)
             )
-
-            # there can be some latency between the completion of the deletion command
-            # and the complete backend deletion operation.
-            time.sleep(3)
-            self._log.info(f"template ({template_id}) deletion complete.")
-
+            action = "updated"
         except self._qs_client.exceptions.ResourceNotFoundException as e:
-            self._log.info(f"template ({template_id}) not found: no deletion needed.")
-
-        response = self._qs_client.create_template(**template_data)
+            self._log.info(f"template ({template_id}) not found: creating it.")
+            response = self._record_response(
+                self._qs_client.create_template(**template_data)
+            )
+            action = "created"
 
         http_status = response["ResponseMetadata"]["HTTPStatusCode"]
-        if http_status != 202:
+        if http_status != 202 and http_status != 200:
             self._log.error(
-                f"Unexpected response from create_template request: "
+                f"Unexpected response from create/update template request: "
                 f"template_id = {template_id}, http_status = {http_status}"
             )
             raise Exception(
                 f"Unexpected response from trying to create/update template : {json.dumps(response, indent=4)} "
             )
-        else:
-            self._log.info(
-                f"Template ({template_id}) created successfully: http_status = {http_status}"
-            )
-            return TemplateResponse(
-                response["Arn"], response["VersionArn"], response["TemplateId"]
-            )
 
-    def _recreate_template_from_template_definition(
+        self._log.info(
+            f"Template ({template_id}) {action} successfully: http_status = {http_status}"
+        )
+        template_response = TemplateResponse(
+            response["Arn"], response["VersionArn"], response["TemplateId"]
+        )
+        self._wait_for_template_version(template_response)
+        return template_response
+
+    def _record_response(self, response: dict) -> dict:
+        """
+        Adds the size of the response body, as reported by the service, to the bytes received
+        by this operation.
+        :return: the response, unchanged
+        """
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        content_length = int(headers.get("content-length", 0))
+        with self._bytes_received_lock:
+            self._bytes_received += content_length
+        return response
+
+    def _create_or_update_template_from_template_definition(
         self, template_definition: dict
     ) -> TemplateResponse:
         template_definition["AwsAccountId"] = self._aws_account_id
-        return self._recreate_template(template_data=template_definition)
+        return self._create_or_update_template(template_data=template_definition)
 
     def _resolve_data_set_id_from_placeholder(
         self, namespace: str, placeholder: str
@@ -90,20 +146,113 @@ class BaseOperation:
         return namespace + "-" + placeholder
 
     def _get_template_definition(self, template_id):
-        return self._qs_client.describe_template_definition(
-            AwsAccountId=self._aws_account_id,
-            TemplateId=template_id,
-            AliasName="$LATEST",
+        return self._record_response(
+            self._qs_client.describe_template_definition(
+                AwsAccountId=self._aws_account_id,
+                TemplateId=template_id,
+                AliasName="$LATEST",
+            )
+        )
+
+    def _get_template_version_status(self, template_response: TemplateResponse) -> str:
+        """
+        Retrieves the status of the template version without its (potentially large) definition.
+        :return: The version status, e.g. CREATION_IN_PROGRESS or CREATION_SUCCESSFUL
+        """
+        version_number = int(template_response.version_arn.rsplit("/", 1)[1])
+        response = self._record_response(
+            self._qs_client.describe_template(
+                AwsAccountId=self._aws_account_id,
+                TemplateId=template_response.template_id,
+                VersionNumber=version_number,
+            )
+        )
+        return response["Template"]["Version"]["Status"]
+
+    def _wait_for_template_version(self, template_response: TemplateResponse) -> None:
+        """
+        Blocks until the template version has been built.
+        """
+        wait_until(
+            status_successful(
+                partial(self._get_template_version_status, template_response),
+                description=f"Template ({template_response.template_id})",
+            ),
+            description=f"Build of template ({template_response.template_id})",
+            config=self._waiter_config,
         )
 
     def _describe_data_set(self, data_set_id):
-        response = self._qs_client.describe_data_set(
-            AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+        response = self._record_response(
+            self._qs_client.describe_data_set(
+                AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+            )
         )
         return response["DataSet"]
 
+    def _get_namespace_arn(self) -> str:
+        namespace_params = {
+            "AwsAccountId": self._aws_account_id,
+            "Namespace": "default",
+        }
+        return self._qs_client.describe_namespace(**namespace_params)["Namespace"][
+            "Arn"
+        ]
+
+    def _get_group_arn(self, group_name: str) -> str:
+        return self._qs_client.describe_group(
+            AwsAccountId=self._aws_account_id,
+            Namespace="default",
+            GroupName=group_name,
+        )["Group"]["Arn"]
+
+    def _resolve_data_set_arn(self, data_set_id: str) -> str:
+        meta = self._qs_client.meta
+        return (
+            f"arn:{meta.partition}:quicksight:{meta.region_name}:"
+            f"{self._aws_account_id}:dataset/{data_set_id}"
+        )
+
+    def _list_data_set_arns(self) -> Set[str]:
+        """
+        :return: The ARN of every data set in the account, from a single paginated sweep
+        """
+        existing_arns: Set[str] = set()
+        paginator = self._qs_client.get_paginator("list_data_sets")
+        for page in paginator.paginate(AwsAccountId=self._aws_account_id):
+            self._record_response(page)
+            existing_arns.update(summary["Arn"] for summary in page["DataSetSummaries"])
+        return existing_arns
+
+    def _resolve_data_set_arns(
+        self, namespace: str, placeholders: List[str], existing_arns: Set[str]
+    ) -> Dict[str, str]:
+        """
+        Resolves the ARN of each placeholder's data set without describing the data sets,
+        which would download their whole table maps.
+        :param existing_arns: The ARNs of the account's data sets (see _list_data_set_arns)
+        :return: The data set ARN of each placeholder, in order
+        :raises DataSetNotFoundError: listing every placeholder whose data set does not exist
+        """
+        arns = {
+            placeholder: self._resolve_data_set_arn(
+                self._resolve_data_set_id_from_placeholder(
+                    namespace=namespace, placeholder=placeholder
+                )
+            )
+            for placeholder in placeholders
+        }
+        missing = [
+            placeholder for placeholder, arn in arns.items() if arn not in existing_arns
+        ]
+        if missing:
+            raise DataSetNotFoundError(missing)
+        return arns
+
     def _resolve_path(self, *paths):
         return os.path.join(*paths)
 
-    def _resolve_schedules_filename(self, logical_data_set_name: str):
-        return logical_data_set_name + DATA_SET_REFRESH_SCHEDULES_SUFFIX + ".json"
+    def _resolve_schedules_filename(
+        self, logical_data_set_name: str, suffix: str = JSON_SUFFIX
+    ):
+        return logical_data_set_name + DATA_SET_REFRESH_SCHEDULES_SUFFIX + suffix
@@ -0,0 +1,135 @@
+import fnmatch
+from typing import Dict, List, Optional
+
+from core.manifest import ExportManifest
+from core.operation.baseoperation import EXPORT_MANIFEST_FILE, BaseOperation
+from core.operation.export_analysis_operation import ExportAnalysisOperation
+from core.serialization import PRETTY
+from core.util import Memoizer, run_concurrently
+
+
+class ExportAnalysesOperation(BaseOperation):
+    """
+    Exports several Quicksight Analyses and all their dependencies to json files on disk.
+    The analyses are exported concurrently and share their data set lookups, so data sets
+    used by several analyses are only fetched once.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        *args,
+        analysis_ids: Optional[List[str]] = None,
+        analysis_pattern: Optional[str] = None,
+        max_workers: int = 1,
+        definition_only: bool = False,
+        json_format: str = PRETTY,
+        **kwargs,
+    ):
+        """
+        :param analysis_ids: The IDs of the analyses to export
+        :param analysis_pattern: A glob matched against the ID and name of each analysis in
+        the account: the matching analyses are exported too
+        :param max_workers: The maximum number of concurrent tasks, shared between the
+        analyses exported at once
+        """
+        self._output_dir = output_dir
+        self._analysis_ids = analysis_ids or []
+        self._analysis_pattern = analysis_pattern
+        self._max_workers = max_workers
+        self._definition_only = definition_only
+        self._json_format = json_format
+        super().__init__(*args, **kwargs)
+
+    def execute(self) -> dict:
+        analysis_ids = list(self._analysis_ids)
+        if self._analysis_pattern:
+            analysis_ids.extend(
+                analysis_id
+                for analysis_id in self._list_matching_analysis_ids()
+                if analysis_id not in analysis_ids
+            )
+
+        # the analyses share the workers: each export runs its own tasks on its share, so
+        # that no more than max_workers requests are in flight at once.
+        analysis_workers = max(1, min(self._max_workers, len(analysis_ids)))
+        export_workers = max(1, self._max_workers // analysis_workers)
+
+        lookup_cache: Memoizer = Memoizer()
+        manifest = ExportManifest(self._output_dir, EXPORT_MANIFEST_FILE)
+        exports = {
+            analysis_id: ExportAnalysisOperation(
+                qs_client=self._qs_client,
+                aws_account_id=self._aws_account_id,
+                waiter_config=self._waiter_config,
+                analysis_id=analysis_id,
+                output_dir=self._output_dir,
+                max_workers=export_workers,
+                definition_only=self._definition_only,
+                json_format=self._json_format,
+                lookup_cache=lookup_cache,
+                manifest=manifest,
+            )
+            for analysis_id in analysis_ids
+        }
+
+        try:
+            results = run_concurrently(
+                {
+                    f"analysis {analysis_id}": export.execute
+                    for analysis_id, export in exports.items()
+                },
+                max_workers=analysis_workers,
+            )
+        finally:
+            # the files of the analyses that were exported are recorded either way
+            manifest.save()
+
+        analyses = {
+            analysis_id: results[f"analysis {analysis_id}"]
+            for analysis_id in analysis_ids
+        }
+        # data sets shared by several analyses are written by each of them
+        files_exported: Dict[str, None] = {}
+        changed_files: Dict[str, None] = {}
+        removed_files: List[str] = []
+        for result in analyses.values():
+            files_exported.update(dict.fromkeys(result["files_exported"]))
+            changed_files.update(dict.fromkeys(result["files"]["changed"]))
+            removed_files.extend(result["files"]["removed"])
+
+        return {
+            "status": "success",
+            "analyses": analyses,
+            "files_exported": list(files_exported),
+            "files": {
+                "changed": list(changed_files),
+                "unchanged": [
+                    path for path in files_exported if path not in changed_files
+                ],
+                "removed": removed_files,
+            },
+            "bytes_transferred": self._bytes_received
+            + sum(result["bytes_transferred"] for result in analyses.values()),
+        }
+
+    def _list_matching_analysis_ids(self) -> List[str]:
+        """
+        :return: The IDs of the analyses whose ID or name match the pattern
+        """
+        pattern = self._analysis_pattern
+        analysis_ids = []
+        paginator = self._qs_client.get_paginator("list_analyses")
+        for page in paginator.paginate(AwsAccountId=self._aws_account_id):
+            self._record_response(page)
+            for summary in page["AnalysisSummaryList"]:
+                # deleted analyses are listed until they are purged
+                if summary.get("Status") == "DELETED":
+                    continue
+                if fnmatch.fnmatchcase(
+                    summary["AnalysisId"], pattern
+                ) or fnmatch.fnmatchcase(summary.get("Name", ""), pattern):
+                    analysis_ids.append(summary["AnalysisId"])
+
+        self._log.info(f"{len(analysis_ids)} analyses match {pattern}")
+        return analysis_ids
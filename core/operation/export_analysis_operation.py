@@ -1,17 +1,41 @@
-import json
+import copy
 import os
-from typing import List
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional
 
 from botocore.exceptions import ClientError
 
+from core.manifest import ExportManifest
 from core.operation.baseoperation import (
     DATA_SET_DIR,
     DATA_SET_REFRESH_PROPS_SUFFIX,
+    EXPORT_MANIFEST_FILE,
     TEMPLATE_DIR,
     BaseOperation,
     TemplateResponse,
 )
-from core.util import recursively_replace_value, retry
+from core.rewrite import rewrite_keys
+from core.serialization import PRETTY, json_file_suffix
+from core.util import Memoizer, run_concurrently
+
+# analysis definition fields that are also part of a template definition (the members of
+# the TemplateVersionDefinition shape other than DataSetConfigurations, which is built
+# from the DataSetIdentifierDeclarations). The others (DataSetIdentifierDeclarations,
+# TopicIdentifierDeclarations) are rejected by create_template.
+TEMPLATE_DEFINITION_FIELDS = [
+    "AnalysisDefaults",
+    "CalculatedFields",
+    "ColumnConfigurations",
+    "FilterGroups",
+    "Options",
+    "ParameterDeclarations",
+    "QueryExecutionOptions",
+    "Sheets",
+    "StaticFiles",
+    "TooltipSheets",
+    "TopicConfigurations",
+]
 
 
 class ExportAnalysisOperation(BaseOperation):
@@ -19,9 +43,38 @@ class ExportAnalysisOperation(BaseOperation):
     Exports a Quicksight Analysis and all it's dependencies to json files on disk
     """
 
-    def __init__(self, analysis_id: str, output_dir: str, *args, **kwargs):
+    def __init__(
+        self,
+        analysis_id: str,
+        output_dir: str,
+        *args,
+        max_workers: int = 1,
+        definition_only: bool = False,
+        lookup_cache: Optional[Memoizer] = None,
+        manifest: Optional[ExportManifest] = None,
+        json_format: str = PRETTY,
+        **kwargs,
+    ):
+        """
+        :param lookup_cache: Caches the data set lookups. Exports that share a cache (and
+        an output directory) only fetch each data set once.
+        :param manifest: The content hashes of the files in the output directory. Exports
+        to the same directory must share it, and whoever passes it in saves it.
+        :param json_format: The format of the files, see core.serialization
+        """
         self._analysis_id = analysis_id
         self._output_dir = output_dir
+        self._max_workers = max_workers
+        self._definition_only = definition_only
+        self._data_set_output_columns: Dict[str, List[dict]] = {}
+        self._lookup_cache = lookup_cache or Memoizer()
+        self._owns_manifest = manifest is None
+        self._manifest = manifest or ExportManifest(output_dir, EXPORT_MANIFEST_FILE)
+        self._changed_files: List[str] = []
+        self._unchanged_files: List[str] = []
+        self._files_lock = threading.Lock()
+        self._json_format = json_format
+        self._json_suffix = json_file_suffix(json_format)
         super().__init__(*args, **kwargs)
 
     def execute(self) -> dict:
@@ -29,8 +82,10 @@ class ExportAnalysisOperation(BaseOperation):
         os.makedirs(self._resolve_path(self._output_dir, DATA_SET_DIR), exist_ok=True)
 
         # retrieve description
-        analysis_description = self._qs_client.describe_analysis(
-            AwsAccountId=self._aws_account_id, AnalysisId=self._analysis_id
+        analysis_description = self._record_response(
+            self._qs_client.describe_analysis(
+                AwsAccountId=self._aws_account_id, AnalysisId=self._analysis_id
+            )
         )
         # check that analysis exists
         https_status = analysis_description["ResponseMetadata"]["HTTPStatusCode"]
@@ -43,8 +98,10 @@ class ExportAnalysisOperation(BaseOperation):
             raise Exception(message)
 
         # retrieve definition
-        analysis_definition = self._qs_client.describe_analysis_definition(
-            AwsAccountId=self._aws_account_id, AnalysisId=self._analysis_id
+        analysis_definition = self._record_response(
+            self._qs_client.describe_analysis_definition(
+                AwsAccountId=self._aws_account_id, AnalysisId=self._analysis_id
+            )
         )
 
         # extract DataSet references
@@ -62,68 +119,170 @@ class ExportAnalysisOperation(BaseOperation):
                 }
             )
 
-        # create a template from the analysis
-        template_response = self._create_or_update_template_from_analysis(
-            analysis=analysis, data_set_references=data_set_references
+        template_id = self._resolve_template_id(analysis)
+        tasks: Dict[str, Callable[[], List[str]]] = {}
+        if not self._definition_only:
+            # The template build and the data set exports are independent of each
+            # other, so they share one worker pool: the template build (and the wait for
+            # it to complete) runs alongside the data set exports rather than before them.
+            tasks[f"template {template_id}"] = partial(
+                self._export_template,
+                analysis=analysis,
+                data_set_references=data_set_references,
+            )
+        for di in data_set_identifier_declarations:
+            tasks[f"data set {di['Identifier']}"] = partial(
+                self.export_data_set,
+                data_set_id=self._get_data_set_id(di["DataSetArn"]),
+                logical_data_set_name=di["Identifier"],
+            )
+
+        files_to_update = []
+        for files in run_concurrently(tasks, max_workers=self._max_workers).values():
+            files_to_update.extend(files)
+
+        if self._definition_only:
+            # the data set schemas come from the data sets exported above.
+            files_to_update.insert(
+                0,
+                self._save_template_to_file(
+                    self._create_template_from_analysis_definition(
+                        analysis=analysis,
+                        template_id=template_id,
+                        analysis_definition=analysis_definition["Definition"],
+                    )
+                ),
+            )
+
+        removed_files = self._manifest.set_analysis_files(
+            self._analysis_id, files_to_update
         )
+        if self._owns_manifest:
+            self._manifest.save()
+
+        return {
+            "status": "success",
+            "files_exported": files_to_update,
+            "files": {
+                "changed": self._changed_files,
+                "unchanged": self._unchanged_files,
+                "removed": removed_files,
+            },
+            "data_sets": {
+                self._get_data_set_id(did["DataSetArn"]): did["Identifier"]
+                for did in data_set_identifier_declarations
+            },
+            "bytes_transferred": self._bytes_received,
+        }
 
-        def verify_success() -> bool:
-            self._template_definition = self._get_template_definition(
-                template_id=template_response.template_id
+    def _create_template_from_analysis_definition(
+        self, analysis, template_id: str, analysis_definition: dict
+    ) -> dict:
+        """
+        Converts an analysis definition into the template definition Quicksight would have
+        produced for it: the data set identifier declarations are replaced by data set
+        configurations whose placeholders are the identifiers.
+        """
+        data_set_configurations = []
+        for did in analysis_definition["DataSetIdentifierDeclarations"]:
+            identifier = did["Identifier"]
+            data_set_configurations.append(
+                {
+                    "Placeholder": identifier,
+                    "DataSetSchema": {
+                        "ColumnSchemaList": [
+                            {"Name": column["Name"], "DataType": column["Type"]}
+                            for column in self._data_set_output_columns[identifier]
+                        ]
+                    },
+                    "ColumnGroupSchemaList": [],
+                }
             )
 
-            return "SUCCESSFUL" in self._template_definition["ResourceStatus"]
+        definition = {"DataSetConfigurations": data_set_configurations}
+        for key, value in analysis_definition.items():
+            if key in TEMPLATE_DEFINITION_FIELDS:
+                definition[key] = value
+
+        return {
+            "Name": analysis["Name"],
+            "Definition": definition,
+            "TemplateId": template_id,
+        }
+
+    def _export_template(self, analysis, data_set_references: List) -> List[str]:
+        """
+        Creates or updates a template from the analysis and writes its definition to disk once built.
+        :return: The path of the template file
+        """
+        template_response = self._create_or_update_template_from_analysis(
+            analysis=analysis, data_set_references=data_set_references
+        )
 
-        retry(verify_success)
+        # the definition can be several megabytes, so it is only fetched once the
+        # template has been built.
+        template_definition = self._get_template_definition(
+            template_id=template_response.template_id
+        )
 
         # get the newly created template definition
         self._log.info(f"Writing template definition response to disk")
-        files_to_update = []
+        return [self._save_template_to_file(template_definition)]
+
+    def _save_template_to_file(self, template_definition: dict) -> str:
+        """
+        :return: The path of the template file
+        """
         map_to_save = {}
         # retain only the fields we will need to restore the state.
         for i in ["Name", "Definition", "TemplateId"]:
-            map_to_save[i] = self._template_definition[i]
+            map_to_save[i] = template_definition[i]
 
         # save the template as json file
-        definition_json_str = json.dumps(map_to_save, indent=4, default=str)
         template_file_path = self._resolve_path(
-            self._output_dir, TEMPLATE_DIR, self._template_definition["Name"] + ".json"
+            self._output_dir,
+            TEMPLATE_DIR,
+            template_definition["Name"] + self._json_suffix,
         )
-        with open(template_file_path, "w") as template_file:
-            template_file.write(definition_json_str)
+        self._write_json(template_file_path, map_to_save)
 
-        files_to_update.append(template_file_path)
+        return template_file_path
 
-        # for each dataset declaration identifiers
-        for di in data_set_identifier_declarations:
-            identifier = di["Identifier"]
-            arn = di["DataSetArn"]
-            data_set_id = arn.split("dataset/", 1)[1]
-            # save data set definition to json file
-            ds_file = self._save_dataset_to_file(data_set_id, identifier)
-            files_to_update.append(ds_file)
-            ds_refresh_props_file = self._save_dataset_refresh_props_to_file(
-                data_set_id, identifier
+    def _write_json(self, path: str, data: dict) -> None:
+        """
+        Streams the data to path as canonical json, unless the file is unchanged.
+        """
+        changed = self._manifest.write_json(path, data, self._json_format)
+        with self._files_lock:
+            (self._changed_files if changed else self._unchanged_files).append(path)
+
+    def export_data_set(
+        self, data_set_id: str, logical_data_set_name: str
+    ) -> List[str]:
+        """
+        Writes the data set definition, refresh properties and refresh schedules to disk.
+        :return: The paths of the files written
+        """
+        files = [self._save_dataset_to_file(data_set_id, logical_data_set_name)]
+        ds_refresh_props_file = self._save_dataset_refresh_props_to_file(
+            data_set_id, logical_data_set_name
+        )
+        if ds_refresh_props_file:
+            files.append(ds_refresh_props_file)
+            ds_refresh_schedules_file = self._save_dataset_refresh_schedules_to_file(
+                data_set_id, logical_data_set_name
             )
-            if ds_refresh_props_file:
-                files_to_update.append(ds_refresh_props_file)
-                ds_refresh_schedules_file = (
-                    self._save_dataset_refresh_schedules_to_file(
-                        data_set_id, identifier
-                    )
-                )
-                if ds_refresh_schedules_file:
-                    files_to_update.append(ds_refresh_props_file)
+            if ds_refresh_schedules_file:
+                files.append(ds_refresh_schedules_file)
 
-        return {"status": "success", "files_exported": files_to_update}
+        return files
 
     def _create_or_update_template_from_analysis(
         self, analysis, data_set_references: List
     ) -> TemplateResponse:
-        template_name = analysis["Name"]
         params = {
             "AwsAccountId": self._aws_account_id,
-            "TemplateId": template_name + "-template",
+            "TemplateId": self._resolve_template_id(analysis),
             "Name": analysis["Name"],
             "SourceEntity": {
                 "SourceAnalysis": {
@@ -132,7 +291,23 @@ class ExportAnalysisOperation(BaseOperation):
                 },
             },
         }
-        return self._recreate_template(template_data=params)
+        return self._create_or_update_template(template_data=params)
+
+    def _get_data_set_id(self, data_set_arn: str) -> str:
+        return data_set_arn.split("dataset/", 1)[1]
+
+    def _resolve_template_id(self, analysis) -> str:
+        return analysis["Name"] + "-template"
+
+    def _lookup_data_set_details(
+        self, request: str, data_set_id: str, fetch: Callable[[], dict]
+    ) -> dict:
+        """
+        Fetches data set details through the lookup cache, which may be shared with other
+        exports. Errors are cached too, so they are raised to every export.
+        :return: A copy of the response, since callers modify it
+        """
+        return copy.deepcopy(self._lookup_cache.get((request, data_set_id), fetch))
 
     def _save_dataset_to_file(
         self, data_set_id: str, logical_data_set_name: str
@@ -141,7 +316,14 @@ class ExportAnalysisOperation(BaseOperation):
         :return: The path of the dataset file
         """
 
-        ds_def_elements_to_save = self._describe_data_set(data_set_id)
+        ds_def_elements_to_save = self._lookup_data_set_details(
+            "describe_data_set",
+            data_set_id,
+            partial(self._describe_data_set, data_set_id),
+        )
+        self._data_set_output_columns[logical_data_set_name] = ds_def_elements_to_save[
+            "OutputColumns"
+        ]
         # remove the following fields from the response before saving it.
         for i in ["Arn", "DataSetId", "CreatedTime", "LastUpdatedTime"]:
             ds_def_elements_to_save.pop(i)
@@ -149,15 +331,15 @@ class ExportAnalysisOperation(BaseOperation):
         # align the data set name with the identifier
         ds_def_elements_to_save["Name"] = logical_data_set_name
         # remove the datasource arn since this will need to be overridden
-        recursively_replace_value(ds_def_elements_to_save, "DataSourceArn", "")
+        ds_def_elements_to_save = rewrite_keys(
+            ds_def_elements_to_save, {"DataSourceArn": ""}
+        )
         # save what is left to disk
-        ds_def_str = json.dumps(ds_def_elements_to_save, indent=4)
         dataset_file_path = self._resolve_path(
-            self._output_dir, DATA_SET_DIR, logical_data_set_name + ".json"
+            self._output_dir, DATA_SET_DIR, logical_data_set_name + self._json_suffix
         )
 
-        with open(dataset_file_path, "w") as dataset_file:
-            dataset_file.write(ds_def_str)
+        self._write_json(dataset_file_path, ds_def_elements_to_save)
 
         return dataset_file_path
 
@@ -166,19 +348,25 @@ class ExportAnalysisOperation(BaseOperation):
     ) -> str | None:
         # get data set refresh props
         try:
-            response = self._qs_client.describe_data_set_refresh_properties(
-                AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+            response = self._lookup_data_set_details(
+                "describe_data_set_refresh_properties",
+                data_set_id,
+                lambda: self._record_response(
+                    self._qs_client.describe_data_set_refresh_properties(
+                        AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+                    )
+                ),
             )
             data_set_refresh_props = response["DataSetRefreshProperties"]
-            data_set_refresh_props_str = json.dumps(data_set_refresh_props, indent=4)
             file_path = self._resolve_path(
                 self._output_dir,
                 DATA_SET_DIR,
-                logical_data_set_name + DATA_SET_REFRESH_PROPS_SUFFIX + ".json",
+                logical_data_set_name
+                + DATA_SET_REFRESH_PROPS_SUFFIX
+                + self._json_suffix,
             )
 
-            with open(file_path, "w") as props_file:
-                props_file.write(data_set_refresh_props_str)
+            self._write_json(file_path, data_set_refresh_props)
 
             return file_path
         except ClientError as e:
@@ -191,13 +379,20 @@ class ExportAnalysisOperation(BaseOperation):
         self, data_set_id: str, logical_data_set_name: str
     ) -> str | None:
         try:
-            response = self._qs_client.list_refresh_schedules(
-                AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+            response = self._lookup_data_set_details(
+                "list_refresh_schedules",
+                data_set_id,
+                lambda: self._record_response(
+                    self._qs_client.list_refresh_schedules(
+                        AwsAccountId=self._aws_account_id, DataSetId=data_set_id
+                    )
+                ),
             )
             refresh_schedules = response["RefreshSchedules"]
-            # remove account specific info
+            # remove account specific info. The ScheduleId is kept: imports match the
+            # live schedules on it.
             for schedule in refresh_schedules:
-                for prop in ["ScheduleId", "StartAfterDateTime", "Arn"]:
+                for prop in ["StartAfterDateTime", "Arn"]:
                     del schedule[prop]
 
             data_set_refresh_schedules = {"RefreshSchedules": refresh_schedules}
@@ -205,14 +400,12 @@ class ExportAnalysisOperation(BaseOperation):
             file_path = self._resolve_path(
                 self._output_dir,
                 DATA_SET_DIR,
-                self._resolve_schedules_filename(logical_data_set_name),
+                self._resolve_schedules_filename(
+                    logical_data_set_name, self._json_suffix
+                ),
             )
 
-            with open(file_path, "w") as schedules_file:
-                data_set_refresh_schedules_str = json.dumps(
-                    data_set_refresh_schedules, indent=4, default=str
-                )
-                schedules_file.write(data_set_refresh_schedules_str)
+            self._write_json(file_path, data_set_refresh_schedules)
             return file_path
 
         except self._qs_client.exceptions.ResourceNotFoundException as e:
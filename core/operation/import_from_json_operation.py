@@ -1,18 +1,51 @@
 import datetime
+import hashlib
 import json
-import os.path
-import time
 from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 
 from botocore.exceptions import ClientError
 
-from core.operation.baseoperation import (
-    DATA_SET_DIR,
-    DATA_SET_REFRESH_PROPS_SUFFIX,
-    TEMPLATE_DIR,
-    BaseOperation,
-)
-from core.util import recursively_replace_value
+from core.assets import open_assets
+from core.operation.baseoperation import BaseOperation
+from core.rewrite import KeyRewrite
+from core.serialization import dumps
+from core.util import Memoizer, run_concurrently
+from core.waiter import resource_deleted, wait_until
+
+# fields of a data set description (or of the create_data_set parameters) that are not
+# part of the data set definition itself
+DATA_SET_NON_DEFINITION_FIELDS = [
+    "Arn",
+    "AwsAccountId",
+    "DataSetId",
+    "CreatedTime",
+    "LastUpdatedTime",
+    "OutputColumns",
+    "ConsumedSpiceCapacityInBytes",
+]
+
+# the refresh schedule fields compared to decide whether a schedule needs updating
+REFRESH_SCHEDULE_FIELDS = ["ScheduleFrequency", "RefreshType"]
+
+# definition fields that update_data_set can change in place
+DATA_SET_UPDATABLE_FIELDS = [
+    "Name",
+    "PhysicalTableMap",
+    "LogicalTableMap",
+    "ImportMode",
+    "ColumnGroups",
+    "FieldFolders",
+    "RowLevelPermissionDataSet",
+    "RowLevelPermissionTagConfiguration",
+    "ColumnLevelPermissionRules",
+    "DataSetUsageConfiguration",
+    "DatasetParameters",
+    "PerformanceConfiguration",
+    "DataPrepConfiguration",
+    "SemanticModelConfiguration",
+]
 
 
 @dataclass
@@ -21,6 +54,19 @@ class DataSetResponse:
     data_set_id: str
 
 
+@dataclass
+class DataSetAssets:
+    """
+    A data set and its refresh properties and schedules, as read from the input assets.
+    """
+
+    definition: dict
+    refresh_properties: Optional[dict]
+    refresh_schedules: List[dict]
+    # the blank DataSourceArn values of the definition, found once for every namespace
+    data_source_arns: KeyRewrite
+
+
 class ImportFromJsonOperation(BaseOperation):
     """
     Imports a Quicksight template and all it's dependencies into Quicksight.
@@ -29,91 +75,273 @@ class ImportFromJsonOperation(BaseOperation):
     def __init__(
         self,
         template_name: str,
-        target_namespace: str,
-        data_source_arn: str,
+        target_namespace: Optional[str],
+        data_source_arn: Optional[str],
         input_dir: str,
         *args,
+        template_names: Optional[List[str]] = None,
+        targets: Optional[List[Tuple[str, str]]] = None,
+        max_workers: int = 1,
+        create_template: bool = True,
         **kwargs,
     ):
-        self._template_name = template_name
-        self._target_namespace = target_namespace
-        self._data_source_arn = data_source_arn
+        """
+        :param target_namespace: The namespace to import into, along with data_source_arn
+        (None when only targets are given)
+        :param template_names: Further templates to import alongside template_name
+        :param targets: Further (target namespace, data source ARN) pairs to import into
+        :param input_dir: The export directory, or a bundle of it, to import from
+        """
+        self._template_names = [template_name]
+        self._template_names.extend(
+            name for name in template_names or [] if name != template_name
+        )
+        if (target_namespace is None) != (data_source_arn is None):
+            raise ValueError(
+                "target_namespace and data_source_arn must be given together"
+            )
+        self._targets: List[Tuple[str, str]] = []
+        if target_namespace is not None and data_source_arn is not None:
+            self._targets.append((target_namespace, data_source_arn))
+        self._targets.extend(targets or [])
+        if not self._targets:
+            raise ValueError("At least one target namespace is required")
+        namespaces = [namespace for namespace, _ in self._targets]
+        duplicates = sorted({n for n in namespaces if namespaces.count(n) > 1})
+        if duplicates:
+            raise ValueError(
+                f"Namespaces targeted more than once: {', '.join(duplicates)}"
+            )
         self._input_dir = input_dir
+        self._assets = open_assets(input_dir)
+        self._templates: Memoizer[dict] = Memoizer()
+        self._max_workers = max_workers
+        self._create_template = create_template
         super().__init__(*args, **kwargs)
 
     def execute(self) -> dict:
-        # Read template file into dictionary
-        template_data = None
-        template_file = self._resolve_path(
-            self._input_dir, TEMPLATE_DIR, self._template_name + ".json"
+        try:
+            tasks, namespace_tasks = self._get_import_tasks()
+            results = run_concurrently(
+                tasks, max_workers=self._max_workers, fail_fast=True
+            )
+        finally:
+            self._assets.close()
+
+        namespaces: Dict[str, dict] = {}
+        for namespace, (template_labels, data_set_labels) in namespace_tasks.items():
+            template_results = {
+                template_name: results[template_labels[template_name]]
+                if template_name in template_labels
+                else None
+                for template_name in self._template_names
+            }
+            namespaces[namespace] = {
+                "data_sets": [results[label] for label in data_set_labels],
+                "templates": template_results,
+            }
+            if len(template_results) == 1:
+                # a single template import also reports its template on its own
+                namespaces[namespace]["template"] = next(
+                    iter(template_results.values())
+                )
+
+        result: dict = {"status": "success", "namespaces": namespaces}
+        if len(namespaces) == 1:
+            # a single namespace import also reports its results at the top level
+            result.update(next(iter(namespaces.values())))
+        return result
+
+    def _get_import_tasks(
+        self,
+    ) -> Tuple[
+        Dict[str, Callable[[], dict]], Dict[str, Tuple[Dict[str, str], List[str]]]
+    ]:
+        """
+        :return: The template and data set import tasks, and the labels of the tasks of
+        each namespace
+        """
+        # The asset files are read once, however many namespaces they are imported into.
+        # Only the data set configurations of the templates are needed up front: the
+        # (much larger) rest of a template is only parsed when the template is created.
+        # Templates often share placeholders, which resolve to the same data sets, so
+        # each distinct data set is only imported once.
+        data_set_assets: Dict[str, DataSetAssets] = {}
+        for template_name in self._template_names:
+            for dsc in self._assets.read_data_set_configurations(template_name):
+                placeholder = dsc["Placeholder"]
+                if placeholder not in data_set_assets:
+                    data_set_assets[placeholder] = self._read_data_set_assets(
+                        placeholder
+                    )
+
+        # A template only needs the data set placeholders, not the data sets
+        # themselves, so it is created (and waited on) alongside the data set imports.
+        # Each data set goes through its own pipeline, so they can be handled
+        # concurrently as well, for every namespace at once. Dashboards published
+        # straight from the template definition do not need the template at all.
+        tasks: Dict[str, Callable[[], dict]] = {}
+        namespace_tasks: Dict[str, Tuple[Dict[str, str], List[str]]] = {}
+        for namespace, data_source_arn in self._targets:
+            template_labels = {}
+            if self._create_template:
+                for template_name in self._template_names:
+                    template_id = namespace + "-" + template_name
+                    template_label = f"template {template_id}"
+                    tasks[template_label] = partial(
+                        self._import_template,
+                        template_name=template_name,
+                        template_id=template_id,
+                    )
+                    template_labels[template_name] = template_label
+
+            data_set_labels = []
+            for placeholder, assets in data_set_assets.items():
+                data_set_id = self._resolve_data_set_id_from_placeholder(
+                    placeholder=placeholder, namespace=namespace
+                )
+                data_set_label = f"data set {data_set_id}"
+                tasks[data_set_label] = partial(
+                    self._import_data_set,
+                    data_set_id=data_set_id,
+                    data_source_arn=data_source_arn,
+                    assets=assets,
+                )
+                data_set_labels.append(data_set_label)
+            namespace_tasks[namespace] = (template_labels, data_set_labels)
+
+        return tasks, namespace_tasks
+
+    def _read_data_set_assets(self, placeholder: str) -> DataSetAssets:
+        """
+        Reads the data set and its refresh properties and schedules (if any).
+        """
+        files = self._assets.read_data_set(placeholder)
+        return DataSetAssets(
+            definition=files.definition,
+            refresh_properties=files.refresh_properties,
+            refresh_schedules=files.refresh_schedules["RefreshSchedules"]
+            if files.refresh_schedules
+            else [],
+            data_source_arns=KeyRewrite(files.definition, ["DataSourceArn"]),
         )
-        with open(template_file) as template_file:
-            template_data = json.loads(template_file.read())
 
-        # create or update template
-        template_data["Name"] = self._target_namespace + "-" + self._template_name
-        template_data["TemplateId"] = template_data["Name"]
-        template_response = self._recreate_template_from_template_definition(
+    def _import_template(self, template_name: str, template_id: str) -> dict:
+        """
+        Creates or updates the template and waits for it to be built.
+        :return: The template id, ARN and version ARN
+        """
+        # each template is parsed once, however many namespaces it is imported into:
+        # only its top level fields are set, so a shallow copy is enough.
+        template_data = dict(
+            self._templates.get(
+                template_name, partial(self._assets.read_template, template_name)
+            )
+        )
+        template_data["Name"] = template_id
+        template_data["TemplateId"] = template_id
+        template_response = self._create_or_update_template_from_template_definition(
             template_definition=template_data
         )
+        return {
+            "id": template_response.template_id,
+            "arn": template_response.arn,
+            "version_arn": template_response.version_arn,
+        }
 
-        # for each data set id associated with the template
-        dataset_configurations = template_data["Definition"]["DataSetConfigurations"]
-        data_sets_created = []
-        for di in dataset_configurations:
-            # Read data set into dictionary
-            dataset = None
-            placeholder = di["Placeholder"]
-            dataset_filename = self._resolve_path(
-                self._input_dir, DATA_SET_DIR, placeholder + ".json"
-            )
-            with open(dataset_filename) as dataset_file:
-                dataset = json.loads(dataset_file.read())
-
-            # replace the blank datasource arn value in the data set dictionaries
-            recursively_replace_value(dataset, "DataSourceArn", self._data_source_arn)
-            # Remove fields that are not allowed
-            for i in ["OutputColumns", "ConsumedSpiceCapacityInBytes"]:
-                dataset.pop(i)
-
-            # Add required fields
-            dataset["AwsAccountId"] = self._aws_account_id
-            dataset["DataSetId"] = self._resolve_data_set_id_from_placeholder(
-                placeholder=placeholder, namespace=self._target_namespace
-            )
+    def _import_data_set(
+        self, data_set_id: str, data_source_arn: str, assets: DataSetAssets
+    ) -> dict:
+        """
+        Creates, updates or keeps the data set along with its refresh properties and
+        schedules.
+        :return: The data set id and ARN
+        """
+        # the assets are shared by every target namespace: the copy made by replacing the
+        # blank datasource arn values only copies the parts of the definition leading to
+        # them, and its top level, which is all that is modified below.
+        dataset = assets.data_source_arns.apply({"DataSourceArn": data_source_arn})
+        # Remove fields that are not allowed
+        for i in ["OutputColumns", "ConsumedSpiceCapacityInBytes"]:
+            dataset.pop(i)
+
+        # Add required fields
+        dataset["AwsAccountId"] = self._aws_account_id
+        dataset["DataSetId"] = data_set_id
+
+        # create, update or keep the dataset
+        ds_response = self._create_or_update_data_set(dataset_definition=dataset)
+        # bring the refresh properties and schedules in line with the files
+        self._reconcile_refresh_schedules(assets=assets, data_set_id=data_set_id)
 
-            data_set_id = dataset["DataSetId"]
-            # remove any associated refresh schedules
-            self._delete_refresh_schedules(data_set_id=data_set_id)
-            logical_data_set_name = dataset["Name"]
+        return {
+            "id": ds_response.data_set_id,
+            "arn": ds_response.arn,
+        }
 
-            # recreate dataset
-            ds_response = self._recreate_data_set(dataset_definition=dataset)
-            # recreate the schedule
-            self._create_refresh_schedule(
-                logical_data_set_name=logical_data_set_name, data_set_id=data_set_id
-            )
+    def _create_or_update_data_set(self, dataset_definition: dict) -> DataSetResponse:
+        """
+        Compares the data set definition with the live data set (if any) and only creates,
+        updates or recreates the data set when they differ.
+        :param dataset_definition:
+        :return: DataSet ARN and DataSet Id
+        """
+        data_set_id = dataset_definition["DataSetId"]
+        try:
+            live_data_set = self._describe_data_set(data_set_id=data_set_id)
+        except self._qs_client.exceptions.ResourceNotFoundException as e:
+            self._log.info(f"Data set ({data_set_id}) does not exist: creating it.")
+            return self._create_data_set(dataset_definition=dataset_definition)
+
+        desired = self._normalize_data_set(dataset_definition)
+        current = self._normalize_data_set(live_data_set)
+        changed_fields = {
+            k
+            for k in desired.keys() | current.keys()
+            if desired.get(k) != current.get(k)
+        }
 
-            data_sets_created.append(
-                {
-                    "id": ds_response.data_set_id,
-                    "arn": ds_response.arn,
-                }
+        if not changed_fields:
+            self._log.info(f"Data set ({data_set_id}) is unchanged: skipping it.")
+            return DataSetResponse(live_data_set["Arn"], data_set_id)
+
+        if changed_fields.issubset(DATA_SET_UPDATABLE_FIELDS):
+            self._log.info(
+                f"Data set ({data_set_id}) changed ({', '.join(sorted(changed_fields))}): "
+                f"updating it."
             )
+            return self._update_data_set(dataset_definition=dataset_definition)
 
+        self._log.info(
+            f"Data set ({data_set_id}) changed ({', '.join(sorted(changed_fields))}) in "
+            f"ways update_data_set does not support: recreating it."
+        )
+        return self._recreate_data_set(dataset_definition=dataset_definition)
+
+    def _normalize_data_set(self, data_set: dict) -> dict:
+        """
+        Reduces a data set definition or description to the fields that define it, so
+        that the definition read from disk can be compared with the live data set.
+        Empty values are dropped since the service omits some of them.
+        """
         return {
-            "status": "success",
-            "data_sets": data_sets_created,
-            "template": {
-                "id": template_response.template_id,
-                "arn": template_response.arn,
-                "version_arn": template_response.version_arn,
-            },
+            k: v
+            for k, v in data_set.items()
+            if k not in DATA_SET_NON_DEFINITION_FIELDS and v not in (None, {}, [])
         }
 
-    def _recreate_data_set(self, dataset_definition: dict):
+    def _update_data_set(self, dataset_definition: dict) -> DataSetResponse:
+        params = {
+            k: v
+            for k, v in dataset_definition.items()
+            if k in DATA_SET_UPDATABLE_FIELDS or k in ["AwsAccountId", "DataSetId"]
+        }
+        response = self._qs_client.update_data_set(**params)
+        return self._to_data_set_response(response, "update_data_set")
+
+    def _recreate_data_set(self, dataset_definition: dict) -> DataSetResponse:
         """
-        Create new or updates existing DataSet
+        Deletes the DataSet if it exists and creates it again
         :param dataset_definition:
         :return: DataSet ARN and DataSet Id
         """
@@ -130,7 +358,7 @@ class ImportFromJsonOperation(BaseOperation):
 
             # there can be some latency between the completion of the deletion command
             # and the complete backend deletion operation.
-            time.sleep(3)
+            self._wait_for_data_set_deleted(data_set_id=data_set_id)
             self._log.info(f"Deletion complete for {data_set_id}.")
 
         except self._qs_client.exceptions.ResourceNotFoundException as e:
@@ -138,11 +366,18 @@ class ImportFromJsonOperation(BaseOperation):
                 f"No deletion necessary: data set {data_set_id} does not exist."
             )
 
+        return self._create_data_set(dataset_definition=dataset_definition)
+
+    def _create_data_set(self, dataset_definition: dict) -> DataSetResponse:
         response = self._qs_client.create_data_set(**dataset_definition)
+        return self._to_data_set_response(response, "create_data_set")
+
+    def _to_data_set_response(self, response: dict, request: str) -> DataSetResponse:
+        data_set_id = response["DataSetId"]
         http_status = response["ResponseMetadata"]["HTTPStatusCode"]
         if http_status != 201 and http_status != 200:
             self._log.error(
-                f"Unexpected response from create_dataset request: "
+                f"Unexpected response from {request} request: "
                 f"data_set_id = {data_set_id}, http_status = {http_status}"
             )
             raise Exception(
@@ -150,38 +385,24 @@ class ImportFromJsonOperation(BaseOperation):
             )
         else:
             self._log.info(
-                f"Data set ({data_set_id}) created successfully: http_status = {http_status}"
+                f"Data set ({data_set_id}) {request} successful: http_status = {http_status}"
             )
 
             return DataSetResponse(response["Arn"], response["DataSetId"])
 
-    def _delete_refresh_schedules(self, data_set_id: str):
-        params = {
-            "AwsAccountId": self._aws_account_id,
-            "DataSetId": data_set_id,
-        }
-
-        # delete the refresh properties
-        try:
-            self._qs_client.delete_data_set_refresh_properties(**params)
-        except ClientError as e:
-            pass
-
-        # delete any pre-existing schedules
-        refresh_schedules = []
-
-        try:
-            response = self._qs_client.list_refresh_schedules(**params)
-            refresh_schedules = [x["ScheduleId"] for x in response["RefreshSchedules"]]
-
-        except self._qs_client.exceptions.ResourceNotFoundException:
-            pass
-
-        for schedule_id in refresh_schedules:
-            delete_params = {}
-            delete_params.update(params)
-            delete_params.update({"ScheduleId": schedule_id})
-            self._qs_client.delete_refresh_schedule(**delete_params)
+    def _wait_for_data_set_deleted(self, data_set_id: str) -> None:
+        wait_until(
+            resource_deleted(
+                partial(
+                    self._qs_client.describe_data_set,
+                    AwsAccountId=self._aws_account_id,
+                    DataSetId=data_set_id,
+                ),
+                not_found=self._qs_client.exceptions.ResourceNotFoundException,
+            ),
+            description=f"Deletion of data set ({data_set_id})",
+            config=self._waiter_config,
+        )
 
     def _get_schedule_start_after(self) -> datetime.datetime:
         # The API requires StartAfterDateTime to be in the future, but any
@@ -192,43 +413,87 @@ class ImportFromJsonOperation(BaseOperation):
             minutes=10
         )
 
-    def _create_refresh_schedule(self, logical_data_set_name: str, data_set_id: str):
+    def _resolve_schedule_id(self, data_set_id: str, schedule: dict) -> str:
+        """
+        :return: The exported ScheduleId of the schedule or, for files exported without
+        one, an id derived from the data set id and the schedule's content
+        """
+        if "ScheduleId" in schedule:
+            return schedule["ScheduleId"]
+        content = dumps(
+            {field: schedule.get(field) for field in REFRESH_SCHEDULE_FIELDS}
+        )
+        return (
+            data_set_id + "-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        )
+
+    def _reconcile_refresh_schedules(
+        self, assets: DataSetAssets, data_set_id: str
+    ) -> None:
+        """
+        Compares the refresh properties and schedules read from disk with the live ones
+        and only issues the calls needed to reconcile the differences. Schedules are
+        matched by their ScheduleId (see _resolve_schedule_id), so reordering the
+        schedules in the file does not change them.
+        """
         params = {
             "AwsAccountId": self._aws_account_id,
             "DataSetId": data_set_id,
         }
 
-        dataset_refresh_props_filename = self._resolve_path(
-            self._input_dir,
-            DATA_SET_DIR,
-            logical_data_set_name + DATA_SET_REFRESH_PROPS_SUFFIX + ".json",
-        )
+        desired_props = assets.refresh_properties
+        desired_schedules = {
+            self._resolve_schedule_id(data_set_id, schedule): schedule
+            for schedule in assets.refresh_schedules
+        }
 
-        if os.path.exists(dataset_refresh_props_filename):
-            with open(dataset_refresh_props_filename) as dataset_refresh_props:
-                props = {
-                    "DataSetRefreshProperties": json.loads(dataset_refresh_props.read())
-                }
-                props.update(params)
-                self._qs_client.put_data_set_refresh_properties(**props)
+        try:
+            current_props = self._qs_client.describe_data_set_refresh_properties(
+                **params
+            )["DataSetRefreshProperties"]
+        except ClientError as e:
+            # If the refresh properties don't exist an InvalidParameterException is thrown.
+            current_props = None
 
-        dataset_refresh_filename = self._resolve_path(
-            self._input_dir,
-            DATA_SET_DIR,
-            self._resolve_schedules_filename(logical_data_set_name),
-        )
+        # incremental refresh schedules need the refresh properties, so put them first
+        if desired_props is not None and desired_props != current_props:
+            self._qs_client.put_data_set_refresh_properties(
+                DataSetRefreshProperties=desired_props, **params
+            )
 
-        if os.path.exists(dataset_refresh_filename):
-            with open(dataset_refresh_filename) as dataset_refresh_file:
-                schedules = json.loads(dataset_refresh_file.read())["RefreshSchedules"]
-
-                for index, schedule in enumerate(schedules):
-                    start_after_datetime = self._get_schedule_start_after()
-                    schedule["ScheduleId"] = data_set_id + "-" + str(index)
-                    schedule["StartAfterDateTime"] = start_after_datetime
-                    schedule_params = {"Schedule": schedule}
-                    schedule_params.update(params)
-                    response = self._qs_client.create_refresh_schedule(
-                        **schedule_params
-                    )
-                    self._log.info(f"create_refresh_schedule_response={response}")
+        try:
+            response = self._qs_client.list_refresh_schedules(**params)
+            current_schedules = {
+                x["ScheduleId"]: x for x in response["RefreshSchedules"]
+            }
+        except self._qs_client.exceptions.ResourceNotFoundException:
+            current_schedules = {}
+
+        for schedule_id in current_schedules.keys() - desired_schedules.keys():
+            self._qs_client.delete_refresh_schedule(ScheduleId=schedule_id, **params)
+
+        for schedule_id, schedule in desired_schedules.items():
+            current_schedule = current_schedules.get(schedule_id)
+            if current_schedule is not None and all(
+                current_schedule.get(field) == schedule.get(field)
+                for field in REFRESH_SCHEDULE_FIELDS
+            ):
+                continue
+
+            # the schedules read from disk are shared by every target namespace
+            schedule = {
+                **schedule,
+                "ScheduleId": schedule_id,
+                "StartAfterDateTime": self._get_schedule_start_after(),
+            }
+            schedule_params: dict = {"Schedule": schedule}
+            schedule_params.update(params)
+            if current_schedule is None:
+                response = self._qs_client.create_refresh_schedule(**schedule_params)
+                self._log.info(f"create_refresh_schedule_response={response}")
+            else:
+                response = self._qs_client.update_refresh_schedule(**schedule_params)
+                self._log.info(f"update_refresh_schedule_response={response}")
+
+        if desired_props is None and current_props is not None:
+            self._qs_client.delete_data_set_refresh_properties(**params)
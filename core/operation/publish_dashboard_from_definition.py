@@ -0,0 +1,82 @@
+from typing import List
+
+from core.assets import open_assets
+from core.operation.publish_dashboard_from_template import (
+    PublishDashboardFromTemplateOperation,
+)
+
+# template definition fields that are also part of a dashboard definition. The others
+# (DataSetConfigurations, QueryExecutionOptions, TopicConfigurations) only apply to
+# templates.
+DASHBOARD_DEFINITION_FIELDS = [
+    "AnalysisDefaults",
+    "CalculatedFields",
+    "ColumnConfigurations",
+    "FilterGroups",
+    "Options",
+    "ParameterDeclarations",
+    "Sheets",
+    "StaticFiles",
+    "TooltipSheets",
+]
+
+
+class PublishDashboardFromDefinitionOperation(PublishDashboardFromTemplateOperation):
+    """
+    Publishes a Dashboard straight from an exported template definition, without
+    creating a Quicksight template first.
+    """
+
+    def __init__(
+        self,
+        template_name: str,
+        target_namespace: str,
+        input_dir: str,
+        *args,
+        **kwargs,
+    ):
+        """
+        :param input_dir: The export directory, or a bundle of it, holding the template
+        """
+        self._template_name = template_name
+        self._input_dir = input_dir
+        # the dashboard gets the id the imported template would have had
+        super().__init__(
+            target_namespace + "-" + template_name, target_namespace, *args, **kwargs
+        )
+
+    def get_data_set_placeholders(self) -> List[str]:
+        """
+        :return: The data set placeholders of the template definition, in order
+        """
+        assets = open_assets(self._input_dir)
+        try:
+            template = assets.read_template(self._template_name)
+        finally:
+            assets.close()
+        self._template_definition = template["Definition"]
+
+        return [
+            dsc["Placeholder"]
+            for dsc in self._template_definition["DataSetConfigurations"]
+        ]
+
+    def _get_dashboard_source(self, data_set_references: List[dict]) -> dict:
+        """
+        :param data_set_references: The data set ARN of each placeholder
+        :return: The template definition converted to a dashboard definition
+        """
+        definition = {
+            key: value
+            for key, value in self._template_definition.items()
+            if key in DASHBOARD_DEFINITION_FIELDS
+        }
+        # the visuals refer to data sets by placeholder, which becomes the identifier
+        definition["DataSetIdentifierDeclarations"] = [
+            {
+                "Identifier": reference["DataSetPlaceholder"],
+                "DataSetArn": reference["DataSetArn"],
+            }
+            for reference in data_set_references
+        ]
+        return {"Definition": definition}
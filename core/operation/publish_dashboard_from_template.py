@@ -1,8 +1,30 @@
 import json
-import time
-from typing import Optional
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set
 
 from core.operation.baseoperation import BaseOperation
+from core.serialization import dumps
+from core.util import run_concurrently
+from core.waiter import status_successful, wait_until
+
+DASHBOARD_READER_ACTIONS = [
+    "quicksight:DescribeDashboard",
+    "quicksight:ListDashboardVersions",
+    "quicksight:QueryDashboard",
+]
+
+
+@dataclass
+class DashboardResponse:
+    arn: str
+    version_arn: str
+    dashboard_id: str
+    created: bool = False
+
+    @property
+    def version_number(self) -> int:
+        return int(self.version_arn.rsplit("/", 1)[1])
 
 
 class PublishDashboardFromTemplateOperation(BaseOperation):
@@ -21,6 +43,7 @@ class PublishDashboardFromTemplateOperation(BaseOperation):
         dashboard_alias: Optional[str] = None,
         output_json: Optional[str] = None,
         *args,
+        max_workers: int = 1,
         **kwargs,
     ):
         self._dashboard_alias = dashboard_alias
@@ -31,101 +54,40 @@ class PublishDashboardFromTemplateOperation(BaseOperation):
         self._result_bucket = result_bucket
         self._result_key = result_key
         self._s3_client = s3_client
+        self._max_workers = max_workers
         super().__init__(*args, **kwargs)
 
     def execute(self) -> dict:
-        desc_template_params = {
-            "AwsAccountId": self._aws_account_id,
-            "TemplateId": self._template_id,
+        # None of the lookups depend on each other, so they are all made up front and
+        # side by side: a bad group name or a missing data set fails before the
+        # dashboard is touched.
+        lookups: Dict[str, Callable[[], Any]] = {
+            "placeholders": self.get_data_set_placeholders,
+            "namespace": self._get_namespace_arn,
+            "data sets": self._list_data_set_arns,
+            "group": partial(self._get_group_arn, self._group_name),
         }
-        template = self._qs_client.describe_template(**desc_template_params)["Template"]
-
-        namespace_params = {
-            "AwsAccountId": self._aws_account_id,
-            "Namespace": "default",
-        }
-        namespace_arn = self._qs_client.describe_namespace(**namespace_params)[
-            "Namespace"
-        ]["Arn"]
-
-        # extract the data source placeholders
-        dashboard_id = self._template_id
-        parameters: dict = {
-            "AwsAccountId": self._aws_account_id,
-            "Name": dashboard_id,
-            "DashboardId": dashboard_id,
-            "SourceEntity": {
-                "SourceTemplate": {"DataSetReferences": [], "Arn": template["Arn"]}
-            },
-        }
-
-        ds_references = parameters["SourceEntity"]["SourceTemplate"][
-            "DataSetReferences"
-        ]
+        results = run_concurrently(
+            lookups, max_workers=self._max_workers, fail_fast=True
+        )
+        namespace_arn = results["namespace"]
+        readers_group_arn = results["group"]
 
-        # for each data set config
-        for dsr in template["Version"]["DataSetConfigurations"]:
-            # resolve the dataset arn
-            placeholder = dsr["Placeholder"]
-            data_set_id = self._resolve_data_set_id_from_placeholder(
-                placeholder=placeholder, namespace=self._target_namespace
-            )
-            data_set = self._describe_data_set(data_set_id=data_set_id)
-            arn = data_set["Arn"]
-            # associate arn with placeholder key and add to references array
-            ds_references.append(
-                {
-                    "DataSetPlaceholder": placeholder,
-                    "DataSetArn": arn,
-                }
-            )
+        parameters = self.get_dashboard_params(
+            placeholders=results["placeholders"], existing_arns=results["data sets"]
+        )
 
         # publish dashboard
-        dashboard_arn, dashboard_id = self._recreate_dashboard(
+        dashboard_response = self._create_or_update_dashboard(
             dashboard_params=parameters
         )
-
-        # updating permissions while the dashboard is still being created fails
-        # with a ConflictException, so wait for creation to finish first.
-        self._wait_for_dashboard(dashboard_id=dashboard_id)
+        dashboard_arn = dashboard_response.arn
 
         # Grant permissions
-        # resolve readers group
-        readers_group_arn = self._qs_client.describe_group(
-            AwsAccountId=self._aws_account_id,
-            Namespace="default",
-            GroupName=self._group_name,
-        )["Group"]["Arn"]
-
-        qs_actions = [
-            "quicksight:DescribeDashboard",
-            "quicksight:ListDashboardVersions",
-            "quicksight:QueryDashboard",
-        ]
-        permissions_params = {
-            "AwsAccountId": self._aws_account_id,
-            "DashboardId": self._template_id,
-            "GrantPermissions": [
-                {
-                    "Actions": qs_actions,
-                    "Principal": namespace_arn,
-                },
-                {
-                    "Actions": qs_actions,
-                    "Principal": readers_group_arn,
-                },
-            ],
-        }
-
-        response = self._qs_client.update_dashboard_permissions(**permissions_params)
-        http_status = response["ResponseMetadata"]["HTTPStatusCode"]
-        if http_status != 202 and http_status != 200:
-            self._log.error(
-                f"Unexpected response from update_dashboard_permissions request: {http_status} "
-            )
-            raise Exception(
-                f"Unexpected response from trying to update_dashboard_permissions : {json.dumps(response, indent=4)} "
-            )
+        self.grant_missing_permissions(
+            dashboard_id=dashboard_response.dashboard_id,
+            principals=[namespace_arn, readers_group_arn],
+        )
 
         result = {
             "status": "success",
@@ -138,7 +100,7 @@ class PublishDashboardFromTemplateOperation(BaseOperation):
 
         if self._output_json:
             with open(self._output_json, "w") as output:
-                output.write(json.dumps(result))
+                output.write(dumps(result))
                 self._log.info(f"Output written to {self._output_json}")
 
         if self._result_bucket and self._result_key:
@@ -146,66 +108,205 @@ class PublishDashboardFromTemplateOperation(BaseOperation):
                 Bucket=self._result_bucket,
                 Key=self._result_key,
                 ContentType="application/json",
-                Body=json.dumps(result["dashboard_info"]),
+                Body=dumps(result["dashboard_info"]),
             )
 
         return result
 
-    def _recreate_dashboard(self, dashboard_params: dict) -> tuple[str, str]:
+    def get_data_set_placeholders(self) -> List[str]:
+        """
+        :return: The data set placeholders of the template, in order
+        """
+        desc_template_params = {
+            "AwsAccountId": self._aws_account_id,
+            "TemplateId": self._template_id,
+        }
+        template = self._qs_client.describe_template(**desc_template_params)["Template"]
+        self._template_arn = template["Arn"]
+        return [
+            dsc["Placeholder"] for dsc in template["Version"]["DataSetConfigurations"]
+        ]
+
+    def get_dashboard_params(
+        self, placeholders: List[str], existing_arns: Set[str]
+    ) -> dict:
+        """
+        :param placeholders: The data set placeholders (see get_data_set_placeholders)
+        :param existing_arns: The ARNs of the account's data sets
+        :return: The create_dashboard/update_dashboard parameters
+        """
+        data_set_arns = self._resolve_data_set_arns(
+            namespace=self._target_namespace,
+            placeholders=placeholders,
+            existing_arns=existing_arns,
+        )
+        ds_references = [
+            {
+                "DataSetPlaceholder": placeholder,
+                "DataSetArn": arn,
+            }
+            for placeholder, arn in data_set_arns.items()
+        ]
+
+        dashboard_id = self._template_id
+        parameters: dict = {
+            "AwsAccountId": self._aws_account_id,
+            "Name": dashboard_id,
+            "DashboardId": dashboard_id,
+        }
+        parameters.update(self._get_dashboard_source(data_set_references=ds_references))
+        return parameters
+
+    def _get_dashboard_source(self, data_set_references: List[dict]) -> dict:
         """
-        Creates new or recreates existing template.
+        :param data_set_references: The data set ARN of each placeholder
+        :return: The create_dashboard/update_dashboard parameters that define the dashboard
+        """
+        return {
+            "SourceEntity": {
+                "SourceTemplate": {
+                    "DataSetReferences": data_set_references,
+                    "Arn": self._template_arn,
+                }
+            }
+        }
+
+    def _create_or_update_dashboard(self, dashboard_params: dict) -> DashboardResponse:
+        """
+        Updates the dashboard in place (keeping its bookmarks, embed URLs and
+        permissions) or creates it if it does not exist yet. An updated dashboard's new
+        version is published once it has been built.
         :param dashboard_params:
-        :return: Dashboard ARN, Dashboard ID
+        :return: Dashboard ARN, Dashboard Version ARN, and the Dashboard ID
         """
-        try:
-            _ = self._qs_client.delete_dashboard(
-                AwsAccountId=dashboard_params["AwsAccountId"],
-                DashboardId=dashboard_params["DashboardId"],
-            )
-        except self._qs_client.exceptions.ResourceNotFoundException as e:
-            pass
+        dashboard_response = self.submit_dashboard(dashboard_params)
 
+        # updating permissions or publishing a version that is still being built fails
+        # with a ConflictException, so wait for the build to finish first.
+        self._wait_for_dashboard(dashboard_response)
+        self.publish_dashboard_version(dashboard_response)
+        return dashboard_response
+
+    def submit_dashboard(self, dashboard_params: dict) -> DashboardResponse:
+        """
+        Starts building a new version of the dashboard, creating the dashboard if it
+        does not exist yet. Does not wait for the build to finish.
+        :param dashboard_params:
+        :return: Dashboard ARN, Dashboard Version ARN, and the Dashboard ID
+        """
+        dashboard_id = dashboard_params["DashboardId"]
         try:
-            response = self._qs_client.create_dashboard(**dashboard_params)
-        except self._qs_client.exceptions.ResourceExistsException as e:
+            self._log.info(f"ready to update dashboard ({dashboard_id}) if exists.")
             response = self._qs_client.update_dashboard(**dashboard_params)
+            created = False
+        except self._qs_client.exceptions.ResourceNotFoundException as e:
+            self._log.info(f"dashboard ({dashboard_id}) not found: creating it.")
+            response = self._qs_client.create_dashboard(**dashboard_params)
+            created = True
+
         http_status = response["ResponseMetadata"]["HTTPStatusCode"]
         if http_status != 202 and http_status != 200:
             self._log.error(
-                f"Unexpected response from create_template request: {http_status} "
+                f"Unexpected response from create/update dashboard request: "
+                f"dashboard_id = {dashboard_id}, http_status = {http_status}"
             )
             raise Exception(
-                f"Unexpected response from trying to create/update template : {json.dumps(response, indent=4)} "
+                f"Unexpected response from trying to create/update dashboard : {json.dumps(response, indent=4)} "
             )
-        else:
-            return response["Arn"], response["DashboardId"]
 
-    # create_dashboard/update_dashboard return while the dashboard version is
-    # still building, so poll until it reaches a terminal status.
-    DASHBOARD_STATUS_POLL_INTERVAL_SECONDS = 3
-    DASHBOARD_STATUS_MAX_POLLS = 40
+        return DashboardResponse(
+            response["Arn"], response["VersionArn"], response["DashboardId"], created
+        )
 
-    def _wait_for_dashboard(self, dashboard_id: str) -> None:
+    def publish_dashboard_version(self, dashboard_response: DashboardResponse):
         """
-        Blocks until the dashboard version reaches a terminal status.
+        Makes a newly built version of an existing dashboard the published version.
+        The first version of a new dashboard is published automatically.
+        :param dashboard_response:
+        """
+        if dashboard_response.created:
+            return
+
+        self._qs_client.update_dashboard_published_version(
+            AwsAccountId=self._aws_account_id,
+            DashboardId=dashboard_response.dashboard_id,
+            VersionNumber=dashboard_response.version_number,
+        )
+        self._log.info(
+            f"Dashboard ({dashboard_response.dashboard_id}) version "
+            f"{dashboard_response.version_number} published"
+        )
+
+    def grant_missing_permissions(self, dashboard_id: str, principals: List[str]):
+        """
+        Grants the reader actions to each principal that does not have all of them yet.
         :param dashboard_id:
+        :param principals:
         """
-        for _ in range(self.DASHBOARD_STATUS_MAX_POLLS):
-            response = self._qs_client.describe_dashboard(
-                AwsAccountId=self._aws_account_id, DashboardId=dashboard_id
+        current_permissions = self._qs_client.describe_dashboard_permissions(
+            AwsAccountId=self._aws_account_id, DashboardId=dashboard_id
+        )["Permissions"]
+        current_actions: Dict[str, Set[str]] = {}
+        for permission in current_permissions:
+            current_actions.setdefault(permission["Principal"], set()).update(
+                permission["Actions"]
+            )
+
+        grants = []
+        for principal in principals:
+            missing_actions = [
+                action
+                for action in DASHBOARD_READER_ACTIONS
+                if action not in current_actions.get(principal, set())
+            ]
+            if missing_actions:
+                grants.append({"Actions": missing_actions, "Principal": principal})
+
+        if not grants:
+            self._log.info(f"Dashboard ({dashboard_id}) permissions already granted")
+            return
+
+        permissions_params = {
+            "AwsAccountId": self._aws_account_id,
+            "DashboardId": dashboard_id,
+            "GrantPermissions": grants,
+        }
+
+        response = self._qs_client.update_dashboard_permissions(**permissions_params)
+        http_status = response["ResponseMetadata"]["HTTPStatusCode"]
+        if http_status != 202 and http_status != 200:
+            self._log.error(
+                f"Unexpected response from update_dashboard_permissions request: {http_status} "
             )
-            status = response["Dashboard"]["Version"]["Status"]
-            if status.endswith("_SUCCESSFUL"):
-                return
-            if status.endswith("_FAILED"):
-                raise Exception(
-                    f"Dashboard ({dashboard_id}) failed to publish: status = {status}"
-                )
-            self._log.info(
-                f"Dashboard ({dashboard_id}) not ready yet: status = {status}"
+            raise Exception(
+                f"Unexpected response from trying to update_dashboard_permissions : {json.dumps(response, indent=4)} "
             )
-            time.sleep(self.DASHBOARD_STATUS_POLL_INTERVAL_SECONDS)
-        raise Exception(
-            f"Dashboard ({dashboard_id}) did not reach a terminal status after "
-            f"{self.DASHBOARD_STATUS_MAX_POLLS * self.DASHBOARD_STATUS_POLL_INTERVAL_SECONDS} seconds"
+
+    def _wait_for_dashboard(self, dashboard_response: DashboardResponse) -> None:
+        """
+        Blocks until the dashboard version reaches a terminal status.
+        :param dashboard_response:
+        """
+        dashboard_id = dashboard_response.dashboard_id
+        # create_dashboard/update_dashboard return while the dashboard version is
+        # still building, so poll until it reaches a terminal status.
+        wait_until(
+            status_successful(
+                partial(self.get_dashboard_version_status, dashboard_response),
+                description=f"Dashboard ({dashboard_id})",
+            ),
+            description=f"Publication of dashboard ({dashboard_id})",
+            config=self._waiter_config,
+        )
+
+    def get_dashboard_version_status(
+        self, dashboard_response: DashboardResponse
+    ) -> str:
+        # without a version number, describe_dashboard describes the published
+        # version rather than the one being built.
+        response = self._qs_client.describe_dashboard(
+            AwsAccountId=self._aws_account_id,
+            DashboardId=dashboard_response.dashboard_id,
+            VersionNumber=dashboard_response.version_number,
         )
+        return response["Dashboard"]["Version"]["Status"]
@@ -0,0 +1,192 @@
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from core.operation.baseoperation import BaseOperation
+from core.operation.publish_dashboard_from_template import (
+    DashboardResponse,
+    PublishDashboardFromTemplateOperation,
+)
+from core.serialization import dumps
+from core.util import ConcurrentTaskError, run_concurrently
+from core.waiter import Condition, status_successful, wait_until
+
+
+@dataclass
+class _InFlightDashboard:
+    publisher: PublishDashboardFromTemplateOperation
+    response: DashboardResponse
+    is_built: Condition
+    submitted_at: float
+
+
+class PublishDashboardsFromTemplatesOperation(BaseOperation):
+    """
+    Publishes a Dashboard for each of several templates. Every dashboard is submitted
+    before any of them is waited on, and a single polling loop then drives all of them.
+    """
+
+    def __init__(
+        self,
+        template_ids: List[str],
+        target_namespace: str,
+        group_name: str,
+        result_bucket: str,
+        result_key: str,
+        s3_client,
+        output_json: Optional[str] = None,
+        *args,
+        max_workers: int = 1,
+        **kwargs,
+    ):
+        self._template_ids = template_ids
+        self._target_namespace = target_namespace
+        self._group_name = group_name
+        self._output_json = output_json
+        self._result_bucket = result_bucket
+        self._result_key = result_key
+        self._s3_client = s3_client
+        self._max_workers = max_workers
+        super().__init__(*args, **kwargs)
+
+        # each dashboard is built by its own single dashboard operation, whose results
+        # are collected here rather than written out one by one.
+        self._publishers = {
+            template_id: PublishDashboardFromTemplateOperation(
+                template_id=template_id,
+                target_namespace=target_namespace,
+                group_name=group_name,
+                result_bucket="",
+                result_key="",
+                s3_client=s3_client,
+                qs_client=self._qs_client,
+                aws_account_id=self._aws_account_id,
+                waiter_config=self._waiter_config,
+            )
+            for template_id in template_ids
+        }
+
+    def execute(self) -> dict:
+        lookups: Dict[str, Callable[[], Any]] = {
+            f"template {template_id}": publisher.get_data_set_placeholders
+            for template_id, publisher in self._publishers.items()
+        }
+        lookups["namespace"] = self._get_namespace_arn
+        lookups["data sets"] = self._list_data_set_arns
+        lookups["group"] = partial(self._get_group_arn, self._group_name)
+        lookups_results = run_concurrently(
+            lookups, max_workers=self._max_workers, fail_fast=True
+        )
+        principals = [lookups_results["namespace"], lookups_results["group"]]
+
+        # every dashboard's data sets are resolved before any dashboard is touched, so
+        # that a missing data set does not leave the batch half published.
+        parameters = {
+            template_id: publisher.get_dashboard_params(
+                placeholders=lookups_results[f"template {template_id}"],
+                existing_arns=lookups_results["data sets"],
+            )
+            for template_id, publisher in self._publishers.items()
+        }
+
+        # submit every dashboard before waiting on any of them
+        submissions = run_concurrently(
+            {
+                f"dashboard {template_id}": partial(
+                    self._submit_dashboard,
+                    publisher=publisher,
+                    parameters=parameters[template_id],
+                )
+                for template_id, publisher in self._publishers.items()
+            },
+            max_workers=self._max_workers,
+            fail_fast=True,
+        )
+        in_flight = {
+            dashboard.response.dashboard_id: dashboard
+            for dashboard in submissions.values()
+        }
+
+        timings: Dict[str, float] = {}
+        failures: Dict[str, BaseException] = {}
+
+        def all_dashboards_done() -> bool:
+            for dashboard_id, dashboard in list(in_flight.items()):
+                try:
+                    if not dashboard.is_built():
+                        continue
+                    # a dashboard is finished off as soon as it has been built, rather
+                    # than once the whole batch is done.
+                    dashboard.publisher.publish_dashboard_version(dashboard.response)
+                    dashboard.publisher.grant_missing_permissions(
+                        dashboard_id=dashboard_id, principals=principals
+                    )
+                except Exception as e:
+                    # one failed dashboard does not stop the others being finished off
+                    self._log.error(f"Dashboard ({dashboard_id}) failed: {e}")
+                    failures[f"dashboard {dashboard_id}"] = e
+                else:
+                    timings[dashboard_id] = round(
+                        time.monotonic() - dashboard.submitted_at, 3
+                    )
+                    self._log.info(
+                        f"Dashboard ({dashboard_id}) published in {timings[dashboard_id]}s"
+                    )
+                del in_flight[dashboard_id]
+            return not in_flight
+
+        wait_until(
+            all_dashboards_done,
+            description=f"Publication of {len(in_flight)} dashboard(s)",
+            config=self._waiter_config,
+        )
+
+        if failures:
+            raise ConcurrentTaskError(failures)
+
+        result = {
+            "status": "success",
+            "dashboard_info": {
+                template_id: [submissions[f"dashboard {template_id}"].response.arn]
+                for template_id in self._template_ids
+            },
+            "timings": timings,
+        }
+
+        if self._output_json:
+            with open(self._output_json, "w") as output:
+                output.write(dumps(result))
+                self._log.info(f"Output written to {self._output_json}")
+
+        if self._result_bucket and self._result_key:
+            self._s3_client.put_object(
+                Bucket=self._result_bucket,
+                Key=self._result_key,
+                ContentType="application/json",
+                Body=dumps(result["dashboard_info"]),
+            )
+
+        return result
+
+    def _submit_dashboard(
+        self,
+        publisher: PublishDashboardFromTemplateOperation,
+        parameters: dict,
+    ) -> _InFlightDashboard:
+        """
+        Starts building the publisher's dashboard without waiting for it.
+        :param parameters: The dashboard's parameters (see get_dashboard_params)
+        :return: The dashboard being built and the condition met once it has been built
+        """
+        submitted_at = time.monotonic()
+        response = publisher.submit_dashboard(parameters)
+        return _InFlightDashboard(
+            publisher=publisher,
+            response=response,
+            is_built=status_successful(
+                partial(publisher.get_dashboard_version_status, response),
+                description=f"Dashboard ({response.dashboard_id})",
+            ),
+            submitted_at=submitted_at,
+        )
@@ -0,0 +1,306 @@
+import datetime
+import os
+import threading
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.manifest import ExportManifest
+from core.operation.baseoperation import (
+    ASSET_DIR,
+    DATA_SET_DIR,
+    EXPORT_MANIFEST_FILE,
+    TEMPLATE_DIR,
+    BaseOperation,
+)
+from core.operation.export_analysis_operation import ExportAnalysisOperation
+from core.serialization import PRETTY, load_json_file, to_canonical_json
+from core.util import ConcurrentTaskError, Memoizer, run_bounded, write_file_atomically
+
+# records when each exported resource was last updated, as of the previous sync
+SYNC_MANIFEST_FILE = os.path.join(ASSET_DIR, "sync-manifest.json")
+
+Task = Tuple[str, Callable[[], None]]
+
+
+class SyncAccountOperation(BaseOperation):
+    """
+    Mirrors every Quicksight Analysis in the account, and the data sets they use, to json
+    files on disk. Only the analyses and data sets whose LastUpdatedTime differs from the
+    one recorded by the previous sync are exported again.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        *args,
+        max_workers: int = 1,
+        max_pending: Optional[int] = None,
+        definition_only: bool = False,
+        json_format: str = PRETTY,
+        **kwargs,
+    ):
+        """
+        :param max_pending: The maximum number of exports queued at a time (defaults to
+        twice max_workers), which keeps memory use flat however large the account is
+        """
+        self._output_dir = output_dir
+        self._max_workers = max_workers
+        self._max_pending = max_pending or 2 * max_workers
+        self._definition_only = definition_only
+        self._json_format = json_format
+        self._export_manifest = ExportManifest(output_dir, EXPORT_MANIFEST_FILE)
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def execute(self) -> dict:
+        os.makedirs(self._resolve_path(self._output_dir, TEMPLATE_DIR), exist_ok=True)
+        os.makedirs(self._resolve_path(self._output_dir, DATA_SET_DIR), exist_ok=True)
+
+        manifest = self._read_manifest()
+        # data sets exported along with an analysis before this point are up to date,
+        # unless they are updated again while the sync runs.
+        sync_started = datetime.datetime.now(tz=datetime.timezone.utc)
+        errors: Dict[str, BaseException] = {}
+
+        analyses: Dict[str, dict] = {}
+        exported_analyses: List[str] = []
+        try:
+            run_bounded(
+                self._get_analysis_tasks(
+                    manifest["analyses"], analyses, exported_analyses
+                ),
+                max_workers=self._max_workers,
+                max_pending=self._max_pending,
+            )
+        except ConcurrentTaskError as e:
+            errors.update(e.errors)
+
+        data_sets: Dict[str, str] = {}
+        exported_data_sets: List[str] = []
+        try:
+            run_bounded(
+                self._get_data_set_tasks(
+                    manifest["data_sets"],
+                    analyses,
+                    exported_analyses,
+                    data_sets,
+                    exported_data_sets,
+                    sync_started,
+                ),
+                max_workers=self._max_workers,
+                max_pending=self._max_pending,
+            )
+        except ConcurrentTaskError as e:
+            errors.update(e.errors)
+
+        # the files of the analyses that are gone are removed, unless another analysis
+        # still exports them.
+        removed_analyses = sorted(manifest["analyses"].keys() - analyses.keys())
+        for analysis_id in removed_analyses:
+            self._export_manifest.set_analysis_files(analysis_id, [])
+
+        # failed exports keep their previous entries (if any), so they are retried by
+        # the next sync.
+        self._write_manifest({"analyses": analyses, "data_sets": data_sets})
+        self._export_manifest.save()
+        if errors:
+            raise ConcurrentTaskError(errors)
+
+        return {
+            "status": "success",
+            "analyses": {
+                "exported": exported_analyses,
+                "unchanged": len(analyses) - len(exported_analyses),
+                "removed": removed_analyses,
+            },
+            "data_sets": {
+                "exported": exported_data_sets,
+                "unchanged": len(data_sets) - len(exported_data_sets),
+            },
+            "bytes_transferred": self._bytes_received,
+        }
+
+    def _get_analysis_tasks(
+        self,
+        previous_analyses: Dict[str, dict],
+        analyses: Dict[str, dict],
+        exported_analyses: List[str],
+    ) -> Iterator[Task]:
+        """
+        Sweeps the account's analyses, recording the unchanged ones in analyses.
+        :return: An export task for each new or updated analysis
+        """
+        for summary in self._list_summaries("list_analyses", "AnalysisSummaryList"):
+            # deleted analyses are listed until they are purged
+            if summary.get("Status") == "DELETED":
+                continue
+
+            analysis_id = summary["AnalysisId"]
+            last_updated = summary["LastUpdatedTime"].isoformat()
+            previous = previous_analyses.get(analysis_id)
+            if previous is not None and previous["last_updated"] == last_updated:
+                with self._lock:
+                    analyses[analysis_id] = previous
+                continue
+
+            yield f"analysis {analysis_id}", partial(
+                self._export_analysis,
+                analysis_id=analysis_id,
+                last_updated=last_updated,
+                previous=previous,
+                analyses=analyses,
+                exported_analyses=exported_analyses,
+            )
+
+    def _export_analysis(
+        self,
+        analysis_id: str,
+        last_updated: str,
+        previous: Optional[dict],
+        analyses: Dict[str, dict],
+        exported_analyses: List[str],
+    ) -> None:
+        try:
+            export = self._create_export(analysis_id)
+            result = export.execute()
+        except BaseException:
+            if previous is not None:
+                with self._lock:
+                    analyses[analysis_id] = previous
+            raise
+
+        with self._lock:
+            analyses[analysis_id] = {
+                "last_updated": last_updated,
+                "data_sets": result["data_sets"],
+            }
+            exported_analyses.append(analysis_id)
+        with self._bytes_received_lock:
+            self._bytes_received += result["bytes_transferred"]
+
+    def _get_data_set_tasks(
+        self,
+        previous_data_sets: Dict[str, str],
+        analyses: Dict[str, dict],
+        exported_analyses: List[str],
+        data_sets: Dict[str, str],
+        exported_data_sets: List[str],
+        sync_started: datetime.datetime,
+    ) -> Iterator[Task]:
+        """
+        Sweeps the account's data sets, recording the unchanged ones in data_sets. Only
+        the data sets used by the analyses are mirrored.
+        :return: An export task for each new or updated data set
+        """
+        # every name a data set is exported with (analyses sharing a data set may name
+        # it differently), and an analysis that exports it with that name
+        data_set_owners: Dict[str, Dict[str, str]] = {}
+        for analysis_id, analysis in analyses.items():
+            for data_set_id, logical_data_set_name in analysis["data_sets"].items():
+                data_set_owners.setdefault(data_set_id, {}).setdefault(
+                    logical_data_set_name, analysis_id
+                )
+        exported_with_analysis = {
+            data_set_id
+            for analysis_id in exported_analyses
+            for data_set_id in analyses[analysis_id]["data_sets"]
+        }
+
+        for summary in self._list_summaries("list_data_sets", "DataSetSummaries"):
+            data_set_id = summary["DataSetId"]
+            if data_set_id not in data_set_owners:
+                continue
+
+            last_updated = summary["LastUpdatedTime"].isoformat()
+            previous = previous_data_sets.get(data_set_id)
+            if previous == last_updated or (
+                data_set_id in exported_with_analysis
+                and summary["LastUpdatedTime"] < sync_started
+            ):
+                with self._lock:
+                    data_sets[data_set_id] = last_updated
+                continue
+
+            yield f"data set {data_set_id}", partial(
+                self._export_data_set,
+                data_set_id=data_set_id,
+                owners=data_set_owners[data_set_id],
+                last_updated=last_updated,
+                previous=previous,
+                data_sets=data_sets,
+                exported_data_sets=exported_data_sets,
+            )
+
+    def _export_data_set(
+        self,
+        data_set_id: str,
+        owners: Dict[str, str],
+        last_updated: str,
+        previous: Optional[str],
+        data_sets: Dict[str, str],
+        exported_data_sets: List[str],
+    ) -> None:
+        """
+        Exports the data set on its own, as the analyses that use it would have: once
+        under each of the names they give it.
+        :param owners: An analysis exporting the data set under each of its names
+        """
+        # the data set is described once for all of its names, and the descriptions are
+        # let go of as soon as it has been exported.
+        lookup_cache: Memoizer = Memoizer()
+        try:
+            for logical_data_set_name, analysis_id in sorted(owners.items()):
+                export = self._create_export(analysis_id, lookup_cache=lookup_cache)
+                try:
+                    export.export_data_set(
+                        data_set_id=data_set_id,
+                        logical_data_set_name=logical_data_set_name,
+                    )
+                finally:
+                    with self._bytes_received_lock:
+                        self._bytes_received += export.bytes_received
+        except BaseException:
+            if previous is not None:
+                with self._lock:
+                    data_sets[data_set_id] = previous
+            raise
+
+        with self._lock:
+            data_sets[data_set_id] = last_updated
+            exported_data_sets.append(data_set_id)
+
+    def _create_export(
+        self, analysis_id: str, lookup_cache: Optional[Memoizer] = None
+    ) -> ExportAnalysisOperation:
+        return ExportAnalysisOperation(
+            qs_client=self._qs_client,
+            aws_account_id=self._aws_account_id,
+            waiter_config=self._waiter_config,
+            analysis_id=analysis_id,
+            output_dir=self._output_dir,
+            definition_only=self._definition_only,
+            json_format=self._json_format,
+            lookup_cache=lookup_cache,
+            manifest=self._export_manifest,
+        )
+
+    def _list_summaries(self, request: str, result_key: str) -> Iterator[dict]:
+        """
+        Streams the summaries of a paginated listing, one page at a time.
+        """
+        paginator = self._qs_client.get_paginator(request)
+        for page in paginator.paginate(AwsAccountId=self._aws_account_id):
+            self._record_response(page)
+            yield from page[result_key]
+
+    def _read_manifest(self) -> dict:
+        manifest_file = self._resolve_path(self._output_dir, SYNC_MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            return {"analyses": {}, "data_sets": {}}
+        return load_json_file(manifest_file)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        write_file_atomically(
+            self._resolve_path(self._output_dir, SYNC_MANIFEST_FILE),
+            to_canonical_json(manifest),
+        )
@@ -0,0 +1,78 @@
+import copy
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+# the keys and list indexes leading from the root of a document to a value
+Path = Tuple[Union[str, int], ...]
+
+
+class KeyRewrite:
+    """
+    The paths of every occurrence of some keys in a document, found by a single walk of
+    the document (lists included). Any number of rewritten copies of the document can
+    then be made without walking it again: only the objects and lists along the paths are
+    copied, and every other part of the document is shared with the original.
+    """
+
+    def __init__(self, document: Union[dict, list], keys: Iterable[str]):
+        """
+        :param document: The document to search
+        :param keys: The keys whose values may be replaced. The values of these keys are
+        not searched themselves, since they are replaced as a whole.
+        """
+        self._document = document
+        self._paths: Dict[str, List[Path]] = {key: [] for key in keys}
+        pending: List[Tuple[Path, Any]] = [((), document)]
+        while pending:
+            path, node = pending.pop()
+            if isinstance(node, dict):
+                children = node.items()
+            elif isinstance(node, list):
+                children = enumerate(node)  # type: ignore[assignment]
+            else:
+                continue
+
+            for step, child in children:
+                if isinstance(node, dict) and step in self._paths:
+                    self._paths[step].append(path + (step,))
+                elif isinstance(child, (dict, list)):
+                    pending.append((path + (step,), child))
+
+    @property
+    def paths(self) -> Dict[str, List[Path]]:
+        return self._paths
+
+    def apply(self, values: Dict[str, Any]) -> Any:
+        """
+        :param values: The new value of each key
+        :return: A copy of the document with the values of the keys replaced. The copy
+        shares the parts of the document that are not along a path, so they must not be
+        modified, while its root (and every object or list along a path) is its own.
+        """
+        for key in values:
+            if key not in self._paths:
+                raise ValueError(f"{key} is not one of the keys to rewrite")
+
+        root: Any = copy.copy(self._document)
+        # the copies made so far, by path, so that paths sharing a prefix share them
+        copies: Dict[Path, Any] = {(): root}
+        for key, value in values.items():
+            for path in self._paths[key]:
+                parent = root
+                for depth in range(1, len(path)):
+                    prefix = path[:depth]
+                    if prefix not in copies:
+                        copies[prefix] = copy.copy(parent[path[depth - 1]])
+                        parent[path[depth - 1]] = copies[prefix]
+                    parent = copies[prefix]
+                parent[path[-1]] = value
+        return root
+
+
+def rewrite_keys(document: Union[dict, list], values: Dict[str, Any]) -> Any:
+    """
+    Replaces the values of every occurrence of the keys in the document, in a single
+    walk of it.
+    :param values: The new value of each key
+    :return: The rewritten copy of the document (see KeyRewrite.apply)
+    """
+    return KeyRewrite(document, values.keys()).apply(values)
@@ -0,0 +1,267 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+from typing import IO, Any, List, Optional, Union, cast
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: the stdlib json module is used without it
+    orjson = None  # type: ignore[assignment]
+
+# indented, as the asset files have always been written
+PRETTY = "pretty"
+# without any whitespace
+COMPACT = "compact"
+# compact and gzip compressed
+GZIP = "gzip"
+JSON_FORMATS = [PRETTY, COMPACT, GZIP]
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# the file name suffix of each format: gzip compressed files are marked as such, so that
+# they are not mistaken for plain json by other tools.
+JSON_SUFFIX = ".json"
+GZIP_JSON_SUFFIX = ".json.gz"
+JSON_SUFFIXES = [JSON_SUFFIX, GZIP_JSON_SUFFIX]
+
+# the json module of the standard library
+STDLIB = "stdlib"
+# orjson (https://github.com/ijl/orjson), when it is installed
+ORJSON = "orjson"
+JSON_BACKENDS = [STDLIB, ORJSON]
+
+if orjson is not None:
+    # datetimes (and anything else orjson would serialize in its own way) are passed to
+    # the default function, so that they are written as str() writes them, exactly as
+    # the stdlib backend does.
+    _ORJSON_OPTIONS = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+_backend = ORJSON if orjson is not None else STDLIB
+
+
+def get_available_backends() -> List[str]:
+    return [STDLIB, ORJSON] if orjson is not None else [STDLIB]
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def set_backend(backend: str) -> None:
+    """
+    Selects the json backend. The fastest available backend is selected by default.
+    """
+    global _backend
+    if backend not in get_available_backends():
+        raise ValueError(f"The {backend} json backend is not available")
+    _backend = backend
+
+
+def to_canonical_json(data) -> str:
+    """
+    Serializes data with a stable key order, so that the same resource always produces
+    the same file (and the same content hash).
+    """
+    return json.dumps(data, indent=4, sort_keys=True, default=str)
+
+
+def json_file_suffix(json_format: str) -> str:
+    """
+    :return: The suffix of the files written in the format
+    """
+    return GZIP_JSON_SUFFIX if json_format == GZIP else JSON_SUFFIX
+
+
+def find_json_file(path: str) -> Optional[str]:
+    """
+    :param path: The path of a json file without its suffix
+    :return: The path of the file, in whichever format it was written (the most recently
+    written one if there are several), or None if there is none
+    """
+    candidates = [path + suffix for suffix in JSON_SUFFIXES]
+    existing = [candidate for candidate in candidates if os.path.exists(candidate)]
+    if not existing:
+        return None
+    return max(existing, key=os.path.getmtime)
+
+
+def dumps(data) -> str:
+    """
+    Serializes data as compact canonical json.
+    """
+    return _dumps_compact(data).decode("utf-8")
+
+
+def loads(content: Union[bytes, str]) -> Any:
+    if _backend == ORJSON:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the json module (it rejects NaN and Infinity):
+            # anything it rejects is left to the json module, which raises if the
+            # document is invalid after all.
+            pass
+    return json.loads(content)
+
+
+def dump_json(data, stream: IO[bytes], json_format: str = PRETTY) -> str:
+    """
+    Writes data to the binary stream as canonical json (see to_canonical_json) in the
+    given format. The json module streams the json without building the whole text in
+    memory first, while orjson serializes compact json in one go. Both backends write
+    exactly the same bytes.
+    :return: The sha256 of the json (before compression), computed as it is written.
+    Compact and gzip json hash their format too, so that each format hashes differently.
+    """
+    if json_format not in JSON_FORMATS:
+        raise ValueError(f"Unknown json format {json_format}")
+
+    if json_format != GZIP:
+        return _dump_to_stream(data, stream, json_format)
+
+    # no name or timestamp in the header, so that the same data always compresses to
+    # the same bytes
+    with gzip.GzipFile(
+        filename="", mode="wb", fileobj=stream, mtime=0
+    ) as compressed_stream:
+        return _dump_to_stream(data, cast(IO[bytes], compressed_stream), json_format)
+
+
+def open_decompressed(stream: IO[bytes]) -> IO[bytes]:
+    """
+    :param stream: A stream that supports peek, such as a file opened in binary mode
+    :return: The stream, decompressed if it is gzip compressed
+    """
+    if stream.peek(len(GZIP_MAGIC))[: len(GZIP_MAGIC)] == GZIP_MAGIC:  # type: ignore
+        return cast(IO[bytes], gzip.GzipFile(fileobj=stream, mode="rb"))
+    return stream
+
+
+def load_json(stream: IO[bytes]) -> Any:
+    """
+    Parses json written by dump_json, in any of its formats.
+    """
+    return loads(open_decompressed(stream).read())
+
+
+def load_json_file(path: str) -> Any:
+    with open(path, "rb") as file:
+        return load_json(file)
+
+
+def _dump_to_stream(data, stream: IO[bytes], json_format: str) -> str:
+    """
+    Writes the uncompressed json to the stream and hashes it.
+    """
+    output = _HashingWriter(stream)
+    if json_format != PRETTY:
+        # the other formats are part of the hash, so that changing formats rewrites the
+        # files (pretty files keep the hash of their text).
+        output.update(json_format.encode("utf-8") + b"\n")
+        content = _orjson_dumps_compact(data)
+        if content is not None:
+            output.write(content)
+            return output.hexdigest()
+
+    # the wrapper is detached rather than closed, which would close the caller's stream
+    text = io.TextIOWrapper(cast(IO[bytes], output), encoding="utf-8")
+    if json_format == PRETTY:
+        # orjson only indents by two spaces, so pretty json is always written by the
+        # json module, in the layout the asset files have always had.
+        json.dump(data, text, indent=4, sort_keys=True, default=str)
+    else:
+        json.dump(data, text, separators=(",", ":"), sort_keys=True, default=str)
+    text.flush()
+    text.detach()
+    return output.hexdigest()
+
+
+def _dumps_compact(data) -> bytes:
+    content = _orjson_dumps_compact(data)
+    if content is None:
+        content = json.dumps(
+            data, separators=(",", ":"), sort_keys=True, default=str
+        ).encode("utf-8")
+    return content
+
+
+def _orjson_dumps_compact(data) -> Optional[bytes]:
+    """
+    :return: The compact json written by orjson, or None if orjson is not the selected
+    backend or would not write exactly what the json module writes, so that the backend
+    never changes the content of a file (or its hash).
+    """
+    if _backend != ORJSON or not _has_plain_floats(data):
+        return None
+    try:
+        content = orjson.dumps(data, default=str, option=_ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        # e.g. integers that do not fit in 64 bits
+        return None
+    # orjson writes non-ASCII characters (and DEL) as they are, where the json module
+    # escapes them
+    if not content.isascii() or b"\x7f" in content:
+        return None
+    return content
+
+
+def _has_plain_floats(data) -> bool:
+    """
+    :return: False if data holds a float that orjson formats differently from the json
+    module: one with an exponent (e.g. 1e+16 or 1e-05, which orjson writes as 1e16 and
+    0.00001), NaN and Infinity (which orjson writes as null) and float subclasses.
+    """
+    pending: List[Any] = [[data]]
+    while pending:
+        node = pending.pop()
+        for value in node.values() if type(node) is dict else node:
+            value_type = type(value)
+            if value_type is str:
+                continue
+            if value_type is dict or value_type is list:
+                pending.append(value)
+            elif value_type is float:
+                text = repr(value)
+                if "e" in text or "n" in text:
+                    return False
+            elif isinstance(value, float):
+                return False
+            elif isinstance(value, (dict, list, tuple)):
+                pending.append(value)
+    return True
+
+
+class _HashingWriter(io.RawIOBase):
+    """
+    A binary stream that hashes what is written to it before passing it on to the
+    underlying stream.
+    """
+
+    def __init__(self, stream: IO[bytes]):
+        super().__init__()
+        self._stream = stream
+        self._hash = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, content) -> int:  # type: ignore[override]
+        self._hash.update(content)
+        self._stream.write(content)
+        return len(content)
+
+    def update(self, content: bytes) -> None:
+        """
+        Hashes content without writing it.
+        """
+        self._hash.update(content)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
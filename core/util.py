@@ -1,34 +1,219 @@
-from time import sleep
+import os
+import threading
+import uuid
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    CancelledError,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from functools import partial
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    Tuple,
+    TypeVar,
+)
 
+T = TypeVar("T")
 
-def retry(func) -> bool:
-    attempts = 5
-    attempt = 0
-    while True:
-        if func():
-            break
-        else:
-            attempt += 1
-            if attempt >= attempts:
-                raise Exception(f"Operation failed after {attempts}.")
-            sleep(1)
-            continue
 
-    return True
+class ConcurrentTaskError(Exception):
+    """
+    Raised when one or more tasks submitted to run_concurrently fail.
+    """
+
+    def __init__(self, errors: Dict[str, BaseException]):
+        self.errors = errors
+        details = "; ".join(f"{label}: {error!r}" for label, error in errors.items())
+        super().__init__(f"{len(errors)} task(s) failed: {details}")
+
+
+def run_concurrently(
+    tasks: Dict[str, Callable[[], T]], max_workers: int, fail_fast: bool = False
+) -> Dict[str, T]:
+    """
+    Runs each task on a bounded thread pool and waits for all of them to finish.
+    :param tasks: callables keyed by a label used for results and error reporting
+    :param max_workers: the maximum number of tasks to run at the same time
+    :param fail_fast: if a task fails, cancel the tasks that have not started yet
+    (tasks that are already running are allowed to finish)
+    :return: the task results keyed by label, in the order the tasks were given
+    :raises ConcurrentTaskError: if any task raised, with every failure keyed by label
+    """
+    failed = threading.Event()
+
+    def guard(task: Callable[[], T]) -> Callable[[], T]:
+        def run() -> T:
+            # a worker can pick up the next task before the failure is noticed below,
+            # so each task also checks for an earlier failure before it starts.
+            if fail_fast and failed.is_set():
+                raise CancelledError()
+            try:
+                return task()
+            except BaseException:
+                failed.set()
+                raise
+
+        return run
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {label: executor.submit(guard(task)) for label, task in tasks.items()}
+        if fail_fast:
+            wait(futures.values(), return_when=FIRST_EXCEPTION)
+            if failed.is_set():
+                for future in futures.values():
+                    future.cancel()
+    finally:
+        executor.shutdown(wait=True)
+
+    errors = {
+        label: future.exception()
+        for label, future in futures.items()
+        if not future.cancelled()
+        and future.exception() is not None
+        and not isinstance(future.exception(), CancelledError)
+    }
+    if errors:
+        raise ConcurrentTaskError(errors)  # type: ignore[arg-type]
+
+    return {label: future.result() for label, future in futures.items()}
+
+
+def run_bounded(
+    tasks: Iterable[Tuple[str, Callable[[], T]]], max_workers: int, max_pending: int
+) -> Dict[str, T]:
+    """
+    Like run_concurrently, but takes the tasks from an iterable lazily: no more than
+    max_pending tasks are queued or running at any time, so the tasks can be generated
+    from a stream (such as a paginated listing) without holding all of them in memory.
+    Every task is run even if some of them fail.
+    :param tasks: (label, callable) pairs
+    :param max_workers: the maximum number of tasks to run at the same time
+    :param max_pending: the maximum number of tasks queued or running at the same time
+    :return: the task results keyed by label, in the order the tasks finished
+    :raises ConcurrentTaskError: if any task raised, with every failure keyed by label
+    """
+    slots = threading.BoundedSemaphore(max(max_pending, max_workers, 1))
+    lock = threading.Lock()
+    results: Dict[str, T] = {}
+    errors: Dict[str, BaseException] = {}
+
+    def done(label: str, future: Future) -> None:
+        with lock:
+            error = future.exception()
+            if error is not None:
+                errors[label] = error
+            else:
+                results[label] = future.result()
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for label, task in tasks:
+            # blocks the producer until a queued task has finished
+            slots.acquire()
+            executor.submit(task).add_done_callback(partial(done, label))
+
+    if errors:
+        raise ConcurrentTaskError(errors)
+    return results
 
 
-def recursively_replace_value(mydict: dict, key: str, val: str):
+class Memoizer(Generic[T]):
     """
-    Recursively searches mydict for key and replaces its value (if any) with val
-    :param mydict:
-    :param key:
-    :param val:
-    :return:
+    A thread safe cache of computed values. When several threads ask for the same key at
+    once, only the first computes the value and the others wait for it. Failures are
+    cached as well, so they are raised to every caller.
     """
-    if key in mydict:
-        mydict[key] = val
 
-    for key2 in mydict:
-        value = mydict[key2]
-        if isinstance(value, dict):
-            recursively_replace_value(value, key, val)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+
+    def get(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """
+        :param key: identifies the value
+        :param compute: computes the value if it has not been computed yet
+        :return: the cached value
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if future is None:
+                future = self._futures[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+
+class AtomicFile:
+    """
+    A temporary file next to path, opened for writing, that is moved into place once it
+    has been written (unless it is discarded), so that readers (and concurrent writers)
+    never see a partially written file. The temporary file is removed if writing it fails.
+    """
+
+    def __init__(self, path: str):
+        # a unique name in the same directory, so that os.replace stays on one file
+        # system. (tempfile.mkstemp would also work, but creates the file readable by its
+        # owner only)
+        directory, filename = os.path.split(path)
+        self.path = path
+        self.temp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.tmp")
+        self._discarded = False
+
+    def __enter__(self) -> "AtomicFile":
+        self.file: IO[bytes] = open(self.temp_path, "xb")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self.file.close()
+            if exc_type is None and not self._discarded:
+                os.replace(self.temp_path, self.path)
+                return
+        except BaseException:
+            self._remove_temp_file()
+            raise
+        self._remove_temp_file()
+
+    def discard(self) -> None:
+        """
+        Leaves path as it is: the temporary file is removed rather than moved into place.
+        """
+        self._discarded = True
+
+    def _remove_temp_file(self) -> None:
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+
+@contextmanager
+def open_atomically(path: str) -> Iterator[IO[bytes]]:
+    """
+    Opens a temporary file next to path for writing, see AtomicFile.
+    """
+    with AtomicFile(path) as atomic_file:
+        yield atomic_file.file
+
+
+def write_file_atomically(path: str, content: str) -> None:
+    """
+    Writes the content to path, see open_atomically.
+    :param path:
+    :param content:
+    """
+    with open_atomically(path) as file:
+        file.write(content.encode("utf-8"))
@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Type
+
+log = logging.getLogger(__name__)
+
+# A condition is polled until it returns True. It may raise ResourceFailedError to
+# stop waiting early when the resource can no longer reach the desired state.
+Condition = Callable[[], bool]
+
+
+class ResourceFailedError(Exception):
+    """
+    Raised when a resource reaches a terminal state other than the one being waited for.
+    """
+
+
+class WaiterTimeoutError(Exception):
+    """
+    Raised when a condition is not met before the waiter times out.
+    """
+
+
+@dataclass(frozen=True)
+class WaiterConfig:
+    """
+    Controls how often a condition is polled and for how long.
+
+    The delay between polls starts at initial_delay and is multiplied by backoff after
+    each poll, up to max_delay. Each delay is reduced by a random amount of up to
+    jitter (a fraction of the delay) so that concurrent waiters do not poll in lockstep.
+    """
+
+    initial_delay: float = 0.5
+    max_delay: float = 10.0
+    backoff: float = 2.0
+    jitter: float = 0.5
+    timeout: float = 300.0
+
+
+DEFAULT_WAITER_CONFIG = WaiterConfig()
+
+
+def wait_until(
+    condition: Condition,
+    description: str,
+    config: WaiterConfig = DEFAULT_WAITER_CONFIG,
+) -> int:
+    """
+    Polls the condition, backing off exponentially, until it is met.
+    The condition is polled immediately, so resources that are already in the desired
+    state cost a single call.
+    :param condition: returns True once the wait is over
+    :param description: describes what is being waited for in logs and errors
+    :param config:
+    :return: the number of times the condition was polled
+    :raises WaiterTimeoutError: if the condition is not met within config.timeout seconds
+    """
+    deadline = time.monotonic() + config.timeout
+    delay = config.initial_delay
+    polls = 0
+    while True:
+        polls += 1
+        if condition():
+            log.debug(f"{description}: done after {polls} poll(s)")
+            return polls
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise WaiterTimeoutError(
+                f"{description}: not done after {config.timeout} seconds ({polls} polls)"
+            )
+
+        sleep_seconds = min(delay * (1 - config.jitter * random.random()), remaining)
+        log.debug(f"{description}: not done yet, polling again in {sleep_seconds:.2f}s")
+        time.sleep(sleep_seconds)
+        delay = min(delay * config.backoff, config.max_delay)
+
+
+def resource_deleted(
+    describe: Callable[[], object], not_found: Type[BaseException]
+) -> Condition:
+    """
+    :param describe: describes the resource
+    :param not_found: the exception raised by describe once the resource is gone
+    :return: a condition that is met once the resource can no longer be described
+    """
+
+    def condition() -> bool:
+        try:
+            describe()
+        except not_found:
+            return True
+        return False
+
+    return condition
+
+
+def status_successful(get_status: Callable[[], str], description: str) -> Condition:
+    """
+    Waits on Quicksight resource statuses such as CREATION_SUCCESSFUL or UPDATE_FAILED.
+    :param get_status: retrieves the current status of the resource
+    :param description: describes the resource in the error raised if it fails
+    :return: a condition that is met once the status is successful
+    """
+
+    def condition() -> bool:
+        status = get_status()
+        if status.endswith("_SUCCESSFUL"):
+            return True
+        if status.endswith("_FAILED"):
+            raise ResourceFailedError(f"{description} failed: status = {status}")
+        log.info(f"{description} not ready yet: status = {status}")
+        return False
+
+    return condition
@@ -146,6 +146,34 @@ def create_template_parameters(aws_account_id: str):
     }
 
 
+def describe_template_response():
+    return {
+        "ResponseMetadata": {
+            "RequestId": "0c6c4a5e-2f56-4f7a-a1c8-3cf5b6b3f6f4",
+            "HTTPStatusCode": 200,
+            "HTTPHeaders": {
+                "date": "Tue, 05 Sep 2023 21:59:50 GMT",
+                "content-type": "application/json",
+                "content-length": "1024",
+                "connection": "keep-alive",
+                "x-amzn-requestid": "0c6c4a5e-2f56-4f7a-a1c8-3cf5b6b3f6f4",
+            },
+            "RetryAttempts": 0,
+        },
+        "Status": 200,
+        "Template": {
+            "Arn": "arn:aws:quicksight:us-west-2:128682227026:template/library-template",
+            "Name": "library",
+            "TemplateId": "library-template",
+            "Version": {
+                "VersionNumber": 9,
+                "Status": "CREATION_SUCCESSFUL",
+            },
+        },
+        "RequestId": "0c6c4a5e-2f56-4f7a-a1c8-3cf5b6b3f6f4",
+    }
+
+
 def describe_template_definition_response():
     return {
         "ResponseMetadata": {
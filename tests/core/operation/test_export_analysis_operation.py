@@ -1,17 +1,27 @@
+import json
 import os
 import tempfile
+import threading
+from typing import Any, List
+from unittest.mock import MagicMock, patch
 
+import pytest
 from botocore.config import Config
 from botocore.session import Session
 from botocore.stub import Stubber
 
+from core.assets import DirectoryAssetReader, open_assets, write_bundle
+from core.operation.export_analyses_operation import ExportAnalysesOperation
 from core.operation.export_analysis_operation import ExportAnalysisOperation
+from core.serialization import GZIP, GZIP_MAGIC, PRETTY, dump_json
+from core.util import ConcurrentTaskError
 from tests.core.operation.analysis_test_responses import (
     create_template_response,
     describe_data_set_1_response,
     describe_data_set_2_response,
     describe_refresh_props_response,
     describe_template_definition_response,
+    describe_template_response,
     get_analysis_definition_response,
     get_analysis_description_response,
     list_refresh_schedules_response,
@@ -70,13 +80,10 @@ class TestExportAnalysisOperation:
                 },
             }
 
-            stub.add_response(
-                "delete_template",
-                service_response={},
-                expected_params={
-                    "TemplateId": "library-template",
-                    "AwsAccountId": account,
-                },
+            stub.add_client_error(
+                "update_template",
+                service_error_code="ResourceNotFoundException",
+                expected_params=create_template_params,
             )
 
             stub.add_response(
@@ -85,6 +92,16 @@ class TestExportAnalysisOperation:
                 expected_params=create_template_params,
             )
 
+            stub.add_response(
+                "describe_template",
+                service_response=describe_template_response(),
+                expected_params={
+                    "AwsAccountId": account,
+                    "TemplateId": "library-template",
+                    "VersionNumber": 9,
+                },
+            )
+
             stub.add_response(
                 "describe_template_definition",
                 service_response=describe_template_definition_response(),
@@ -151,6 +168,8 @@ class TestExportAnalysisOperation:
             results = op.execute()
 
         assert results["status"] == "success"
+        # the sum of the content-length headers of the stubbed responses
+        assert results["bytes_transferred"] == 355587
 
         assets_dir = os.path.join(output_dir, "assets")
         data_sets_dir = os.path.join(assets_dir, "data-sets")
@@ -171,3 +190,502 @@ class TestExportAnalysisOperation:
             circulation_events_refresh_schedule_file,
         ]:
             assert os.path.exists(p)
+
+
+def create_mocked_qs_client():
+    """
+    Returns a real quicksight client whose export related calls are mocked out,
+    so that the operation can be exercised from several threads at once.
+    """
+    sess = Session()
+    qs_client: Any = sess.create_client(
+        "quicksight", config=Config(region_name="us-east-1")
+    )
+    not_found = qs_client.exceptions.ResourceNotFoundException(
+        {"Error": {"Code": "ResourceNotFoundException"}}, "UpdateTemplate"
+    )
+    qs_client.describe_analysis = MagicMock(
+        return_value=get_analysis_description_response("my-quicksight-analysis-id")
+    )
+    qs_client.describe_analysis_definition = MagicMock(
+        return_value=get_analysis_definition_response()
+    )
+    qs_client.update_template = MagicMock(side_effect=not_found)
+    qs_client.create_template = MagicMock(return_value=create_template_response())
+    qs_client.describe_template = MagicMock(return_value=describe_template_response())
+    qs_client.describe_template_definition = MagicMock(
+        return_value=describe_template_definition_response()
+    )
+    qs_client.describe_data_set_refresh_properties = MagicMock(
+        return_value=describe_refresh_props_response()
+    )
+    qs_client.list_refresh_schedules = MagicMock(
+        side_effect=lambda **kwargs: list_refresh_schedules_response()
+    )
+    return qs_client
+
+
+class TestExportAnalysisOperationConcurrency:
+    def test_data_sets_are_exported_concurrently(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        barrier = threading.Barrier(2, timeout=5)
+        responses = {
+            "e9e15c78-0193-4e4c-9a49-ed005569297d": describe_data_set_1_response,
+            "86eb4ca5-9552-4ba6-8b1b-7ef1b9b40f78": describe_data_set_2_response,
+        }
+
+        def describe_data_set(AwsAccountId, DataSetId):
+            # both data sets must be in flight at the same time to pass the barrier
+            barrier.wait()
+            return responses[DataSetId]()
+
+        qs_client.describe_data_set = MagicMock(side_effect=describe_data_set)
+
+        results = ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+            max_workers=2,
+        ).execute()
+
+        data_sets_dir = os.path.join(output_dir, "assets", "data-sets")
+        assert results["files_exported"] == [
+            os.path.join(output_dir, "assets", "templates", "library.json"),
+            os.path.join(data_sets_dir, "circulation_view.json"),
+            os.path.join(data_sets_dir, "circulation_view-data-set-refresh-props.json"),
+            os.path.join(
+                data_sets_dir, "circulation_view-data-set-refresh-schedules.json"
+            ),
+            os.path.join(data_sets_dir, "patron_events.json"),
+            os.path.join(data_sets_dir, "patron_events-data-set-refresh-props.json"),
+            os.path.join(
+                data_sets_dir, "patron_events-data-set-refresh-schedules.json"
+            ),
+        ]
+
+    def test_data_set_failures_are_aggregated(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        qs_client.describe_data_set = MagicMock(side_effect=Exception("throttled"))
+
+        op = ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+            max_workers=2,
+        )
+
+        with pytest.raises(ConcurrentTaskError) as excinfo:
+            op.execute()
+
+        assert list(excinfo.value.errors) == [
+            "data set circulation_view",
+            "data set patron_events",
+        ]
+
+    def test_template_build_overlaps_data_set_export(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        data_set_described = threading.Event()
+
+        def describe_data_set(AwsAccountId, DataSetId):
+            data_set_described.set()
+            return describe_data_set_1_response()
+
+        def describe_template(**kwargs):
+            # the template is only reported as built once a data set export has
+            # started, which can only happen if the two run side by side.
+            assert data_set_described.wait(timeout=5)
+            return describe_template_response()
+
+        qs_client.describe_data_set = MagicMock(side_effect=describe_data_set)
+        qs_client.describe_template = MagicMock(side_effect=describe_template)
+
+        results = ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+            max_workers=2,
+        ).execute()
+
+        assert results["files_exported"][0] == os.path.join(
+            output_dir, "assets", "templates", "library.json"
+        )
+
+    def test_definition_only_export_skips_template_creation(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        definition_response = get_analysis_definition_response()
+        definition_response["Definition"]["TopicIdentifierDeclarations"] = [
+            {"Identifier": "topic", "TopicArn": "arn:aws:quicksight:::topic/topic"}
+        ]
+        qs_client.describe_analysis_definition = MagicMock(
+            return_value=definition_response
+        )
+        responses = {
+            "e9e15c78-0193-4e4c-9a49-ed005569297d": describe_data_set_1_response,
+            "86eb4ca5-9552-4ba6-8b1b-7ef1b9b40f78": describe_data_set_2_response,
+        }
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda AwsAccountId, DataSetId: responses[DataSetId]()
+        )
+
+        results = ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+            max_workers=2,
+            definition_only=True,
+        ).execute()
+
+        qs_client.update_template.assert_not_called()
+        qs_client.create_template.assert_not_called()
+        qs_client.describe_template.assert_not_called()
+        qs_client.describe_template_definition.assert_not_called()
+
+        template_file = os.path.join(output_dir, "assets", "templates", "library.json")
+        assert results["files_exported"][0] == template_file
+        with open(template_file) as file:
+            template = json.loads(file.read())
+
+        assert set(template) == {"Name", "Definition", "TemplateId"}
+        assert template["TemplateId"] == "library-template"
+        definition = template["Definition"]
+        assert "DataSetIdentifierDeclarations" not in definition
+        assert "TopicIdentifierDeclarations" not in definition
+        assert definition["AnalysisDefaults"]["DefaultNewSheetConfiguration"]
+        configurations = definition["DataSetConfigurations"]
+        assert [c["Placeholder"] for c in configurations] == [
+            "circulation_view",
+            "patron_events",
+        ]
+        assert configurations[1]["DataSetSchema"]["ColumnSchemaList"] == [
+            {"Name": "time_stamp", "DataType": "DATETIME"},
+            {"Name": "library_short_name", "DataType": "STRING"},
+            {"Name": "library_name", "DataType": "STRING"},
+            {"Name": "location", "DataType": "STRING"},
+            {"Name": "state", "DataType": "STRING"},
+            {"Name": "event_type", "DataType": "STRING"},
+        ]
+
+    def test_template_definition_is_fetched_once_after_build(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda **kwargs: describe_data_set_1_response()
+        )
+        in_progress = describe_template_response()
+        in_progress["Template"]["Version"]["Status"] = "CREATION_IN_PROGRESS"
+        qs_client.describe_template = MagicMock(
+            side_effect=[in_progress, in_progress, describe_template_response()]
+        )
+
+        with patch("core.waiter.time.sleep"):
+            ExportAnalysisOperation(
+                qs_client=qs_client,
+                analysis_id="my-quicksight-analysis-id",
+                output_dir=output_dir,
+                aws_account_id="012345678910",
+            ).execute()
+
+        assert qs_client.describe_template.call_count == 3
+        qs_client.describe_template_definition.assert_called_once()
+
+    def test_existing_template_is_updated_in_place(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = create_mocked_qs_client()
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda **kwargs: describe_data_set_1_response()
+        )
+        qs_client.update_template = MagicMock(return_value=create_template_response())
+
+        ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+        ).execute()
+
+        assert qs_client.update_template.call_args.kwargs["TemplateId"] == (
+            "library-template"
+        )
+        qs_client.create_template.assert_not_called()
+        qs_client.describe_template.assert_called_once_with(
+            AwsAccountId="012345678910", TemplateId="library-template", VersionNumber=9
+        )
+
+
+class TestExportAnalysisOperationManifest:
+    def export(self, qs_client, output_dir: str, json_format: str = PRETTY) -> dict:
+        return ExportAnalysisOperation(
+            qs_client=qs_client,
+            analysis_id="my-quicksight-analysis-id",
+            output_dir=output_dir,
+            aws_account_id="012345678910",
+            definition_only=True,
+            json_format=json_format,
+        ).execute()
+
+    def create_qs_client(self) -> Any:
+        qs_client = create_mocked_qs_client()
+        responses = {
+            "e9e15c78-0193-4e4c-9a49-ed005569297d": describe_data_set_1_response,
+            "86eb4ca5-9552-4ba6-8b1b-7ef1b9b40f78": describe_data_set_2_response,
+        }
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda AwsAccountId, DataSetId: responses[DataSetId]()
+        )
+        return qs_client
+
+    def test_unchanged_files_are_not_rewritten(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        first = self.export(self.create_qs_client(), output_dir)
+
+        assert sorted(first["files"]["changed"]) == sorted(first["files_exported"])
+        assert first["files"]["unchanged"] == []
+        manifest_file = os.path.join(output_dir, "assets", "export-manifest.json")
+        with open(manifest_file) as file:
+            manifest = json.loads(file.read())
+        assert len(manifest["files"]) == 7
+        assert len(manifest["analyses"]["my-quicksight-analysis-id"]) == 7
+
+        modified = {path: os.stat(path).st_mtime_ns for path in first["files_exported"]}
+        with patch("core.manifest.write_file_atomically") as write, patch(
+            "core.manifest.dump_json", wraps=dump_json
+        ) as dump:
+            second = self.export(self.create_qs_client(), output_dir)
+
+        # each file is serialized once, and only the manifest itself is written
+        assert dump.call_count == 7
+        write.assert_called_once()
+        assert write.call_args.args[0] == manifest_file
+        assert second["files"]["changed"] == []
+        assert sorted(second["files"]["unchanged"]) == sorted(first["files_exported"])
+        assert second["files"]["removed"] == []
+        assert {
+            path: os.stat(path).st_mtime_ns for path in second["files_exported"]
+        } == modified
+        # the temporary files the unchanged files were serialized to are gone
+        for path in second["files_exported"]:
+            assert not any(
+                name.endswith(".tmp") for name in os.listdir(os.path.dirname(path))
+            )
+
+    def test_files_changed_on_disk_are_rewritten(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        self.export(self.create_qs_client(), output_dir)
+        template_file = os.path.join(output_dir, "assets", "templates", "library.json")
+        with open(template_file) as file:
+            exported = file.read()
+        with open(template_file, "w") as file:
+            file.write(exported.replace("library-template", "edited-template"))
+
+        second = self.export(self.create_qs_client(), output_dir)
+
+        assert second["files"]["changed"] == [template_file]
+        with open(template_file) as file:
+            assert file.read() == exported
+
+    def test_files_recorded_by_hash_alone_are_rewritten_once(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        first = self.export(self.create_qs_client(), output_dir)
+        manifest_file = os.path.join(output_dir, "assets", "export-manifest.json")
+        with open(manifest_file) as file:
+            manifest = json.loads(file.read())
+        manifest["files"] = {
+            key: recorded["sha256"] for key, recorded in manifest["files"].items()
+        }
+        with open(manifest_file, "w") as file:
+            file.write(json.dumps(manifest))
+
+        second = self.export(self.create_qs_client(), output_dir)
+        third = self.export(self.create_qs_client(), output_dir)
+
+        assert sorted(second["files"]["changed"]) == sorted(first["files_exported"])
+        assert third["files"]["changed"] == []
+
+    def test_files_no_longer_exported_are_removed(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        self.export(self.create_qs_client(), output_dir)
+
+        # the analysis stops using its second data set
+        qs_client = self.create_qs_client()
+        definition_response = get_analysis_definition_response()
+        declarations = definition_response["Definition"][
+            "DataSetIdentifierDeclarations"
+        ]
+        dropped = declarations.pop()["Identifier"]
+        qs_client.describe_analysis_definition = MagicMock(
+            return_value=definition_response
+        )
+        result = self.export(qs_client, output_dir)
+
+        data_sets_dir = os.path.join(output_dir, "assets", "data-sets")
+        assert sorted(result["files"]["removed"]) == sorted(
+            os.path.join(data_sets_dir, dropped + suffix + ".json")
+            for suffix in [
+                "",
+                "-data-set-refresh-props",
+                "-data-set-refresh-schedules",
+            ]
+        )
+        # the template no longer uses the data set either
+        assert result["files"]["changed"] == [
+            os.path.join(output_dir, "assets", "templates", "library.json")
+        ]
+        assert not any(name.startswith(dropped) for name in os.listdir(data_sets_dir))
+
+    def test_gzip_exports_are_read_by_imports(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        pretty = self.export(self.create_qs_client(), output_dir)
+        pretty_size = sum(os.path.getsize(path) for path in pretty["files_exported"])
+
+        # changing formats rewrites every file, under a name of its own
+        result = self.export(self.create_qs_client(), output_dir, json_format=GZIP)
+        assert sorted(result["files"]["changed"]) == sorted(result["files_exported"])
+        assert sorted(result["files_exported"]) == sorted(
+            path + ".gz" for path in pretty["files_exported"]
+        )
+        assert sorted(result["files"]["removed"]) == sorted(pretty["files_exported"])
+        assert (
+            sum(os.path.getsize(path) for path in result["files_exported"])
+            < pretty_size / 2
+        )
+
+        for path in result["files_exported"]:
+            with open(path, "rb") as file:
+                assert file.read(2) == GZIP_MAGIC
+        assets = DirectoryAssetReader(output_dir)
+        placeholders = [
+            dsc["Placeholder"] for dsc in assets.read_data_set_configurations("library")
+        ]
+        assert placeholders == ["circulation_view", "patron_events"]
+        assert assets.read_template("library")["TemplateId"] == "library-template"
+        data_set = assets.read_data_set("circulation_view")
+        assert data_set.definition["Name"] == "circulation_view"
+        assert data_set.refresh_schedules is not None
+
+        bundle_file = os.path.join(output_dir, "assets.zip")
+        index = write_bundle(output_dir, bundle_file)
+        assert index["templates"] == {
+            "library": os.path.join("assets", "templates", "library.json.gz")
+        }
+        bundle = open_assets(bundle_file)
+        try:
+            assert bundle.read_data_set("circulation_view").refresh_schedules
+        finally:
+            bundle.close()
+
+
+class TestExportAnalysesOperation:
+    account = "012345678910"
+
+    def create_qs_client(self) -> Any:
+        qs_client = create_mocked_qs_client()
+        data_set_responses = {
+            "e9e15c78-0193-4e4c-9a49-ed005569297d": describe_data_set_1_response,
+            "86eb4ca5-9552-4ba6-8b1b-7ef1b9b40f78": describe_data_set_2_response,
+        }
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda **kwargs: data_set_responses[kwargs["DataSetId"]]()
+        )
+
+        def describe_analysis(**kwargs):
+            # both analyses use the same data sets, but have their own templates
+            response = get_analysis_description_response(kwargs["AnalysisId"])
+            response["Analysis"]["Name"] = kwargs["AnalysisId"]
+            return response
+
+        qs_client.describe_analysis = MagicMock(side_effect=describe_analysis)
+        qs_client.list_analyses = MagicMock(
+            return_value={
+                "AnalysisSummaryList": [
+                    {"AnalysisId": "library", "Name": "library"},
+                    {"AnalysisId": "circulation", "Name": "circulation"},
+                    {"AnalysisId": "scratch", "Name": "scratch"},
+                    {
+                        "AnalysisId": "library-old",
+                        "Name": "library-old",
+                        "Status": "DELETED",
+                    },
+                ]
+            }
+        )
+        return qs_client
+
+    def test_shared_data_sets_are_fetched_once(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = self.create_qs_client()
+
+        result = ExportAnalysesOperation(
+            qs_client=qs_client,
+            aws_account_id=self.account,
+            output_dir=output_dir,
+            analysis_ids=["library", "circulation"],
+            max_workers=2,
+            definition_only=True,
+        ).execute()
+
+        assert list(result["analyses"]) == ["library", "circulation"]
+        assert qs_client.describe_data_set.call_count == 2
+        assert qs_client.describe_data_set_refresh_properties.call_count == 2
+        assert qs_client.list_refresh_schedules.call_count == 2
+
+        templates_dir = os.path.join(output_dir, "assets", "templates")
+        data_sets_dir = os.path.join(output_dir, "assets", "data-sets")
+        assert sorted(os.listdir(templates_dir)) == ["circulation.json", "library.json"]
+        assert sorted(os.listdir(data_sets_dir)) == [
+            "circulation_view-data-set-refresh-props.json",
+            "circulation_view-data-set-refresh-schedules.json",
+            "circulation_view.json",
+            "patron_events-data-set-refresh-props.json",
+            "patron_events-data-set-refresh-schedules.json",
+            "patron_events.json",
+        ]
+        # the data set files are only reported once
+        assert len(result["files_exported"]) == 8
+        assert sorted(result["files"]["changed"]) == sorted(result["files_exported"])
+
+    @pytest.mark.parametrize(
+        "analysis_ids, export_workers",
+        [(["library"], [4]), (["library", "circulation", "scratch"], [1, 1, 1])],
+    )
+    def test_analyses_share_the_workers(
+        self, analysis_ids: List[str], export_workers: List[int]
+    ):
+        with patch(
+            "core.operation.export_analyses_operation.ExportAnalysisOperation",
+            wraps=ExportAnalysisOperation,
+        ) as export_analysis:
+            ExportAnalysesOperation(
+                qs_client=self.create_qs_client(),
+                aws_account_id=self.account,
+                output_dir=tempfile.NamedTemporaryFile().name,
+                analysis_ids=analysis_ids,
+                max_workers=4,
+                definition_only=True,
+            ).execute()
+
+        assert [
+            call.kwargs["max_workers"] for call in export_analysis.call_args_list
+        ] == export_workers
+
+    def test_analyses_are_selected_by_pattern(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = self.create_qs_client()
+
+        result = ExportAnalysesOperation(
+            qs_client=qs_client,
+            aws_account_id=self.account,
+            output_dir=output_dir,
+            analysis_ids=["circulation"],
+            analysis_pattern="lib*",
+            definition_only=True,
+        ).execute()
+
+        assert list(result["analyses"]) == ["circulation", "library"]
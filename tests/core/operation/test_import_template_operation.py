@@ -1,11 +1,27 @@
+import copy
 import datetime
-from unittest.mock import patch
-
+import os
+import tempfile
+import threading
+import zipfile
+from dataclasses import replace
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
 from botocore.config import Config
 from botocore.session import Session
 from botocore.stub import Stubber
 
+from core.assets import (
+    BUNDLE_INDEX,
+    BundleAssetReader,
+    DirectoryAssetReader,
+    open_assets,
+    write_bundle,
+)
 from core.operation.import_from_json_operation import ImportFromJsonOperation
+from core.util import ConcurrentTaskError
 
 
 def create_data_set_response(target_namespace, data_set_name):
@@ -222,13 +238,10 @@ class TestImportTemplateOperation:
         ) as dt:
 
             dt.return_value = schedule_start_after
-            stub.add_response(
-                "delete_template",
-                service_response={},
-                expected_params={
-                    "TemplateId": new_template_name,
-                    "AwsAccountId": account,
-                },
+            stub.add_client_error(
+                "update_template",
+                service_error_code="ResourceNotFoundException",
+                expected_params=create_template_params(target_namespace, account),
             )
 
             stub.add_response(
@@ -237,12 +250,44 @@ class TestImportTemplateOperation:
                 expected_params=create_template_params(target_namespace, account),
             )
 
+            stub.add_response(
+                "describe_template",
+                service_response={
+                    "Template": {"Version": {"Status": "CREATION_SUCCESSFUL"}}
+                },
+                expected_params={
+                    "TemplateId": new_template_name,
+                    "AwsAccountId": account,
+                    "VersionNumber": 4,
+                },
+            )
+
             ds1_name = create_new_dataset_name(
                 target_namespace=target_namespace, data_set_name="circulation_view"
             )
 
             stub.add_client_error(
-                "delete_data_set_refresh_properties",
+                "describe_data_set",
+                service_error_code="ResourceNotFoundException",
+                expected_params={
+                    "DataSetId": ds1_name,
+                    "AwsAccountId": account,
+                },
+            )
+
+            stub.add_response(
+                "create_data_set",
+                service_response=create_data_set_response(target_namespace, ds1_name),
+                expected_params=create_data_set_params1(
+                    target_namespace=target_namespace,
+                    data_source_arn=data_source_arn,
+                    aws_account_id=account,
+                ),
+            )
+
+            # if the refresh properties don't exist, an InvalidParameterException is thrown.
+            stub.add_client_error(
+                "describe_data_set_refresh_properties",
                 service_error_code="InvalidParameterException",
                 expected_params={
                     "DataSetId": ds1_name,
@@ -250,6 +295,15 @@ class TestImportTemplateOperation:
                 },
             )
 
+            stub.add_response(
+                "put_data_set_refresh_properties",
+                service_response={},
+                expected_params=create_data_set_refresh_properties_params(
+                    ds1_name, account
+                ),
+            )
+
+            # a schedule that is not in the schedules file is deleted
             schedule_id = "my_schedule_id"
             stub.add_response(
                 "list_refresh_schedules",
@@ -282,33 +336,6 @@ class TestImportTemplateOperation:
                 },
             )
 
-            stub.add_response(
-                "delete_data_set",
-                service_response={},
-                expected_params={
-                    "DataSetId": ds1_name,
-                    "AwsAccountId": account,
-                },
-            )
-
-            stub.add_response(
-                "create_data_set",
-                service_response=create_data_set_response(target_namespace, ds1_name),
-                expected_params=create_data_set_params1(
-                    target_namespace=target_namespace,
-                    data_source_arn=data_source_arn,
-                    aws_account_id=account,
-                ),
-            )
-
-            stub.add_response(
-                "put_data_set_refresh_properties",
-                service_response={},
-                expected_params=create_data_set_refresh_properties_params(
-                    ds1_name, account
-                ),
-            )
-
             stub.add_response(
                 "create_refresh_schedule",
                 service_response={},
@@ -316,7 +343,7 @@ class TestImportTemplateOperation:
                     "DataSetId": ds1_name,
                     "AwsAccountId": account,
                     "Schedule": {
-                        "ScheduleId": ds1_name + "-0",
+                        "ScheduleId": "daily-incremental-refresh",
                         "ScheduleFrequency": {
                             "Interval": "DAILY",
                             "Timezone": "UTC",
@@ -333,8 +360,8 @@ class TestImportTemplateOperation:
             )
 
             stub.add_client_error(
-                "delete_data_set_refresh_properties",
-                service_error_code="InvalidParameterException",
+                "describe_data_set",
+                service_error_code="ResourceNotFoundException",
                 expected_params={
                     "DataSetId": ds2_name,
                     "AwsAccountId": account,
@@ -342,8 +369,18 @@ class TestImportTemplateOperation:
             )
 
             stub.add_response(
-                "list_refresh_schedules",
-                service_response={"RefreshSchedules": []},
+                "create_data_set",
+                service_response=create_data_set_response(target_namespace, ds2_name),
+                expected_params=create_data_set_params2(
+                    target_namespace=target_namespace,
+                    data_source_arn=data_source_arn,
+                    aws_account_id=account,
+                ),
+            )
+
+            stub.add_client_error(
+                "describe_data_set_refresh_properties",
+                service_error_code="InvalidParameterException",
                 expected_params={
                     "DataSetId": ds2_name,
                     "AwsAccountId": account,
@@ -351,24 +388,14 @@ class TestImportTemplateOperation:
             )
 
             stub.add_response(
-                "delete_data_set",
-                service_response={},
+                "list_refresh_schedules",
+                service_response={"RefreshSchedules": []},
                 expected_params={
                     "DataSetId": ds2_name,
                     "AwsAccountId": account,
                 },
             )
 
-            stub.add_response(
-                "create_data_set",
-                service_response=create_data_set_response(target_namespace, ds2_name),
-                expected_params=create_data_set_params2(
-                    target_namespace=target_namespace,
-                    data_source_arn=data_source_arn,
-                    aws_account_id=account,
-                ),
-            )
-
             op = ImportFromJsonOperation(
                 qs_client=qs_client,
                 template_name=template_name,
@@ -380,3 +407,578 @@ class TestImportTemplateOperation:
 
             result = op.execute()
             assert result["status"] == "success"
+
+
+def create_mocked_qs_client(account: str) -> Any:
+    """
+    Returns a real quicksight client whose import related calls are mocked out.
+    Data sets do not exist unless describe_data_set is overridden.
+    """
+    qs_client: Any = Session().create_client(
+        "quicksight", config=Config(region_name="us-east-1")
+    )
+    not_found = qs_client.exceptions.ResourceNotFoundException(
+        {"Error": {"Code": "ResourceNotFoundException"}}, "Describe"
+    )
+    template_name = "my_env-library"
+    qs_client.update_template = MagicMock(
+        return_value=create_template_response(template_name)
+    )
+    qs_client.describe_template = MagicMock(
+        return_value={"Template": {"Version": {"Status": "UPDATE_SUCCESSFUL"}}}
+    )
+    qs_client.describe_data_set = MagicMock(side_effect=not_found)
+    qs_client.create_data_set = MagicMock(
+        side_effect=lambda **kwargs: create_data_set_response(
+            "my_env", kwargs["DataSetId"]
+        )
+    )
+    qs_client.update_data_set = MagicMock(
+        side_effect=lambda **kwargs: create_data_set_response(
+            "my_env", kwargs["DataSetId"]
+        )
+    )
+    qs_client.delete_data_set = MagicMock(return_value={})
+    qs_client.describe_data_set_refresh_properties = MagicMock(
+        side_effect=qs_client.exceptions.InvalidParameterValueException(
+            {"Error": {"Code": "InvalidParameterValueException"}}, "Describe"
+        )
+    )
+    qs_client.delete_data_set_refresh_properties = MagicMock(return_value={})
+    qs_client.list_refresh_schedules = MagicMock(return_value={"RefreshSchedules": []})
+    qs_client.put_data_set_refresh_properties = MagicMock(return_value={})
+    qs_client.create_refresh_schedule = MagicMock(return_value={})
+    qs_client.update_refresh_schedule = MagicMock(return_value={})
+    qs_client.delete_refresh_schedule = MagicMock(return_value={})
+    return qs_client
+
+
+def describe_live_data_set(data_set_params: dict) -> dict:
+    """
+    :return: the describe_data_set response for a data set created from data_set_params
+    """
+    data_set = copy.deepcopy(data_set_params)
+    data_set.pop("AwsAccountId")
+    data_set.update(
+        {
+            "Arn": f"arn:aws:quicksight:us-west-2:128682227026:dataset/{data_set['DataSetId']}",
+            "CreatedTime": datetime.datetime(2023, 9, 1, 10, 6, 19),
+            "LastUpdatedTime": datetime.datetime(2023, 9, 1, 10, 6, 19),
+            "OutputColumns": [{"Name": "time_stamp", "Type": "DATETIME"}],
+            "ConsumedSpiceCapacityInBytes": 0,
+        }
+    )
+    return {"DataSet": data_set}
+
+
+class TestImportTemplateOperationDataSetDiff:
+    account = "012345678910"
+    data_source_arn = "my_data_source_arn"
+
+    def import_with_live_data_sets(self, qs_client, live_data_sets: dict) -> dict:
+        not_found = qs_client.describe_data_set.side_effect
+
+        def describe_data_set(AwsAccountId, DataSetId):
+            if DataSetId in live_data_sets:
+                return describe_live_data_set(live_data_sets[DataSetId])
+            raise not_found
+
+        qs_client.describe_data_set = MagicMock(side_effect=describe_data_set)
+        qs_client.delete_data_set = MagicMock(
+            side_effect=lambda AwsAccountId, DataSetId: live_data_sets.pop(DataSetId)
+        )
+        return ImportFromJsonOperation(
+            qs_client=qs_client,
+            template_name="library",
+            target_namespace="my_env",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=self.account,
+            data_source_arn=self.data_source_arn,
+        ).execute()
+
+    def live_data_sets(self) -> dict:
+        return {
+            "my_env-circulation_view": create_data_set_params1(
+                "my_env", self.data_source_arn, self.account
+            ),
+            "my_env-patron_events": create_data_set_params2(
+                "my_env", self.data_source_arn, self.account
+            ),
+        }
+
+    def test_unchanged_data_sets_are_skipped(self):
+        qs_client = create_mocked_qs_client(self.account)
+
+        result = self.import_with_live_data_sets(qs_client, self.live_data_sets())
+
+        qs_client.create_data_set.assert_not_called()
+        qs_client.update_data_set.assert_not_called()
+        qs_client.delete_data_set.assert_not_called()
+        assert [ds["id"] for ds in result["data_sets"]] == [
+            "my_env-circulation_view",
+            "my_env-patron_events",
+        ]
+        assert result["data_sets"][1]["arn"] == (
+            "arn:aws:quicksight:us-west-2:128682227026:dataset/my_env-patron_events"
+        )
+
+    def test_mutable_changes_are_updated_in_place(self):
+        qs_client = create_mocked_qs_client(self.account)
+        live_data_sets = self.live_data_sets()
+        # the live data set points at another data source and has an outdated query
+        physical_table = live_data_sets["my_env-patron_events"]["PhysicalTableMap"][
+            "50873ea6-0c3a-4989-97e1-eb740e8a3348"
+        ]
+        physical_table["CustomSql"]["DataSourceArn"] = "another_data_source_arn"
+        physical_table["CustomSql"]["SqlQuery"] = "old sql query"
+
+        self.import_with_live_data_sets(qs_client, live_data_sets)
+
+        qs_client.create_data_set.assert_not_called()
+        qs_client.delete_data_set.assert_not_called()
+        qs_client.update_data_set.assert_called_once()
+        params = qs_client.update_data_set.call_args.kwargs
+        assert params["DataSetId"] == "my_env-patron_events"
+        assert params["AwsAccountId"] == self.account
+        assert (
+            params["PhysicalTableMap"]
+            == create_data_set_params2("my_env", self.data_source_arn, self.account)[
+                "PhysicalTableMap"
+            ]
+        )
+
+    def test_immutable_changes_recreate_the_data_set(self):
+        qs_client = create_mocked_qs_client(self.account)
+        live_data_sets = self.live_data_sets()
+        live_data_sets["my_env-circulation_view"]["UseAs"] = "RLS_RULES"
+
+        self.import_with_live_data_sets(qs_client, live_data_sets)
+
+        qs_client.update_data_set.assert_not_called()
+        qs_client.delete_data_set.assert_called_once_with(
+            DataSetId="my_env-circulation_view", AwsAccountId=self.account
+        )
+        qs_client.create_data_set.assert_called_once()
+
+
+class TestImportTemplateOperationRefreshSchedules:
+    account = "012345678910"
+    data_set_id = "my_env-circulation_view"
+
+    def reconcile(self, qs_client) -> None:
+        op = ImportFromJsonOperation(
+            qs_client=qs_client,
+            template_name="library",
+            target_namespace="my_env",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=self.account,
+            data_source_arn="my_data_source_arn",
+        )
+        op._reconcile_refresh_schedules(
+            assets=op._read_data_set_assets("circulation_view"),
+            data_set_id=self.data_set_id,
+        )
+
+    def live_schedule(self, **overrides) -> dict:
+        schedule = {
+            "ScheduleId": "daily-incremental-refresh",
+            "ScheduleFrequency": {
+                "Interval": "DAILY",
+                "Timezone": "UTC",
+                "TimeOfTheDay": "07:00",
+            },
+            "StartAfterDateTime": datetime.datetime(2023, 9, 1, 10, 6, 19),
+            "RefreshType": "INCREMENTAL_REFRESH",
+            "Arn": "arn:aws:quicksight:::refresh-schedule/my_env-circulation_view-0",
+        }
+        schedule.update(overrides)
+        return schedule
+
+    def test_matching_schedules_and_properties_are_left_alone(self):
+        qs_client = create_mocked_qs_client(self.account)
+        qs_client.describe_data_set_refresh_properties = MagicMock(
+            return_value={
+                "DataSetRefreshProperties": create_data_set_refresh_properties_params(
+                    self.data_set_id, self.account
+                )["DataSetRefreshProperties"]
+            }
+        )
+        qs_client.list_refresh_schedules = MagicMock(
+            return_value={"RefreshSchedules": [self.live_schedule()]}
+        )
+
+        self.reconcile(qs_client)
+
+        qs_client.put_data_set_refresh_properties.assert_not_called()
+        qs_client.delete_data_set_refresh_properties.assert_not_called()
+        qs_client.create_refresh_schedule.assert_not_called()
+        qs_client.update_refresh_schedule.assert_not_called()
+        qs_client.delete_refresh_schedule.assert_not_called()
+
+    def test_changed_schedules_are_updated_and_extra_ones_deleted(self):
+        qs_client = create_mocked_qs_client(self.account)
+        changed = self.live_schedule(RefreshType="FULL_REFRESH")
+        extra = self.live_schedule(ScheduleId="weekly-full-refresh")
+        qs_client.list_refresh_schedules = MagicMock(
+            return_value={"RefreshSchedules": [changed, extra]}
+        )
+
+        self.reconcile(qs_client)
+
+        qs_client.put_data_set_refresh_properties.assert_called_once()
+        qs_client.create_refresh_schedule.assert_not_called()
+        qs_client.delete_refresh_schedule.assert_called_once_with(
+            ScheduleId="weekly-full-refresh",
+            AwsAccountId=self.account,
+            DataSetId=self.data_set_id,
+        )
+        qs_client.update_refresh_schedule.assert_called_once()
+        schedule = qs_client.update_refresh_schedule.call_args.kwargs["Schedule"]
+        assert schedule["ScheduleId"] == "daily-incremental-refresh"
+        assert schedule["RefreshType"] == "INCREMENTAL_REFRESH"
+
+    def test_schedules_without_ids_are_matched_on_their_content(self):
+        op = ImportFromJsonOperation(
+            qs_client=create_mocked_qs_client(self.account),
+            template_name="library",
+            target_namespace="my_env",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=self.account,
+            data_source_arn="my_data_source_arn",
+        )
+        # schedules exported before their ids were kept
+        daily, hourly = [
+            {
+                "ScheduleFrequency": {"Interval": interval, "Timezone": "UTC"},
+                "RefreshType": "INCREMENTAL_REFRESH",
+            }
+            for interval in ["DAILY", "HOURLY"]
+        ]
+        assets = replace(
+            op._read_data_set_assets("circulation_view"),
+            refresh_schedules=[daily, hourly],
+        )
+        op._reconcile_refresh_schedules(assets=assets, data_set_id=self.data_set_id)
+        created = [
+            call.kwargs["Schedule"]
+            for call in op._qs_client.create_refresh_schedule.call_args_list
+        ]
+        assert len({schedule["ScheduleId"] for schedule in created}) == 2
+
+        # reordering the schedules leaves them alone
+        qs_client = create_mocked_qs_client(self.account)
+        qs_client.list_refresh_schedules = MagicMock(
+            return_value={"RefreshSchedules": created}
+        )
+        op._qs_client = qs_client
+        op._reconcile_refresh_schedules(
+            assets=replace(assets, refresh_schedules=[hourly, daily]),
+            data_set_id=self.data_set_id,
+        )
+
+        qs_client.create_refresh_schedule.assert_not_called()
+        qs_client.update_refresh_schedule.assert_not_called()
+        qs_client.delete_refresh_schedule.assert_not_called()
+
+
+class TestImportTemplateOperationConcurrency:
+    account = "012345678910"
+
+    def create_operation(self, qs_client, max_workers: int) -> ImportFromJsonOperation:
+        return ImportFromJsonOperation(
+            qs_client=qs_client,
+            template_name="library",
+            target_namespace="my_env",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=self.account,
+            data_source_arn="my_data_source_arn",
+            max_workers=max_workers,
+        )
+
+    def test_data_sets_are_imported_concurrently_in_order(self):
+        qs_client = create_mocked_qs_client(self.account)
+        barrier = threading.Barrier(2, timeout=5)
+        not_found = qs_client.describe_data_set.side_effect
+
+        def describe_data_set(**kwargs):
+            # both data sets must be in flight at the same time to pass the barrier
+            barrier.wait()
+            raise not_found
+
+        qs_client.describe_data_set = MagicMock(side_effect=describe_data_set)
+
+        result = self.create_operation(qs_client, max_workers=2).execute()
+
+        assert [ds["id"] for ds in result["data_sets"]] == [
+            "my_env-circulation_view",
+            "my_env-patron_events",
+        ]
+
+    def test_first_failure_cancels_outstanding_data_sets(self):
+        qs_client = create_mocked_qs_client(self.account)
+        qs_client.describe_data_set = MagicMock(side_effect=Exception("throttled"))
+
+        with pytest.raises(ConcurrentTaskError) as excinfo:
+            self.create_operation(qs_client, max_workers=1).execute()
+
+        assert list(excinfo.value.errors) == ["data set my_env-circulation_view"]
+        qs_client.describe_data_set.assert_called_once()
+
+    def test_template_build_overlaps_data_set_import(self):
+        qs_client = create_mocked_qs_client(self.account)
+        data_set_described = threading.Event()
+        not_found = qs_client.describe_data_set.side_effect
+
+        def describe_data_set(**kwargs):
+            data_set_described.set()
+            raise not_found
+
+        def describe_template(**kwargs):
+            # the template is only reported as built once a data set import has
+            # started, which can only happen if the two run side by side.
+            assert data_set_described.wait(timeout=5)
+            return {"Template": {"Version": {"Status": "UPDATE_SUCCESSFUL"}}}
+
+        qs_client.describe_data_set = MagicMock(side_effect=describe_data_set)
+        qs_client.describe_template = MagicMock(side_effect=describe_template)
+
+        result = self.create_operation(qs_client, max_workers=2).execute()
+
+        assert result["template"]["id"] == "my_env-library"
+        assert len(result["data_sets"]) == 2
+
+    def test_template_can_be_skipped(self):
+        qs_client = create_mocked_qs_client(self.account)
+
+        with patch.object(DirectoryAssetReader, "read_template") as read_template:
+            result = ImportFromJsonOperation(
+                qs_client=qs_client,
+                template_name="library",
+                target_namespace="my_env",
+                input_dir="tests/core/operation/resources",
+                aws_account_id=self.account,
+                data_source_arn="my_data_source_arn",
+                create_template=False,
+            ).execute()
+
+        assert result["template"] is None
+        assert len(result["data_sets"]) == 2
+        # only the data set configurations of the template were read
+        read_template.assert_not_called()
+        qs_client.update_template.assert_not_called()
+        qs_client.describe_template.assert_not_called()
+
+
+class TestImportTemplateOperationTargets:
+    account = "012345678910"
+    targets = [("tpp-dev", "dev_data_source_arn"), ("tpp-prod", "prod_data_source_arn")]
+
+    def test_assets_are_read_once_and_imported_into_every_namespace(self):
+        qs_client = create_mocked_qs_client(self.account)
+        qs_client.update_template = MagicMock(
+            side_effect=lambda **kwargs: create_template_response(kwargs["TemplateId"])
+        )
+
+        with patch("builtins.open", wraps=open) as open_mock:
+            result = ImportFromJsonOperation(
+                qs_client=qs_client,
+                template_name="library",
+                target_namespace=None,
+                data_source_arn=None,
+                targets=self.targets,
+                input_dir="tests/core/operation/resources",
+                aws_account_id=self.account,
+                max_workers=4,
+            ).execute()
+
+        # the template (scanned for its data sets, then parsed once for both
+        # namespaces), both data sets and the circulation_view refresh files
+        assert open_mock.call_count == 6
+
+        assert list(result["namespaces"]) == ["tpp-dev", "tpp-prod"]
+        for namespace, _ in self.targets:
+            namespace_result = result["namespaces"][namespace]
+            assert namespace_result["template"]["id"] == f"{namespace}-library"
+            assert [ds["id"] for ds in namespace_result["data_sets"]] == [
+                f"{namespace}-circulation_view",
+                f"{namespace}-patron_events",
+            ]
+        assert "template" not in result
+
+        data_source_arns = {
+            call.kwargs["DataSetId"]: call.kwargs["PhysicalTableMap"]
+            for call in qs_client.create_data_set.call_args_list
+        }
+        assert "dev_data_source_arn" in str(
+            data_source_arns["tpp-dev-circulation_view"]
+        )
+        assert "prod_data_source_arn" in str(
+            data_source_arns["tpp-prod-circulation_view"]
+        )
+
+    def test_a_target_is_required(self):
+        with pytest.raises(ValueError):
+            ImportFromJsonOperation(
+                qs_client=MagicMock(),
+                template_name="library",
+                target_namespace=None,
+                data_source_arn=None,
+                input_dir="tests/core/operation/resources",
+                aws_account_id=self.account,
+            )
+
+    def test_a_namespace_can_only_be_targeted_once(self):
+        with pytest.raises(ValueError) as excinfo:
+            ImportFromJsonOperation(
+                qs_client=MagicMock(),
+                template_name="library",
+                target_namespace="tpp-dev",
+                data_source_arn="data_source_arn",
+                targets=self.targets,
+                input_dir="tests/core/operation/resources",
+                aws_account_id=self.account,
+            )
+        assert "tpp-dev" in str(excinfo.value)
+
+
+class TestImportTemplateOperationMultipleTemplates:
+    account = "012345678910"
+
+    def test_shared_data_sets_are_imported_once(self):
+        qs_client = create_mocked_qs_client(self.account)
+        qs_client.update_template = MagicMock(
+            side_effect=lambda **kwargs: create_template_response(kwargs["TemplateId"])
+        )
+
+        result = ImportFromJsonOperation(
+            qs_client=qs_client,
+            template_name="library",
+            template_names=["circulation"],
+            target_namespace="my_env",
+            data_source_arn="my_data_source_arn",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=self.account,
+            max_workers=4,
+        ).execute()
+
+        # circulation_view is used by both templates but only imported once
+        created_data_set_ids = sorted(
+            call.kwargs["DataSetId"]
+            for call in qs_client.create_data_set.call_args_list
+        )
+        assert created_data_set_ids == [
+            "my_env-circulation_view",
+            "my_env-patron_events",
+        ]
+        assert [ds["id"] for ds in result["data_sets"]] == created_data_set_ids
+
+        assert {
+            name: template["id"] for name, template in result["templates"].items()
+        } == {"library": "my_env-library", "circulation": "my_env-circulation"}
+        assert "template" not in result
+        assert qs_client.update_template.call_count == 2
+
+
+class TestImportTemplateOperationBundle:
+    account = "012345678910"
+    input_dir = "tests/core/operation/resources"
+
+    def import_template(self, input_dir: str) -> tuple[dict, Any]:
+        qs_client = create_mocked_qs_client(self.account)
+        result = ImportFromJsonOperation(
+            qs_client=qs_client,
+            template_name="library",
+            target_namespace="my_env",
+            data_source_arn="my_data_source_arn",
+            input_dir=input_dir,
+            aws_account_id=self.account,
+        ).execute()
+        return result, qs_client
+
+    def test_bundle_index_maps_placeholders_to_members(self):
+        bundle_file = os.path.join(tempfile.mkdtemp(), "assets.zip")
+        index = write_bundle(self.input_dir, bundle_file)
+
+        assert index["templates"] == {
+            "circulation": "assets/templates/circulation.json",
+            "library": "assets/templates/library.json",
+        }
+        assert index["data_sets"] == {
+            "circulation_view": {
+                "definition": "assets/data-sets/circulation_view.json",
+                "refresh_properties": "assets/data-sets/"
+                "circulation_view-data-set-refresh-props.json",
+                "refresh_schedules": "assets/data-sets/"
+                "circulation_view-data-set-refresh-schedules.json",
+            },
+            "patron_events": {
+                "definition": "assets/data-sets/patron_events.json",
+                "refresh_properties": None,
+                "refresh_schedules": None,
+            },
+        }
+        with zipfile.ZipFile(bundle_file) as bundle:
+            # the index comes first, so it can be read without scanning the members
+            assert bundle.namelist()[0] == BUNDLE_INDEX
+            assert len(bundle.namelist()) == 7
+            assert all(
+                info.compress_type == zipfile.ZIP_DEFLATED for info in bundle.infolist()
+            )
+
+    def test_failed_bundle_leaves_the_previous_one(self):
+        bundle_dir = tempfile.mkdtemp()
+        bundle_file = os.path.join(bundle_dir, "assets.zip")
+        with open(bundle_file, "wb") as file:
+            file.write(b"previous")
+
+        with patch.object(zipfile.ZipFile, "write", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                write_bundle(self.input_dir, bundle_file)
+
+        # the partial bundle is removed
+        assert os.listdir(bundle_dir) == ["assets.zip"]
+        with open(bundle_file, "rb") as file:
+            assert file.read() == b"previous"
+
+    def test_bundle_imports_like_the_directory(self):
+        bundle_file = os.path.join(tempfile.mkdtemp(), "assets.zip")
+        write_bundle(self.input_dir, bundle_file)
+
+        with patch.object(
+            BundleAssetReader,
+            "_read_member",
+            autospec=True,
+            side_effect=BundleAssetReader._read_member,
+        ) as read_member:
+            bundle_result, bundle_client = self.import_template(bundle_file)
+        # both data sets and the circulation_view sidecars: the template is streamed
+        assert read_member.call_count == 4
+        directory_result, directory_client = self.import_template(self.input_dir)
+
+        assert bundle_result == directory_result
+        for request in [
+            "create_data_set",
+            "put_data_set_refresh_properties",
+            "create_refresh_schedule",
+            "update_template",
+        ]:
+            bundle_calls = getattr(bundle_client, request).call_args_list
+            directory_calls = getattr(directory_client, request).call_args_list
+            assert len(bundle_calls) == len(directory_calls) > 0
+            for bundle_call, directory_call in zip(bundle_calls, directory_calls):
+                bundle_kwargs = dict(bundle_call.kwargs)
+                directory_kwargs = dict(directory_call.kwargs)
+                # the schedules start a few minutes after they are created
+                if "Schedule" in bundle_kwargs:
+                    bundle_kwargs["Schedule"].pop("StartAfterDateTime")
+                    directory_kwargs["Schedule"].pop("StartAfterDateTime")
+                assert bundle_kwargs == directory_kwargs
+
+    def test_missing_template_is_reported(self):
+        bundle_file = os.path.join(tempfile.mkdtemp(), "assets.zip")
+        write_bundle(self.input_dir, bundle_file)
+
+        reader = open_assets(bundle_file)
+        with pytest.raises(FileNotFoundError):
+            reader.read_template("unknown")
+        reader.close()
@@ -1,15 +1,29 @@
 import json
 import os.path
 import tempfile
-from unittest.mock import patch
+import threading
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, patch
 
 import botocore
+import pytest
 from botocore.config import Config
+from botocore.session import Session
 from botocore.stub import Stubber
 
+from core.operation.baseoperation import DataSetNotFoundError
+from core.operation.publish_dashboard_from_definition import (
+    PublishDashboardFromDefinitionOperation,
+)
 from core.operation.publish_dashboard_from_template import (
+    DASHBOARD_READER_ACTIONS,
     PublishDashboardFromTemplateOperation,
 )
+from core.operation.publish_dashboards_from_templates import (
+    PublishDashboardsFromTemplatesOperation,
+)
+from core.util import ConcurrentTaskError
+from core.waiter import ResourceFailedError
 
 
 class TestPublishDashboardFromTemplateOperation:
@@ -81,37 +95,46 @@ class TestPublishDashboardFromTemplateOperation:
                 },
             )
 
-            ds1_arn = (
-                f"arn:aws:quicksight:::dataset/{target_namespace}-circulation_view"
-            )
-            ds2_arn = f"arn:aws:quicksight:::dataset/{target_namespace}-patron_events"
+            data_set_arn_prefix = f"arn:aws:quicksight:us-east-1:{account}:dataset"
+            ds1_arn = f"{data_set_arn_prefix}/{target_namespace}-circulation_view"
+            ds2_arn = f"{data_set_arn_prefix}/{target_namespace}-patron_events"
 
+            # the data set ARNs are verified with a single (paginated) sweep
             qs_stub.add_response(
-                "describe_data_set",
-                service_response={"DataSet": {"Arn": ds1_arn}},
-                expected_params={
-                    "AwsAccountId": account,
-                    "DataSetId": f"{target_namespace}-circulation_view",
+                "list_data_sets",
+                service_response={
+                    "DataSetSummaries": [
+                        {"Arn": f"{data_set_arn_prefix}/other"},
+                        {"Arn": ds2_arn},
+                    ],
+                    "NextToken": "page-2",
                 },
+                expected_params={"AwsAccountId": account},
             )
             qs_stub.add_response(
-                "describe_data_set",
-                service_response={"DataSet": {"Arn": ds2_arn}},
-                expected_params={
-                    "AwsAccountId": account,
-                    "DataSetId": f"{target_namespace}-patron_events",
-                },
+                "list_data_sets",
+                service_response={"DataSetSummaries": [{"Arn": ds1_arn}]},
+                expected_params={"AwsAccountId": account, "NextToken": "page-2"},
             )
 
+            group_arn = f"arn:aws:quicksight:::group/{group_name}"
             qs_stub.add_response(
-                "delete_dashboard",
-                service_response={},
+                "describe_group",
+                service_response={"Group": {"Arn": group_arn}},
                 expected_params={
                     "AwsAccountId": account,
-                    "DashboardId": template_id,
+                    "Namespace": "default",
+                    "GroupName": group_name,
                 },
             )
 
+            qs_stub.add_client_error(
+                "update_dashboard",
+                service_error_code="ResourceNotFoundException",
+                service_message="",
+                http_status_code=404,
+            )
+
             qs_stub.add_response(
                 "create_dashboard",
                 service_response={
@@ -169,17 +192,16 @@ class TestPublishDashboardFromTemplateOperation:
                     expected_params={
                         "AwsAccountId": account,
                         "DashboardId": template_id,
+                        "VersionNumber": 6,
                     },
                 )
 
-            group_arn = f"arn:aws:quicksight:::group/{group_name}"
             qs_stub.add_response(
-                "describe_group",
-                service_response={"Group": {"Arn": group_arn}},
+                "describe_dashboard_permissions",
+                service_response={"Permissions": []},
                 expected_params={
                     "AwsAccountId": account,
-                    "Namespace": "default",
-                    "GroupName": group_name,
+                    "DashboardId": template_id,
                 },
             )
 
@@ -231,7 +253,9 @@ class TestPublishDashboardFromTemplateOperation:
                     "Bucket": result_bucket,
                     "Key": result_key,
                     "ContentType": "application/json",
-                    "Body": json.dumps({template_id: [dashboard_arn]}),
+                    "Body": json.dumps(
+                        {template_id: [dashboard_arn]}, separators=(",", ":")
+                    ),
                 },
             )
 
@@ -247,9 +271,7 @@ class TestPublishDashboardFromTemplateOperation:
                 result_key=result_key,
             )
 
-            with patch(
-                "core.operation.publish_dashboard_from_template.time.sleep"
-            ) as sleep_mock:
+            with patch("core.waiter.time.sleep") as sleep_mock:
                 result = op.execute()
 
             sleep_mock.assert_called_once()
@@ -263,3 +285,442 @@ class TestPublishDashboardFromTemplateOperation:
                 assert result_from_file["dashboard_info"] == {
                     template_id: [dashboard_arn]
                 }
+
+
+DATA_SET_ARN_PREFIX = "arn:aws:quicksight:us-east-1:012345678910:dataset"
+
+
+def create_mocked_qs_client(dashboard_id: str) -> Any:
+    """
+    Returns a real quicksight client whose publish related calls are mocked out.
+    The dashboard does not exist unless update_dashboard is overridden.
+    """
+    dashboard_arn = f"arn:aws:quicksight:::dashboard/{dashboard_id}"
+    qs_client: Any = Session().create_client(
+        "quicksight", config=Config(region_name="us-east-1")
+    )
+    qs_client.describe_template = MagicMock(
+        return_value={
+            "Template": {
+                "Arn": f"arn:aws:quicksight:::template/{dashboard_id}",
+                "Version": {
+                    "DataSetConfigurations": [
+                        {"Placeholder": "circulation_view"},
+                        {"Placeholder": "patron_events"},
+                    ]
+                },
+            }
+        }
+    )
+    qs_client.describe_namespace = MagicMock(
+        return_value={"Namespace": {"Arn": "arn:quicksight:::namespace/default"}}
+    )
+    qs_client.list_data_sets = MagicMock(
+        return_value={
+            "DataSetSummaries": [
+                {"Arn": f"{DATA_SET_ARN_PREFIX}/my_env-circulation_view"},
+                {"Arn": f"{DATA_SET_ARN_PREFIX}/my_env-patron_events"},
+            ]
+        }
+    )
+    qs_client.update_dashboard = MagicMock(
+        side_effect=qs_client.exceptions.ResourceNotFoundException(
+            {"Error": {"Code": "ResourceNotFoundException"}}, "UpdateDashboard"
+        )
+    )
+    qs_client.create_dashboard = MagicMock(
+        return_value={
+            "ResponseMetadata": {"HTTPStatusCode": 202},
+            "Arn": dashboard_arn,
+            "VersionArn": f"{dashboard_arn}/version/1",
+            "DashboardId": dashboard_id,
+        }
+    )
+    qs_client.describe_dashboard = MagicMock(
+        return_value={"Dashboard": {"Version": {"Status": "CREATION_SUCCESSFUL"}}}
+    )
+    qs_client.update_dashboard_published_version = MagicMock(return_value={})
+    qs_client.describe_group = MagicMock(
+        return_value={"Group": {"Arn": "arn:aws:quicksight:::group/my_group"}}
+    )
+    qs_client.describe_dashboard_permissions = MagicMock(
+        return_value={"Permissions": []}
+    )
+    qs_client.update_dashboard_permissions = MagicMock(
+        return_value={"ResponseMetadata": {"HTTPStatusCode": 200}}
+    )
+    return qs_client
+
+
+class TestPublishDashboardFromDefinitionOperation:
+    def test_dashboard_is_created_from_the_template_definition(self):
+        account = "012345678910"
+        dashboard_id = "my_env-library"
+        dashboard_arn = f"arn:aws:quicksight:::dashboard/{dashboard_id}"
+        qs_client = create_mocked_qs_client(dashboard_id)
+
+        result = PublishDashboardFromDefinitionOperation(
+            qs_client=qs_client,
+            s3_client=MagicMock(),
+            template_name="library",
+            target_namespace="my_env",
+            input_dir="tests/core/operation/resources",
+            aws_account_id=account,
+            group_name="my_group",
+            result_bucket="",
+            result_key="",
+        ).execute()
+
+        assert result["dashboard_info"] == {dashboard_id: [dashboard_arn]}
+        qs_client.describe_template.assert_not_called()
+
+        create_params = qs_client.create_dashboard.call_args.kwargs
+        assert create_params["DashboardId"] == dashboard_id
+        assert "SourceEntity" not in create_params
+        definition = create_params["Definition"]
+        assert "DataSetConfigurations" not in definition
+        assert definition["DataSetIdentifierDeclarations"] == [
+            {
+                "Identifier": "circulation_view",
+                "DataSetArn": f"{DATA_SET_ARN_PREFIX}/my_env-circulation_view",
+            },
+            {
+                "Identifier": "patron_events",
+                "DataSetArn": f"{DATA_SET_ARN_PREFIX}/my_env-patron_events",
+            },
+        ]
+        assert "Sheets" in definition
+        assert "AnalysisDefaults" in definition
+
+
+class TestPublishDashboardInPlace:
+    account = "012345678910"
+    dashboard_id = "my_env-library"
+    dashboard_arn = f"arn:aws:quicksight:::dashboard/{dashboard_id}"
+    namespace_arn = "arn:quicksight:::namespace/default"
+    group_arn = "arn:aws:quicksight:::group/my_group"
+
+    def publish(self, qs_client) -> dict:
+        return PublishDashboardFromTemplateOperation(
+            qs_client=qs_client,
+            s3_client=MagicMock(),
+            template_id=self.dashboard_id,
+            target_namespace="my_env",
+            aws_account_id=self.account,
+            group_name="my_group",
+            result_bucket="",
+            result_key="",
+        ).execute()
+
+    def test_existing_dashboard_is_updated_and_new_version_published(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        qs_client.update_dashboard = MagicMock(
+            return_value={
+                "ResponseMetadata": {"HTTPStatusCode": 202},
+                "Arn": self.dashboard_arn,
+                "VersionArn": f"{self.dashboard_arn}/version/7",
+                "DashboardId": self.dashboard_id,
+            }
+        )
+
+        result = self.publish(qs_client)
+
+        assert result["dashboard_info"] == {self.dashboard_id: [self.dashboard_arn]}
+        qs_client.create_dashboard.assert_not_called()
+        qs_client.describe_dashboard.assert_called_once_with(
+            AwsAccountId=self.account, DashboardId=self.dashboard_id, VersionNumber=7
+        )
+        qs_client.update_dashboard_published_version.assert_called_once_with(
+            AwsAccountId=self.account, DashboardId=self.dashboard_id, VersionNumber=7
+        )
+
+    def test_new_dashboard_is_not_republished(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+
+        self.publish(qs_client)
+
+        qs_client.create_dashboard.assert_called_once()
+        qs_client.update_dashboard_published_version.assert_not_called()
+
+    def test_only_missing_permissions_are_granted(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        qs_client.describe_dashboard_permissions = MagicMock(
+            return_value={
+                "Permissions": [
+                    {
+                        "Principal": self.namespace_arn,
+                        "Actions": DASHBOARD_READER_ACTIONS,
+                    },
+                    {
+                        "Principal": self.group_arn,
+                        "Actions": ["quicksight:DescribeDashboard"],
+                    },
+                ]
+            }
+        )
+
+        self.publish(qs_client)
+
+        qs_client.update_dashboard_permissions.assert_called_once_with(
+            AwsAccountId=self.account,
+            DashboardId=self.dashboard_id,
+            GrantPermissions=[
+                {
+                    "Actions": [
+                        "quicksight:ListDashboardVersions",
+                        "quicksight:QueryDashboard",
+                    ],
+                    "Principal": self.group_arn,
+                }
+            ],
+        )
+
+    def test_granted_permissions_are_left_alone(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        qs_client.describe_dashboard_permissions = MagicMock(
+            return_value={
+                "Permissions": [
+                    {"Principal": principal, "Actions": DASHBOARD_READER_ACTIONS}
+                    for principal in [self.namespace_arn, self.group_arn]
+                ]
+            }
+        )
+
+        self.publish(qs_client)
+
+        qs_client.update_dashboard_permissions.assert_not_called()
+
+    def test_missing_data_sets_fail_before_publishing(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        qs_client.list_data_sets = MagicMock(
+            return_value={
+                "DataSetSummaries": [
+                    {"Arn": f"{DATA_SET_ARN_PREFIX}/my_env-patron_events"}
+                ]
+            }
+        )
+
+        with pytest.raises(DataSetNotFoundError) as excinfo:
+            self.publish(qs_client)
+
+        assert excinfo.value.placeholders == ["circulation_view"]
+        qs_client.update_dashboard.assert_not_called()
+        qs_client.create_dashboard.assert_not_called()
+
+
+class TestPublishDashboardPreflight:
+    account = "012345678910"
+    dashboard_id = "my_env-library"
+
+    def publish(self, qs_client, max_workers: int) -> dict:
+        return PublishDashboardFromTemplateOperation(
+            qs_client=qs_client,
+            s3_client=MagicMock(),
+            template_id=self.dashboard_id,
+            target_namespace="my_env",
+            aws_account_id=self.account,
+            group_name="my_group",
+            result_bucket="",
+            result_key="",
+            max_workers=max_workers,
+        ).execute()
+
+    def test_lookups_are_made_concurrently(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        # every lookup must be in flight at the same time to pass the barrier
+        barrier = threading.Barrier(4, timeout=5)
+
+        def wait_then_return(return_value):
+            def side_effect(**kwargs):
+                barrier.wait()
+                return return_value
+
+            return side_effect
+
+        for method in [
+            "describe_template",
+            "describe_namespace",
+            "list_data_sets",
+            "describe_group",
+        ]:
+            mock = getattr(qs_client, method)
+            mock.side_effect = wait_then_return(mock.return_value)
+
+        result = self.publish(qs_client, max_workers=4)
+
+        assert result["status"] == "success"
+
+    def test_bad_group_fails_before_the_dashboard_is_touched(self):
+        qs_client = create_mocked_qs_client(self.dashboard_id)
+        qs_client.describe_group = MagicMock(
+            side_effect=qs_client.exceptions.ResourceNotFoundException(
+                {"Error": {"Code": "ResourceNotFoundException"}}, "DescribeGroup"
+            )
+        )
+
+        with pytest.raises(ConcurrentTaskError) as excinfo:
+            self.publish(qs_client, max_workers=4)
+
+        assert list(excinfo.value.errors) == ["group"]
+        qs_client.update_dashboard.assert_not_called()
+        qs_client.create_dashboard.assert_not_called()
+
+
+class TestPublishDashboardsFromTemplatesOperation:
+    account = "012345678910"
+    template_ids = ["my_env-library", "my_env-circulation"]
+
+    def create_qs_client(self, statuses: Dict[str, List[str]], calls: List[str]) -> Any:
+        """
+        :param statuses: the version statuses each dashboard reports, poll by poll
+        :param calls: records the dashboard calls in the order they are made
+        """
+        qs_client = create_mocked_qs_client(self.template_ids[0])
+
+        def create_dashboard(**kwargs):
+            dashboard_id = kwargs["DashboardId"]
+            calls.append(f"create {dashboard_id}")
+            arn = f"arn:aws:quicksight:::dashboard/{dashboard_id}"
+            return {
+                "ResponseMetadata": {"HTTPStatusCode": 202},
+                "Arn": arn,
+                "VersionArn": f"{arn}/version/1",
+                "DashboardId": dashboard_id,
+            }
+
+        def describe_dashboard(**kwargs):
+            status = statuses[kwargs["DashboardId"]].pop(0)
+            return {"Dashboard": {"Version": {"Status": status}}}
+
+        def update_dashboard_permissions(**kwargs):
+            calls.append(f"grant {kwargs['DashboardId']}")
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        qs_client.create_dashboard = MagicMock(side_effect=create_dashboard)
+        qs_client.describe_dashboard = MagicMock(side_effect=describe_dashboard)
+        qs_client.update_dashboard_permissions = MagicMock(
+            side_effect=update_dashboard_permissions
+        )
+        return qs_client
+
+    def create_operation(self, qs_client) -> PublishDashboardsFromTemplatesOperation:
+        return PublishDashboardsFromTemplatesOperation(
+            qs_client=qs_client,
+            s3_client=MagicMock(),
+            template_ids=self.template_ids,
+            target_namespace="my_env",
+            aws_account_id=self.account,
+            group_name="my_group",
+            result_bucket="",
+            result_key="",
+        )
+
+    def test_dashboards_are_submitted_then_granted_as_each_is_built(self):
+        calls: List[str] = []
+        qs_client = self.create_qs_client(
+            statuses={
+                "my_env-library": ["CREATION_IN_PROGRESS", "CREATION_SUCCESSFUL"],
+                "my_env-circulation": [
+                    "CREATION_IN_PROGRESS",
+                    "CREATION_IN_PROGRESS",
+                    "CREATION_SUCCESSFUL",
+                ],
+            },
+            calls=calls,
+        )
+
+        with patch("core.waiter.time.sleep") as sleep_mock:
+            result = self.create_operation(qs_client).execute()
+
+        # a single polling loop waits on both dashboards
+        assert sleep_mock.call_count == 2
+        assert calls == [
+            "create my_env-library",
+            "create my_env-circulation",
+            "grant my_env-library",
+            "grant my_env-circulation",
+        ]
+        assert result["dashboard_info"] == {
+            template_id: [f"arn:aws:quicksight:::dashboard/{template_id}"]
+            for template_id in self.template_ids
+        }
+        assert list(result["timings"]) == ["my_env-library", "my_env-circulation"]
+
+    def test_failed_dashboards_do_not_stop_the_others(self):
+        calls: List[str] = []
+        qs_client = self.create_qs_client(
+            statuses={
+                "my_env-library": ["CREATION_FAILED"],
+                "my_env-circulation": ["CREATION_IN_PROGRESS", "CREATION_SUCCESSFUL"],
+            },
+            calls=calls,
+        )
+
+        with patch("core.waiter.time.sleep"):
+            with pytest.raises(ConcurrentTaskError) as excinfo:
+                self.create_operation(qs_client).execute()
+
+        assert list(excinfo.value.errors) == ["dashboard my_env-library"]
+        assert isinstance(
+            excinfo.value.errors["dashboard my_env-library"], ResourceFailedError
+        )
+        assert "grant my_env-circulation" in calls
+        assert "grant my_env-library" not in calls
+
+    def test_failed_grants_do_not_stop_the_others(self):
+        calls: List[str] = []
+        qs_client = self.create_qs_client(
+            statuses={
+                "my_env-library": ["CREATION_SUCCESSFUL"],
+                "my_env-circulation": ["CREATION_IN_PROGRESS", "CREATION_SUCCESSFUL"],
+            },
+            calls=calls,
+        )
+        access_denied = botocore.exceptions.ClientError(
+            {"Error": {"Code": "AccessDeniedException"}}, "UpdateDashboardPermissions"
+        )
+
+        def update_dashboard_permissions(**kwargs):
+            calls.append(f"grant {kwargs['DashboardId']}")
+            if kwargs["DashboardId"] == "my_env-library":
+                raise access_denied
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        qs_client.update_dashboard_permissions = MagicMock(
+            side_effect=update_dashboard_permissions
+        )
+
+        with patch("core.waiter.time.sleep"):
+            with pytest.raises(ConcurrentTaskError) as excinfo:
+                self.create_operation(qs_client).execute()
+
+        assert excinfo.value.errors == {"dashboard my_env-library": access_denied}
+        assert calls[-1] == "grant my_env-circulation"
+
+    def test_missing_data_sets_fail_before_any_dashboard_is_touched(self):
+        calls: List[str] = []
+        qs_client = self.create_qs_client(statuses={}, calls=calls)
+
+        def describe_template(**kwargs):
+            placeholders = ["circulation_view"]
+            if kwargs["TemplateId"] == "my_env-circulation":
+                placeholders.append("missing_view")
+            return {
+                "Template": {
+                    "Arn": f"arn:aws:quicksight:::template/{kwargs['TemplateId']}",
+                    "Version": {
+                        "DataSetConfigurations": [
+                            {"Placeholder": placeholder} for placeholder in placeholders
+                        ]
+                    },
+                }
+            }
+
+        qs_client.describe_template = MagicMock(side_effect=describe_template)
+
+        with pytest.raises(DataSetNotFoundError) as excinfo:
+            self.create_operation(qs_client).execute()
+
+        assert excinfo.value.placeholders == ["missing_view"]
+        qs_client.update_dashboard.assert_not_called()
+        assert calls == []
@@ -0,0 +1,190 @@
+import datetime
+import json
+import os
+import tempfile
+from typing import Any
+from unittest.mock import MagicMock
+
+from core.operation.baseoperation import EXPORT_MANIFEST_FILE
+from core.operation.sync_account_operation import (
+    SYNC_MANIFEST_FILE,
+    SyncAccountOperation,
+)
+from tests.core.operation.analysis_test_responses import (
+    describe_data_set_1_response,
+    describe_data_set_2_response,
+)
+from tests.core.operation.test_export_analysis_operation import create_mocked_qs_client
+
+DATA_SET_1_ID = "e9e15c78-0193-4e4c-9a49-ed005569297d"
+DATA_SET_2_ID = "86eb4ca5-9552-4ba6-8b1b-7ef1b9b40f78"
+LAST_WEEK = datetime.datetime(2023, 9, 1, tzinfo=datetime.timezone.utc)
+YESTERDAY = datetime.datetime(2023, 9, 7, tzinfo=datetime.timezone.utc)
+
+
+class TestSyncAccountOperation:
+    account = "012345678910"
+
+    def create_qs_client(
+        self,
+        analyses: dict,
+        data_sets: dict,
+    ) -> Any:
+        """
+        :param analyses: the LastUpdatedTime of each analysis in the account
+        :param data_sets: the LastUpdatedTime of each data set in the account
+        """
+        qs_client = create_mocked_qs_client()
+        data_set_responses = {
+            DATA_SET_1_ID: describe_data_set_1_response,
+            DATA_SET_2_ID: describe_data_set_2_response,
+        }
+        qs_client.describe_data_set = MagicMock(
+            side_effect=lambda **kwargs: data_set_responses[kwargs["DataSetId"]]()
+        )
+        qs_client.list_analyses = MagicMock(
+            return_value={
+                "AnalysisSummaryList": [
+                    {"AnalysisId": analysis_id, "LastUpdatedTime": last_updated}
+                    for analysis_id, last_updated in analyses.items()
+                ]
+            }
+        )
+        qs_client.list_data_sets = MagicMock(
+            return_value={
+                "DataSetSummaries": [
+                    {"DataSetId": data_set_id, "LastUpdatedTime": last_updated}
+                    for data_set_id, last_updated in data_sets.items()
+                ]
+            }
+        )
+        return qs_client
+
+    def sync(self, qs_client, output_dir: str) -> dict:
+        return SyncAccountOperation(
+            qs_client=qs_client,
+            aws_account_id=self.account,
+            output_dir=output_dir,
+            max_workers=2,
+            max_pending=2,
+            definition_only=True,
+        ).execute()
+
+    def test_first_sync_exports_everything_once(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        qs_client = self.create_qs_client(
+            analyses={"library": LAST_WEEK},
+            data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: LAST_WEEK},
+        )
+
+        result = self.sync(qs_client, output_dir)
+
+        assert result["analyses"]["exported"] == ["library"]
+        # the data sets were exported along with the analysis
+        assert result["data_sets"] == {"exported": [], "unchanged": 2}
+        assert qs_client.describe_data_set.call_count == 2
+
+        with open(os.path.join(output_dir, SYNC_MANIFEST_FILE)) as file:
+            manifest = json.loads(file.read())
+        assert manifest["analyses"]["library"] == {
+            "last_updated": LAST_WEEK.isoformat(),
+            "data_sets": {
+                DATA_SET_1_ID: "circulation_view",
+                DATA_SET_2_ID: "patron_events",
+            },
+        }
+        assert manifest["data_sets"] == {
+            DATA_SET_1_ID: LAST_WEEK.isoformat(),
+            DATA_SET_2_ID: LAST_WEEK.isoformat(),
+        }
+
+    def test_only_changed_resources_are_exported_again(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        self.sync(
+            self.create_qs_client(
+                analyses={"library": LAST_WEEK},
+                data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: LAST_WEEK},
+            ),
+            output_dir,
+        )
+
+        qs_client = self.create_qs_client(
+            analyses={"library": LAST_WEEK},
+            data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: YESTERDAY},
+        )
+        result = self.sync(qs_client, output_dir)
+
+        assert result["analyses"] == {"exported": [], "unchanged": 1, "removed": []}
+        assert result["data_sets"] == {"exported": [DATA_SET_2_ID], "unchanged": 1}
+        qs_client.describe_analysis.assert_not_called()
+        qs_client.describe_data_set.assert_called_once_with(
+            AwsAccountId=self.account, DataSetId=DATA_SET_2_ID
+        )
+
+    def test_removed_analyses_are_reported(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        self.sync(
+            self.create_qs_client(
+                analyses={"library": LAST_WEEK},
+                data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: LAST_WEEK},
+            ),
+            output_dir,
+        )
+
+        result = self.sync(
+            self.create_qs_client(analyses={}, data_sets={}),
+            output_dir,
+        )
+
+        assert result["analyses"]["removed"] == ["library"]
+        with open(os.path.join(output_dir, EXPORT_MANIFEST_FILE)) as file:
+            export_manifest = json.loads(file.read())
+        assert export_manifest["analyses"] == {}
+        assert export_manifest["files"] == {}
+        remaining = [
+            os.path.relpath(os.path.join(directory, file), output_dir)
+            for directory, _, files in os.walk(output_dir)
+            for file in files
+        ]
+        assert sorted(remaining) == sorted([EXPORT_MANIFEST_FILE, SYNC_MANIFEST_FILE])
+
+    def test_shared_data_sets_are_exported_under_every_name(self):
+        output_dir = tempfile.NamedTemporaryFile().name
+        self.sync(
+            self.create_qs_client(
+                analyses={"library": LAST_WEEK},
+                data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: LAST_WEEK},
+            ),
+            output_dir,
+        )
+        # another, unchanged, analysis gives the second data set a name of its own
+        manifest_file = os.path.join(output_dir, SYNC_MANIFEST_FILE)
+        with open(manifest_file) as file:
+            manifest = json.loads(file.read())
+        manifest["analyses"]["circulation"] = {
+            "last_updated": LAST_WEEK.isoformat(),
+            "data_sets": {DATA_SET_2_ID: "events"},
+        }
+        with open(manifest_file, "w") as file:
+            file.write(json.dumps(manifest))
+
+        qs_client = self.create_qs_client(
+            analyses={"library": LAST_WEEK, "circulation": LAST_WEEK},
+            data_sets={DATA_SET_1_ID: LAST_WEEK, DATA_SET_2_ID: YESTERDAY},
+        )
+        updated = describe_data_set_2_response()
+        updated["DataSet"]["ImportMode"] = "SPICE"
+        qs_client.describe_data_set = MagicMock(return_value=updated)
+        result = self.sync(qs_client, output_dir)
+
+        assert result["data_sets"] == {"exported": [DATA_SET_2_ID], "unchanged": 1}
+        # the data set is described once, however many names it is written under
+        qs_client.describe_data_set.assert_called_once_with(
+            AwsAccountId=self.account, DataSetId=DATA_SET_2_ID
+        )
+        data_sets_dir = os.path.join(output_dir, "assets", "data-sets")
+        for name in ["patron_events", "events"]:
+            with open(os.path.join(data_sets_dir, name + ".json")) as file:
+                data_set = json.loads(file.read())
+            assert data_set["Name"] == name
+            assert data_set["ImportMode"] == "SPICE"
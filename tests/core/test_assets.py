@@ -0,0 +1,81 @@
+import io
+import json
+from typing import List
+
+import pytest
+
+from core.assets import DirectoryAssetReader, scan_json_value
+from core.serialization import load_json_file
+
+
+class TestScanJsonValue:
+    PATH = ["Definition", "DataSetConfigurations"]
+
+    def scan(self, document: dict, path: List[str], chunk_size: int) -> object:
+        stream = io.BytesIO(json.dumps(document, indent=4).encode("utf-8"))
+        return scan_json_value(stream, path, chunk_size=chunk_size)
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+    def test_value_is_read_across_chunks(self, chunk_size: int):
+        configurations = [{"Placeholder": "circulation_view", "Name": "café ☕"}]
+        document = {
+            "Definition": {
+                "Description": 'a "DataSetConfigurations": [] lookalike',
+                "Sheets": [{"DataSetConfigurations": [{"Placeholder": "nested"}]}],
+                "DataSetConfigurations": configurations,
+            },
+        }
+
+        assert self.scan(document, self.PATH, chunk_size) == configurations
+
+    @pytest.mark.parametrize("chunk_size", [1, 4096])
+    def test_only_the_value_at_the_path_matches(self, chunk_size: int):
+        document = {
+            "DataSetConfigurations": [{"Placeholder": "top level"}],
+            "Definition": {
+                "Sheets": [{"Definition": {"DataSetConfigurations": ["nested"]}}],
+                'Data\\Set"Configurations': ["escaped"],
+            },
+        }
+
+        with pytest.raises(KeyError):
+            self.scan(document, self.PATH, chunk_size)
+        assert self.scan(document, ["DataSetConfigurations"], chunk_size) == [
+            {"Placeholder": "top level"}
+        ]
+        assert self.scan(
+            document, ["Definition", 'Data\\Set"Configurations'], chunk_size
+        ) == ["escaped"]
+
+    def test_only_the_value_is_read(self):
+        stream = io.BytesIO(
+            b'{"Definition": {"DataSetConfigurations": [{"Placeholder": "a"}], '
+            b'"Sheets": [' + b"x" * 10_000
+        )
+
+        # the rest of the document is truncated, but never read
+        assert scan_json_value(stream, self.PATH, chunk_size=64) == [
+            {"Placeholder": "a"}
+        ]
+        assert stream.tell() < 1_000
+
+    def test_scalar_values_are_rejected(self):
+        template = load_json_file(
+            "tests/core/operation/resources/assets/templates/library.json"
+        )
+        with pytest.raises(ValueError):
+            self.scan(template, ["Name"], 1)
+
+    def test_missing_key_raises(self):
+        with pytest.raises(KeyError):
+            self.scan({"Definition": {}}, self.PATH, 16)
+
+
+class TestDirectoryAssetReader:
+    def test_data_set_configurations_match_the_template(self):
+        reader = DirectoryAssetReader("tests/core/operation/resources")
+
+        template = reader.read_template("library")
+        assert reader.read_data_set_configurations("library") == (
+            template["Definition"]["DataSetConfigurations"]
+        )
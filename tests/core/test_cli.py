@@ -1,6 +1,10 @@
+from typing import List
+from unittest.mock import patch
+
+import pytest
 from click.testing import CliRunner
 
-from core.cli import export_analysis
+from core.cli import export_analysis, import_template
 
 
 class TestCli:
@@ -9,3 +13,51 @@ class TestCli:
         result = runner.invoke(export_analysis, ["--help"])
         assert result.exit_code == 0
         assert "Exports a template" in result.output
+
+    @pytest.mark.parametrize(
+        "args, error",
+        [
+            ([], "At least one target namespace is required"),
+            (
+                ["--target-namespace", "tpp-dev"],
+                "target_namespace and data_source_arn must be given together",
+            ),
+            (
+                ["--data-source-arn", "arn"],
+                "target_namespace and data_source_arn must be given together",
+            ),
+            (
+                [
+                    "--target-namespace",
+                    "tpp-dev",
+                    "--data-source-arn",
+                    "arn",
+                    "--target",
+                    "tpp-dev",
+                    "other-arn",
+                ],
+                "Namespaces targeted more than once: tpp-dev",
+            ),
+            (
+                ["--target", "tpp-dev", "arn", "--target", "tpp-dev", "arn"],
+                "Namespaces targeted more than once: tpp-dev",
+            ),
+        ],
+    )
+    def test_import_template_targets_are_validated(self, args: List[str], error: str):
+        runner = CliRunner()
+        with patch("core.cli.create_quicksight_client"):
+            result = runner.invoke(
+                import_template,
+                [
+                    "--aws-account-id",
+                    "012345678910",
+                    "--template-name",
+                    "library",
+                    "--input-dir",
+                    "tests/core/operation/resources",
+                ]
+                + args,
+            )
+        assert result.exit_code == 2
+        assert error in result.output
@@ -0,0 +1,92 @@
+import pytest
+
+from core.rewrite import KeyRewrite, rewrite_keys
+
+
+def create_data_set() -> dict:
+    return {
+        "Name": "circulation_view",
+        "PhysicalTableMap": {
+            "a": {"CustomSql": {"DataSourceArn": "", "Name": "circulation_view"}},
+            "b": {"RelationalTable": {"DataSourceArn": "", "Schema": "public"}},
+        },
+        "LogicalTableMap": {
+            "c": {
+                "DataTransforms": [
+                    {"ProjectOperation": {"DataSourceArn": ""}},
+                    [{"DataSourceArn": ""}],
+                ]
+            }
+        },
+    }
+
+
+class TestKeyRewrite:
+    def test_values_in_lists_are_rewritten(self):
+        data_set = rewrite_keys(create_data_set(), {"DataSourceArn": "arn"})
+
+        assert data_set["PhysicalTableMap"]["a"]["CustomSql"]["DataSourceArn"] == "arn"
+        transforms = data_set["LogicalTableMap"]["c"]["DataTransforms"]
+        assert transforms[0]["ProjectOperation"]["DataSourceArn"] == "arn"
+        assert transforms[1][0]["DataSourceArn"] == "arn"
+
+    def test_several_keys_are_rewritten_in_one_walk(self):
+        data_set = rewrite_keys(
+            create_data_set(), {"DataSourceArn": "arn", "Name": "renamed"}
+        )
+
+        assert data_set["Name"] == "renamed"
+        assert data_set["PhysicalTableMap"]["a"]["CustomSql"] == {
+            "DataSourceArn": "arn",
+            "Name": "renamed",
+        }
+
+    def test_paths_are_reused_for_every_copy(self):
+        data_set = create_data_set()
+        rewrite = KeyRewrite(data_set, ["DataSourceArn"])
+        assert len(rewrite.paths["DataSourceArn"]) == 4
+        assert ("LogicalTableMap", "c", "DataTransforms", 1, 0, "DataSourceArn") in (
+            rewrite.paths["DataSourceArn"]
+        )
+
+        copies = {
+            namespace: rewrite.apply({"DataSourceArn": f"{namespace}-arn"})
+            for namespace in ["dev", "prod"]
+        }
+
+        assert "dev-arn" in str(copies["dev"]) and "prod-arn" not in str(copies["dev"])
+        assert "prod-arn" in str(copies["prod"]) and "dev-arn" not in str(
+            copies["prod"]
+        )
+        # the document the paths were found in is left alone
+        assert data_set == create_data_set()
+
+    def test_only_the_objects_along_the_paths_are_copied(self):
+        data_set = create_data_set()
+        data_set["RowLevelPermissionDataSet"] = {"Namespace": "default"}
+
+        rewritten = KeyRewrite(data_set, ["DataSourceArn"]).apply(
+            {"DataSourceArn": "arn"}
+        )
+
+        assert rewritten is not data_set
+        assert rewritten["RowLevelPermissionDataSet"] is (
+            data_set["RowLevelPermissionDataSet"]
+        )
+        assert rewritten["PhysicalTableMap"] is not data_set["PhysicalTableMap"]
+        # the paths through the data transforms share their prefix, and its copy
+        transforms = rewritten["LogicalTableMap"]["c"]["DataTransforms"]
+        assert transforms is not data_set["LogicalTableMap"]["c"]["DataTransforms"]
+        assert transforms[0]["ProjectOperation"]["DataSourceArn"] == "arn"
+        assert transforms[1][0]["DataSourceArn"] == "arn"
+
+    def test_replaced_values_are_not_searched(self):
+        document = {"DataSourceArn": {"DataSourceArn": "inner"}}
+
+        assert rewrite_keys(document, {"DataSourceArn": ""}) == {"DataSourceArn": ""}
+
+    def test_unknown_keys_are_rejected(self):
+        rewrite = KeyRewrite(create_data_set(), ["DataSourceArn"])
+
+        with pytest.raises(ValueError):
+            rewrite.apply({"Name": "renamed"})
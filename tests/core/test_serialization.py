@@ -0,0 +1,189 @@
+import datetime
+import hashlib
+import io
+import math
+import uuid
+from typing import Dict, Tuple
+
+import pytest
+
+from core.serialization import (
+    COMPACT,
+    GZIP,
+    GZIP_MAGIC,
+    JSON_FORMATS,
+    ORJSON,
+    PRETTY,
+    STDLIB,
+    _dumps_compact,
+    _orjson_dumps_compact,
+    dump_json,
+    dumps,
+    get_available_backends,
+    get_backend,
+    load_json,
+    load_json_file,
+    loads,
+    open_decompressed,
+    set_backend,
+    to_canonical_json,
+)
+
+DATA = {
+    "Name": "circulation_view",
+    "CreatedTime": datetime.datetime(2023, 9, 1, 10, 6, 19),
+    "Columns": [{"Type": "STRING", "Name": "id"}],
+}
+
+
+@pytest.fixture(params=get_available_backends(), autouse=True)
+def backend(request):
+    previous = get_backend()
+    set_backend(request.param)
+    yield request.param
+    set_backend(previous)
+
+
+class TestDumpJson:
+    def dump(self, json_format: str) -> bytes:
+        stream = io.BytesIO()
+        dump_json(DATA, stream, json_format)
+        return stream.getvalue()
+
+    @pytest.mark.parametrize("json_format", JSON_FORMATS)
+    def test_round_trip(self, json_format: str):
+        loaded = load_json(io.BufferedReader(io.BytesIO(self.dump(json_format))))
+
+        # datetimes are written as strings, as they have always been
+        assert loaded == {**DATA, "CreatedTime": "2023-09-01 10:06:19"}
+
+    def test_pretty_matches_canonical_json(self):
+        assert self.dump(PRETTY).decode("utf-8") == to_canonical_json(DATA)
+
+    def test_compact_and_gzip_are_smaller(self):
+        pretty = self.dump(PRETTY)
+        compact = self.dump(COMPACT)
+        assert len(compact) < len(pretty)
+        assert b"\n" not in compact and b'": ' not in compact
+        assert self.dump(GZIP).startswith(GZIP_MAGIC)
+
+    def test_gzip_output_is_reproducible(self):
+        assert self.dump(GZIP) == self.dump(GZIP)
+
+    def test_the_stream_is_left_open(self):
+        stream = io.BytesIO()
+        dump_json(DATA, stream, GZIP)
+        assert not stream.closed
+
+    def test_unknown_format_is_rejected(self):
+        with pytest.raises(ValueError):
+            dump_json(DATA, io.BytesIO(), "yaml")
+
+
+class TestContentHash:
+    def dump(self, json_format: str) -> Tuple[str, bytes]:
+        stream = io.BytesIO()
+        content_hash = dump_json(DATA, stream, json_format)
+        return content_hash, stream.getvalue()
+
+    def test_pretty_hash_is_the_hash_of_the_text(self):
+        assert (
+            self.dump(PRETTY)[0]
+            == hashlib.sha256(to_canonical_json(DATA).encode("utf-8")).hexdigest()
+        )
+
+    def test_formats_have_different_hashes(self):
+        assert len({self.dump(json_format)[0] for json_format in JSON_FORMATS}) == 3
+
+    @pytest.mark.parametrize("json_format", JSON_FORMATS)
+    def test_dump_json_returns_the_hash_of_what_it_wrote(self, json_format: str):
+        content_hash, written = self.dump(json_format)
+
+        content = open_decompressed(io.BufferedReader(io.BytesIO(written)))
+        prefix = b"" if json_format == PRETTY else json_format.encode("utf-8") + b"\n"
+        assert content_hash == hashlib.sha256(prefix + content.read()).hexdigest()
+
+
+class TestBackends:
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "id",
+            "ÿ",
+            "\x7f",
+            "\U0001f600",
+            None,
+            0.0001,
+            1e-5,
+            -1.2e-5,
+            1e16,
+            1.5e300,
+            5e-324,
+            -0.0,
+            math.nan,
+            math.inf,
+            2**63,
+            2**70,
+        ],
+    )
+    def test_backends_write_the_same_json(self, value):
+        data = {**DATA, "Columns": [{"Type": "STRING", "Name": value}]}
+        written: Dict[str, Dict[str, bytes]] = {}
+        for backend in get_available_backends():
+            set_backend(backend)
+            written[backend] = {}
+            for json_format in JSON_FORMATS:
+                stream = io.BytesIO()
+                dump_json(data, stream, json_format)
+                written[backend][json_format] = stream.getvalue()
+
+        assert len({str(content) for content in written.values()}) == 1
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "tests/core/operation/resources/assets/templates/library.json",
+            "tests/core/operation/resources/assets/data-sets/circulation_view.json",
+        ],
+    )
+    def test_orjson_writes_typical_asset_documents(self, path: str):
+        if ORJSON not in get_available_backends():
+            pytest.skip("orjson is not installed")
+        set_backend(ORJSON)
+        # Quicksight ids are UUIDs, which are full of digits followed by an "e"
+        data = {
+            **load_json_file(path),
+            "VisualIds": [str(uuid.UUID(int=n, version=4)) for n in range(100)],
+            "Layout": {"Width": 0.5, "RowSpan": 12},
+        }
+
+        content = _orjson_dumps_compact(data)
+        assert content is not None
+        set_backend(STDLIB)
+        assert content == _dumps_compact(data)
+
+    def test_datetimes_are_written_as_strings(self):
+        assert dumps({"CreatedTime": DATA["CreatedTime"]}) == (
+            '{"CreatedTime":"2023-09-01 10:06:19"}'
+        )
+        aware = datetime.datetime(2023, 9, 1, 10, 6, 19, tzinfo=datetime.timezone.utc)
+        assert loads(dumps({"CreatedTime": aware})) == {
+            "CreatedTime": "2023-09-01 10:06:19+00:00"
+        }
+
+    def test_documents_the_backend_rejects_are_parsed_by_the_json_module(self):
+        assert math.isnan(loads(b'{"Size": NaN}')["Size"])
+        assert dumps({"Size": 2**70}) == '{"Size":1180591620717411303424}'
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError):
+            loads(b'{"Name": ')
+
+    def test_unknown_backend_is_rejected(self):
+        with pytest.raises(ValueError):
+            set_backend("simplejson")
+
+    def test_orjson_is_preferred(self):
+        if ORJSON not in get_available_backends():
+            pytest.skip("orjson is not installed")
+        assert get_available_backends() == [STDLIB, ORJSON]
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from core.util import (
+    AtomicFile,
+    ConcurrentTaskError,
+    Memoizer,
+    run_bounded,
+    run_concurrently,
+    write_file_atomically,
+)
+
+
+class TestRunConcurrently:
+    def test_results_keep_task_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def task(value):
+            # all three tasks must be running at the same time to pass the barrier
+            barrier.wait()
+            return value
+
+        results = run_concurrently(
+            {label: partial(task, label) for label in ["c", "a", "b"]},
+            max_workers=3,
+        )
+
+        assert list(results.items()) == [("c", "c"), ("a", "a"), ("b", "b")]
+
+    def test_failures_are_aggregated(self):
+        def fail(message):
+            raise ValueError(message)
+
+        with pytest.raises(ConcurrentTaskError) as excinfo:
+            run_concurrently(
+                {
+                    "first": lambda: fail("boom"),
+                    "second": lambda: "ok",
+                    "third": lambda: fail("bang"),
+                },
+                max_workers=2,
+            )
+
+        assert list(excinfo.value.errors) == ["first", "third"]
+        assert "boom" in str(excinfo.value)
+        assert "bang" in str(excinfo.value)
+
+    def test_fail_fast_cancels_tasks_not_yet_started(self):
+        started = []
+
+        def task(label):
+            started.append(label)
+            if label == "first":
+                raise ValueError("boom")
+            return label
+
+        with pytest.raises(ConcurrentTaskError) as excinfo:
+            run_concurrently(
+                {label: partial(task, label) for label in ["first", "second", "third"]},
+                max_workers=1,
+                fail_fast=True,
+            )
+
+        assert list(excinfo.value.errors) == ["first"]
+        assert started == ["first"]
+
+
+class TestMemoizer:
+    def test_concurrent_callers_share_one_computation(self):
+        memoizer: Memoizer[int] = Memoizer()
+        computing = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            computing.set()
+            # hold the computation until the second caller is waiting on it
+            assert release.wait(timeout=5)
+            return 42
+
+        results = []
+        first = threading.Thread(
+            target=lambda: results.append(memoizer.get("key", compute))
+        )
+        first.start()
+        assert computing.wait(timeout=5)
+        second = threading.Thread(
+            target=lambda: results.append(memoizer.get("key", compute))
+        )
+        second.start()
+        release.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+        assert results == [42, 42]
+        assert len(calls) == 1
+
+    def test_failures_are_cached(self):
+        memoizer: Memoizer[int] = Memoizer()
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise ValueError("not found")
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                memoizer.get("key", fail)
+
+        assert len(calls) == 1
+
+
+class TestWriteFileAtomically:
+    def test_file_is_replaced_without_leftovers(self, tmp_path):
+        path = os.path.join(tmp_path, "file.json")
+        write_file_atomically(path, "old")
+        write_file_atomically(path, "new")
+
+        with open(path) as file:
+            assert file.read() == "new"
+        assert os.listdir(tmp_path) == ["file.json"]
+
+    def test_discarded_files_leave_the_file_alone(self, tmp_path):
+        path = os.path.join(tmp_path, "file.json")
+        write_file_atomically(path, "old")
+
+        with AtomicFile(path) as atomic_file:
+            atomic_file.file.write(b"new")
+            atomic_file.discard()
+
+        with open(path) as file:
+            assert file.read() == "old"
+        assert os.listdir(tmp_path) == ["file.json"]
+
+    def test_failed_writes_leave_the_file_alone(self, tmp_path):
+        path = os.path.join(tmp_path, "file.json")
+        write_file_atomically(path, "old")
+
+        with pytest.raises(ValueError):
+            with AtomicFile(path) as atomic_file:
+                atomic_file.file.write(b"new")
+                raise ValueError("serialization failed")
+
+        with open(path) as file:
+            assert file.read() == "old"
+        assert os.listdir(tmp_path) == ["file.json"]
+
+
+class TestRunBounded:
+    def test_tasks_are_consumed_lazily(self):
+        running = threading.Semaphore(0)
+        release = threading.Event()
+        produced = []
+
+        def task():
+            running.release()
+            assert release.wait(timeout=5)
+
+        def tasks():
+            for index in range(4):
+                produced.append(index)
+                yield str(index), task
+            release.set()
+
+        def check_backpressure():
+            # with two tasks pending, the third is only produced once one finishes
+            for _ in range(2):
+                assert running.acquire(timeout=5)
+            # give an unbounded producer the chance to run ahead
+            time.sleep(0.05)
+            assert len(produced) <= 3
+            release.set()
+
+        checker = threading.Thread(target=check_backpressure)
+        checker.start()
+        results = run_bounded(tasks(), max_workers=2, max_pending=2)
+        checker.join(timeout=5)
+
+        assert sorted(results) == ["0", "1", "2", "3"]
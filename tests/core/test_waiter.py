@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.waiter import (
+    ResourceFailedError,
+    WaiterConfig,
+    WaiterTimeoutError,
+    resource_deleted,
+    status_successful,
+    wait_until,
+)
+
+
+class NotFound(Exception):
+    pass
+
+
+class TestWaitUntil:
+    def test_condition_met_immediately_does_not_sleep(self):
+        with patch("core.waiter.time.sleep") as sleep_mock:
+            polls = wait_until(lambda: True, "ready")
+
+        assert polls == 1
+        sleep_mock.assert_not_called()
+
+    def test_delay_backs_off_up_to_max_delay(self):
+        condition = MagicMock(side_effect=[False, False, False, False, True])
+        config = WaiterConfig(initial_delay=1, max_delay=3, backoff=2, jitter=0)
+
+        with patch("core.waiter.time.sleep") as sleep_mock:
+            polls = wait_until(condition, "backing off", config=config)
+
+        assert polls == 5
+        assert [c.args[0] for c in sleep_mock.call_args_list] == [1, 2, 3, 3]
+
+    def test_jitter_only_shortens_the_delay(self):
+        condition = MagicMock(side_effect=[False, True])
+        config = WaiterConfig(initial_delay=2, jitter=0.5)
+
+        with patch("core.waiter.time.sleep") as sleep_mock, patch(
+            "core.waiter.random.random", return_value=1.0
+        ):
+            wait_until(condition, "jittered", config=config)
+
+        sleep_mock.assert_called_once_with(1.0)
+
+    def test_timeout(self):
+        config = WaiterConfig(initial_delay=0.01, timeout=0.05)
+
+        with pytest.raises(WaiterTimeoutError) as excinfo:
+            wait_until(lambda: False, "never ready", config=config)
+
+        assert "never ready" in str(excinfo.value)
+
+
+class TestConditions:
+    def test_resource_deleted(self):
+        describe = MagicMock(side_effect=[{"Template": {}}, NotFound()])
+        condition = resource_deleted(describe, not_found=NotFound)
+
+        assert condition() is False
+        assert condition() is True
+
+    def test_status_successful(self):
+        get_status = MagicMock(
+            side_effect=["CREATION_IN_PROGRESS", "UPDATE_SUCCESSFUL", "CREATION_FAILED"]
+        )
+        condition = status_successful(get_status, "Dashboard (my-dashboard)")
+
+        assert condition() is False
+        assert condition() is True
+        with pytest.raises(ResourceFailedError) as excinfo:
+            condition()
+        assert "Dashboard (my-dashboard) failed" in str(excinfo.value)